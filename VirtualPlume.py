@@ -6,6 +6,7 @@ import matplotlib.pyplot as plt
 import matplotlib.ticker as ticker
 from matplotlib.colors import LinearSegmentedColormap
 from matplotlib.patches import Rectangle
+from projection import difference_in_meters, meters_to_longitude
 
 class dotdict(dict):
     """dot.notation access to dictionary attributes"""
@@ -19,11 +20,8 @@ VIRTUAL_SOURCE = dotdict({
 })
 
 def differenceInMeters(one, two):
-    earthCircumference = 40008000
-    return [
-        ((one.longitude - two.longitude) * (earthCircumference / 360) * math.cos(one.latitude * 0.01745)),
-        ((one.latitude - two.latitude) * (earthCircumference / 360))
-    ]
+    east, north = difference_in_meters(one.latitude, one.longitude, two.latitude, two.longitude)
+    return [float(east), float(north)]
 
 def calculateCO2(position):
 
@@ -59,8 +57,7 @@ def addRuler(plt, ax, length):
 
 
     # Calculate width by latitide
-    earthCircumference = 40008000
-    width = abs(1.0 * length / ((earthCircumference / 360) * math.cos(lowerleft[1] * 0.01745)))
+    width = abs(float(meters_to_longitude(length, lowerleft[1])))
     height = (upperright[1] - lowerleft[1]) * 0.018
 
     ax.add_patch(Rectangle(location, width, height, ec=(0,0,0,1), fc=(1,1,1,1)))
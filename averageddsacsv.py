@@ -1,10 +1,10 @@
 #!/usr/bin/env python
 
 import argparse, math
-from enum import Enum
 from mpl_toolkits import mplot3d
 import numpy as np
 import matplotlib.pyplot as plt
+from ddsapath import ddsa_waypoints
 
 class Reading:
     def __init__(self, value, lat, lon, alt):
@@ -117,74 +117,17 @@ def writeKml(readings, output):
         buildPoints(readings, outputFile)
         outputFile.write(buildKmlFooter())
 
-class Span(Enum):
-    WALK = 1
-    RANGE = 2
-
-class Point:
-    def __init__(self, x, y, z):
-        self.x = x
-        self.y = y
-        self.z = z
-
-def calculateRange(type, start, end, length):
-    # print "TYPE: {} {} {}".format(type, Span.WALK, Span.RANGE)
-    if type == Span.WALK:
-        waypoints = []
-        # print "Calculating walk"
-        deltax = end.x - start.x
-        deltay = end.y - start.y
-        deltaz = end.z - start.z
-        distance = math.sqrt((deltax * deltax) + (deltay * deltay) + (deltaz * deltaz))
-        for i in range(1, int(distance / length) + 1):
-            waypoints.append(Point(start.x + (i * length * deltax / distance),
-                                   start.y + (i * length * deltay / distance),
-                                   start.z + (i * length * deltaz / distance)))
-        return waypoints
-    elif type == Span.RANGE:
-        return [end]
-
-def buildDDSAWaypoints(rangeType, altitude, size, index, loops, radius, steplength):
-
-    waypoints = []
-    start = Point(0, 0, altitude)
-    waypoints.append(start)
-    previous = start
-    for loop in range(0, loops):
-        for corner in range(0, 4):
-
-            if (loop == 0 and corner == 0):
-                next = Point(0, index + 1, altitude)
-            else:
-                xoffset = 1 + index + (loop * size)
-                yoffset = xoffset
-                if (corner == 0):
-                    xoffset = -(1 + index + ((loop - 1) * size))
-                elif (corner == 3):
-                    xoffset = -xoffset
-                if (corner == 2 or corner == 3):
-                    yoffset = -yoffset
-
-                next = Point(xoffset, yoffset, altitude)
-
-            # print "{}, {} -> {}, {}".format(previous.x, previous.y, next.x, next.y)
-
-            for waypoint in calculateRange(rangeType, previous, next, steplength):
-                waypoints.append(Point(waypoint.x * radius, waypoint.y * radius, waypoint.z))
-
-            previous = next
-
-    return waypoints
-
-def lookupIndex(ddsa, x, y):
-    for i in range(0, len(ddsa)):
-        if ddsa[i].x == x and ddsa[i].y == y:
-            return i
-
-    return -1
+def ddsaLoops(count):
+    """Fewest loops of the unit DDSA walk, which visits 4 * loops^2 + 2 * loops + 1 positions, covering count readings."""
+    loops = max(1, int(math.ceil((math.sqrt(max(16 * count - 12, 0)) - 2) / 8.0)))
+    while 4 * loops * loops + 2 * loops + 1 < count:
+        loops = loops + 1
+    return loops
 
 def buildCSV(input, output, image, kmlfile):
-    reading = []
+    values = []
+    groups = []
+    group = 0
     center = None
 
     with open(input, 'r') as inputFile:
@@ -192,8 +135,6 @@ def buildCSV(input, output, image, kmlfile):
         zeroing = False
 
         index = None
-        readingsum = 0
-        readingcount = 0
 
         while line:
             line = inputFile.readline()
@@ -206,52 +147,46 @@ def buildCSV(input, output, image, kmlfile):
 
             if not zeroing:
                 if len(lineparts) == 8:
+                    # Readings before the first waypoint count towards it
                     if not index == None:
-                        reading.append(readingsum / readingcount)
-                        readingsum = 0
-                        readingcount = 0
+                        group = group + 1
                     index = int(lineparts[4][0:len(lineparts[4])-1])
                 elif len(lineparts) == 19 and lineparts[4] == '"M':
-                    # print "reading: {}".format(lineparts[7])
-                    readingsum = readingsum + float(lineparts[7])
-                    readingcount = readingcount + 1
+                    values.append(float(lineparts[7]))
+                    groups.append(group)
 
                     if center == None:
                         center = (float(lineparts[16]), float(lineparts[17]), float(lineparts[18]))
 
-        reading.append(readingsum / readingcount)
-        print "ddsa @ {} {} : {}".format(len(reading), index, (readingsum / readingcount))
+    # Average of the readings taken at each waypoint
+    reading = np.bincount(groups, values, group + 1) / np.bincount(groups, minlength=group + 1)
+    print "ddsa @ {} {} : {}".format(len(reading), index, reading[-1])
 
-    ddsa = []
+    waypoints, counts = ddsa_waypoints([0], ddsaLoops(len(reading)), 1, 1, 1, closed=False)
+    ddsa = np.rint(waypoints[0, :len(reading), :2]).astype(np.int64)
 
-    loops = 1
-    while(len(ddsa) < len(reading)):
-        ddsa = buildDDSAWaypoints(Span.WALK, 0, 1, 0, loops, 1, 1)
-        loops = loops + 1
+    x_min = int(ddsa[:, 0].min())
+    x_max = int(ddsa[:, 0].max()) + 1
+    y_min = int(ddsa[:, 1].min())
+    y_max = int(ddsa[:, 1].max()) + 1
 
-    ddsa = ddsa[0:len(reading)]
+    # Index of the first waypoint at each position, len(reading) where there is none
+    first = np.full((x_max - x_min, y_max - y_min), len(reading), dtype=np.int64)
+    np.minimum.at(first, (ddsa[:, 0] - x_min, ddsa[:, 1] - y_min), np.arange(len(reading)))
 
-    x_min = int(min([waypoint.x for waypoint in ddsa]))
-    x_max = int(max([waypoint.x for waypoint in ddsa])) + 1
-    y_min = int(min([waypoint.y for waypoint in ddsa]))
-    y_max = int(max([waypoint.y for waypoint in ddsa])) + 1
+    # Cell (x, y) shows the waypoint at (y, -x), rows by y and columns by x
+    cell_x, cell_y = np.meshgrid(np.arange(x_min, x_max), np.arange(y_min, y_max))
+    inside = (cell_y >= x_min) & (cell_y < x_max) & (-cell_x >= y_min) & (-cell_x < y_max)
+    found = np.full(cell_x.shape, len(reading), dtype=np.int64)
+    found[inside] = first[cell_y[inside] - x_min, -cell_x[inside] - y_min]
+    hit = found < len(reading)
+    cell_reading = reading[np.where(hit, found, 0)]
 
     xspace = np.linspace(x_min, x_max, (x_max - x_min))
     yspace = np.linspace(y_min, y_max, (y_max - y_min))
 
     X, Y = np.meshgrid(xspace, yspace)
-    Z = np.zeros(((y_max - y_min), (x_max - x_min)))
-
-    average = sum(reading) / len(reading)
-
-    for x in range(x_min, x_max):
-        for y in range(y_min, y_max):
-
-            index = lookupIndex(ddsa, y, -x)
-            if not index == -1 and index < len(reading):
-                Z[y - y_min][x - x_min] = reading[index]
-            else:
-                Z[y - y_min][x - x_min] = average
+    Z = np.where(hit, cell_reading, reading.mean())
 
 
     fig = plt.figure()
@@ -268,28 +203,18 @@ def buildCSV(input, output, image, kmlfile):
     plt.savefig(image, dpi=dpi)
 
 
+    # A line per x across y
     with open(output, 'w') as outputFile:
-        for x in range(x_min, x_max):
-            for y in range(y_min, y_max):
-                index = lookupIndex(ddsa, y, -x)
-                if not index == -1 and index < len(reading):
-                    outputFile.write("{}, ".format(reading[index]))
-                    # outputFile.write("{}, ".format(index))
-                else:
-                    outputFile.write("\"\", ")
+        for row, rowHit in zip(cell_reading.T.tolist(), hit.T.tolist()):
+            outputFile.write("".join("{}, ".format(value) if visited else "\"\", " for value, visited in zip(row, rowHit)))
             outputFile.write("\n")
 
-    readingList = []
-
-    print "min index: {}".format(reading.index(min(reading)))
-
-    for x in range(x_min, x_max):
-        for y in range(y_min, y_max):
+    print "min index: {}".format(np.argmin(reading))
 
-            index = lookupIndex(ddsa, y, -x)
-            if not index == -1 and index < len(reading):
-                readingList.append(Reading(reading[index], center[0] - (x / 111358.0), center[1] + (y / 111358.0), center[2] + 20))
-                # readingList.append(Reading(index, center[0] + (y / 111358.0), center[1] - (x / 111358.0), center[2] + 20))
+    x, y = np.nonzero(hit.T)
+    lats = (center[0] - ((x + x_min) / 111358.0)).tolist()
+    lons = (center[1] + ((y + y_min) / 111358.0)).tolist()
+    readingList = [Reading(value, lat, lon, center[2] + 20) for value, lat, lon in zip(cell_reading.T[x, y].tolist(), lats, lons)]
 
     writeKml(readingList, kmlfile)
 
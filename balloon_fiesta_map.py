@@ -1,14 +1,14 @@
 #!/usr/bin/env python
 
-import math
 import numpy as np
 import pandas as pd
-from pykrige.ok import OrdinaryKriging
+from kriging import krige_grid
 import matplotlib.pyplot as plt
 import matplotlib.ticker as ticker
 from matplotlib.colors import LinearSegmentedColormap
 from matplotlib.patches import Rectangle
 from VirtualPlume import buildco2
+from projection import meters_to_longitude
 
 def addRuler(plt, ax, length):
     lowerleft = [plt.xlim()[0], plt.ylim()[0]]
@@ -17,8 +17,7 @@ def addRuler(plt, ax, length):
     location = [plt.xlim()[0] + (plt.xlim()[1] - plt.xlim()[0]) *.05, plt.ylim()[0] + (plt.ylim()[1] - plt.ylim()[0]) *.03]
 
     # Calculate width by latitide
-    earthCircumference = 40008000
-    width = abs(1.0 * length / ((earthCircumference / 360) * math.cos(lowerleft[1] * 0.01745)))
+    width = abs(float(meters_to_longitude(length, lowerleft[1])))
     height = (upperright[1] - lowerleft[1]) * 0.018
 
     ax.add_patch(Rectangle(location, width, height, ec=(0,0,0,1), fc=(1,1,1,1)))
@@ -26,7 +25,7 @@ def addRuler(plt, ax, length):
     ax.annotate("0", xy=(location[0], location[1] + (1.5 * height)), ha='center')
     ax.annotate("{} m".format(length), xy=(location[0] + width, location[1] + (1.5 * height)), ha='center')
 
-def heatmap(fig, ax, input, start = None, end = None, nlags = 6, render_axis=False, render_legend=False, wrap_data = False, max_value = 750):
+def heatmap(fig, ax, input, start = None, end = None, nlags = 6, render_axis=False, render_legend=False, wrap_data = False, max_value = 750, cell = None, engine = None):
 
     # get colormap
     ncolors = 256
@@ -60,8 +59,7 @@ def heatmap(fig, ax, input, start = None, end = None, nlags = 6, render_axis=Fal
     grid_lon = np.arange(np.amin(lons), np.amax(lons), grid_space) #grid_space is the desired delta/step of the output array
     grid_lat = np.arange(np.amin(lats) - 0.0003, np.amax(lats), grid_space)
 
-    OK = OrdinaryKriging(lons, lats, data, variogram_model='gaussian', verbose=True, nlags=nlags)
-    z1, ss1 = OK.execute('grid', grid_lon, grid_lat)
+    z1, ss1 = krige_grid(lons, lats, data, grid_lon, grid_lat, nlags, variogram_model='gaussian', cell=cell, engine=engine)
 
     xintrp, yintrp = np.meshgrid(grid_lon, grid_lat)
 
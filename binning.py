@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+
+import numpy as np
+
+try:
+    from .projection import site_projection
+except (ImportError, ValueError):
+    from projection import site_projection
+
+DEFAULT_CELL = 1.0
+# Longest gap in ns a reading is weighted for by the time statistic
+MAX_DWELL = 1000000000
+STATISTICS = ['mean', 'max', 'count', 'time', 'thin']
+
+def cell_index(lat, lon, cell, origin=None):
+    """Group number of each position on a grid of cell meter squares, and the first position of each group.
+
+    The grid is laid out in meters around origin, the first position by default.
+    """
+    if origin is None:
+        origin = (lat[0], lon[0])
+    east, north = site_projection(origin[0], origin[1]).to_local(lat, lon)
+    column = np.floor(east / cell).astype(np.int64)
+    row = np.floor(north / cell).astype(np.int64)
+    column -= column.min()
+    row -= row.min()
+    keys = column * (row.max() + 1) + row
+    keys, first, group = np.unique(keys, return_index=True, return_inverse=True)
+    return group.ravel(), first
+
+def dwell_times(time):
+    """ns each reading stands for until the next one, capped at MAX_DWELL; the last gets the median."""
+    dwell = np.diff(np.asarray(time, dtype=np.int64)).astype(np.float64)
+    dwell = np.clip(dwell, 0, MAX_DWELL)
+    last = np.median(dwell) if len(dwell) else 1.0
+    return np.append(dwell, last)
+
+def bin_columns(lat, lon, value, time=None, alt=None, cell=DEFAULT_CELL, statistic='mean', origin=None):
+    """Aggregates readings per grid cell of cell meters.
+
+    statistic is one of:
+      mean  - mean value at the mean position of the cell
+      max   - largest value at the mean position of the cell
+      count - number of readings at the mean position of the cell
+      time  - mean value weighted by how long each reading stood, needs time
+      thin  - the first reading of each cell, position and value unchanged
+
+    Returns lat, lon, value, alt (averaged like the position), time (of the
+    first reading of the cell) and count columns, in order of the first
+    reading of each cell. time and alt are None when not given.
+    """
+    if statistic not in STATISTICS:
+        raise ValueError("Unknown statistic {}, expected one of {}".format(statistic, ", ".join(STATISTICS)))
+    lat = np.asarray(lat, dtype=np.float64)
+    lon = np.asarray(lon, dtype=np.float64)
+    value = np.asarray(value, dtype=np.float64)
+    if time is not None:
+        time = np.asarray(time, dtype=np.int64)
+    if alt is not None:
+        alt = np.asarray(alt, dtype=np.float64)
+    if statistic == 'time' and time is None:
+        raise ValueError('The time statistic needs reading times')
+    if len(value) == 0:
+        empty = np.zeros(0)
+        return {'lat': empty, 'lon': empty, 'value': empty, 'alt': None if alt is None else empty, 'time': None if time is None else time[:0], 'count': np.zeros(0, dtype=np.int64)}
+
+    group, first = cell_index(lat, lon, cell, origin)
+    # Cells numbered by their first reading keep the flight order
+    order = np.argsort(first, kind='stable')
+    rank = np.empty(len(order), dtype=np.int64)
+    rank[order] = np.arange(len(order))
+    group = rank[group]
+    first = first[order]
+
+    cells = len(first)
+    count = np.bincount(group, minlength=cells)
+    binned = {'count': count, 'time': None if time is None else time[first]}
+
+    if statistic == 'thin':
+        binned['lat'] = lat[first]
+        binned['lon'] = lon[first]
+        binned['value'] = value[first]
+        binned['alt'] = None if alt is None else alt[first]
+        return binned
+
+    binned['lat'] = np.bincount(group, lat, cells) / count
+    binned['lon'] = np.bincount(group, lon, cells) / count
+    binned['alt'] = None if alt is None else np.bincount(group, alt, cells) / count
+    if statistic == 'mean':
+        binned['value'] = np.bincount(group, value, cells) / count
+    elif statistic == 'max':
+        binned['value'] = np.full(cells, -np.inf)
+        np.maximum.at(binned['value'], group, value)
+    elif statistic == 'count':
+        binned['value'] = count.astype(np.float64)
+    else:
+        weight = dwell_times(time)
+        total = np.bincount(group, weight, cells)
+        weighted = np.bincount(group, weight * value, cells)
+        mean = np.bincount(group, value, cells) / count
+        binned['value'] = np.where(total > 0, weighted / np.where(total > 0, total, 1), mean)
+    return binned
+
+def reduction(before, after):
+    """Describes binning before readings into after cells, for scripts to report."""
+    return "{} readings binned into {} cells ({:.1f}x)".format(before, after, before / float(max(after, 1)))
+
+def bin_samples(lons, lats, data, cell=DEFAULT_CELL, statistic='mean'):
+    """bin_columns for the lons, lats, data arrays the heatmaps krige, returned in that order."""
+    binned = bin_columns(lats, lons, data, cell=cell, statistic=statistic)
+    return binned['lon'], binned['lat'], binned['value']
@@ -0,0 +1,248 @@
+#!/usr/bin/env python
+
+import argparse, json, os, re
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+
+from .dataflash import read_stream
+from .logscan import NO_TIME, READING, scan_block, to_float, to_time
+from .parsecache import content_hash
+from .timeline import to_ns
+
+MANIFEST_VERSION = 1
+DEFAULT_MANIFEST = 'manifest.json'
+
+# Readings per time block, a query resolves to the byte ranges of the matching blocks
+BLOCK_ROWS = 1024
+
+DRONE = re.compile(r'(?:^|[^a-z])df\s*(\d+)', re.IGNORECASE)
+LOG_NAME = re.compile(r'\.log(\.\d+)?$')
+
+def file_format(path):
+    name = os.path.basename(path)
+    if name.endswith('.bin'):
+        return 'bin'
+    if name.endswith('.csv'):
+        return 'csv'
+    if name == 'command.log':
+        return 'command'
+    if LOG_NAME.search(name):
+        return 'log'
+    return 'other'
+
+def drone_id(relative):
+    """The last dfN found in the path, the name Dragonfly drones go by."""
+    matches = [match for part in relative.split(os.sep) for match in DRONE.findall(part)]
+    return 'df{}'.format(int(matches[-1])) if matches else None
+
+def time_blocks(times, offsets, ends):
+    """Splits time ordered rows into blocks of [first time, last time, start byte, end byte]."""
+    blocks = []
+    for start in range(0, len(times), BLOCK_ROWS):
+        stop = min(start + BLOCK_ROWS, len(times))
+        blocks.append([int(times[start:stop].min()), int(times[start:stop].max()), int(offsets[start]), int(ends[stop - 1])])
+    return blocks
+
+def log_columns(path):
+    with open(path, 'rb') as inputFile:
+        data = inputFile.read()
+    # Rotated files may start mid line, so the first line is scanned as well
+    columns, toggles, line_count = scan_block(np.frombuffer(data, dtype=np.uint8), False)
+    reading = (columns['type'] == READING) & (columns['time'] != NO_TIME)
+    offsets = columns['offset'][reading]
+    ends = np.append(columns['offset'][1:], len(data))[reading]
+    return columns['time'][reading], columns['lat'][reading], columns['lon'][reading], offsets, ends
+
+def csv_columns(path):
+    names = None
+    rows = []
+    offsets = []
+    ends = []
+    with open(path, 'rb') as inputFile:
+        offset = 0
+        for line in inputFile:
+            fields = [field.strip() for field in line.decode('utf-8', 'replace').split(',')]
+            if names is None and 'lat' in fields and 'lon' in fields:
+                names = fields
+            elif fields != ['']:
+                rows.append(fields)
+                offsets.append(offset)
+                ends.append(offset + len(line))
+            offset += len(line)
+
+    if names is None:
+        # Headerless exports are co2, lat, lon, alt
+        if not rows or any(len(fields) != 4 for fields in rows):
+            return None
+        names = ['co2', 'lat', 'lon', 'alt']
+
+    width = len(names)
+    rows = [fields for fields in rows if len(fields) >= width]
+    lat = to_float([fields[names.index('lat')] for fields in rows])
+    lon = to_float([fields[names.index('lon')] for fields in rows])
+    if 'time' in names:
+        times = to_time([fields[names.index('time')] for fields in rows])
+    else:
+        times = np.full(len(rows), NO_TIME, dtype=np.int64)
+    return times, lat, lon, np.array(offsets[:len(rows)], dtype=np.int64), np.array(ends[:len(rows)], dtype=np.int64)
+
+def dataflash_columns(path):
+    gps = read_stream(path, 'GPS')
+    size = os.path.getsize(path)
+    count = len(gps['time'])
+    return gps['time'], gps['lat'], gps['lon'], np.zeros(count, dtype=np.int64), np.full(count, size, dtype=np.int64)
+
+def catalog_file(root, relative):
+    """Builds the manifest entry of one file."""
+    path = os.path.join(root, relative)
+    stat = os.stat(path)
+    parts = relative.split(os.sep)
+    entry = {
+        'path': relative,
+        'site': parts[0] if len(parts) > 1 else '',
+        'drone': drone_id(relative),
+        'format': file_format(path),
+        'size': stat.st_size,
+        'mtime': stat.st_mtime,
+        'hash': content_hash(path),
+        'readings': 0,
+        'start': None,
+        'end': None,
+        'bbox': None,
+        'blocks': []
+    }
+
+    columns = None
+    if entry['size'] > 0:
+        if entry['format'] == 'log':
+            columns = log_columns(path)
+        elif entry['format'] == 'csv':
+            columns = csv_columns(path)
+        elif entry['format'] == 'bin':
+            columns = dataflash_columns(path)
+    if columns is None:
+        return entry
+
+    times, lat, lon, offsets, ends = columns
+    entry['readings'] = len(times)
+    located = np.isfinite(lat) & np.isfinite(lon) & (lat != 0) & (lon != 0)
+    if located.any():
+        entry['bbox'] = [float(lat[located].min()), float(lon[located].min()), float(lat[located].max()), float(lon[located].max())]
+    timed = times != NO_TIME
+    if timed.any():
+        entry['start'] = int(times[timed].min())
+        entry['end'] = int(times[timed].max())
+        entry['blocks'] = time_blocks(times[timed], offsets[timed], ends[timed])
+    return entry
+
+def list_files(root):
+    files = []
+    for directory, subdirectories, names in os.walk(root):
+        subdirectories.sort()
+        for name in sorted(names):
+            if name == DEFAULT_MANIFEST:
+                continue
+            files.append(os.path.relpath(os.path.join(directory, name), root))
+    return files
+
+def build_catalog(root, previous=None, workers=1):
+    """Catalogs every file under root.
+
+    Entries of a previous manifest are reused for files whose size and mtime
+    did not change. Files whose content hash was already seen are marked as a
+    duplicate_of the first copy.
+    """
+    known = dict((entry['path'], entry) for entry in (previous or {}).get('files', []))
+    files = list_files(root)
+
+    entries = {}
+    stale = []
+    for relative in files:
+        entry = known.get(relative)
+        stat = os.stat(os.path.join(root, relative))
+        if entry is not None and entry['size'] == stat.st_size and entry['mtime'] == stat.st_mtime:
+            entries[relative] = entry
+        else:
+            stale.append(relative)
+
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if workers > 1 and len(stale) > 1:
+        with ProcessPoolExecutor(workers) as executor:
+            entries.update(zip(stale, executor.map(catalog_file, [root] * len(stale), stale)))
+    else:
+        entries.update((relative, catalog_file(root, relative)) for relative in stale)
+
+    seen = {}
+    ordered = []
+    for relative in files:
+        entry = entries[relative]
+        entry['duplicate_of'] = seen.setdefault(entry['hash'], relative) if entry['size'] > 0 else None
+        if entry['duplicate_of'] == relative:
+            entry['duplicate_of'] = None
+        ordered.append(entry)
+
+    return {'version': MANIFEST_VERSION, 'root': os.path.abspath(root), 'files': ordered}
+
+def load_manifest(path):
+    try:
+        with open(path, 'r') as inputFile:
+            manifest = json.load(inputFile)
+    except (IOError, OSError, ValueError):
+        return None
+    return manifest if manifest.get('version') == MANIFEST_VERSION else None
+
+def save_manifest(manifest, path):
+    with open(path, 'w') as outputFile:
+        json.dump(manifest, outputFile)
+
+def query(manifest, site=None, drone=None, start=None, end=None, formats=('log', 'csv', 'bin'), duplicates=False):
+    """Resolves a query to (path, start byte, end byte) ranges without opening the files.
+
+    site matches case insensitively anywhere in the site name, start and end
+    bound the reading times as epoch ns or anything np.datetime64 accepts.
+    Adjacent matching blocks of a file are joined into one range.
+    """
+    start = None if start is None else to_ns(start)
+    end = None if end is None else to_ns(end)
+    ranges = []
+    for entry in manifest['files']:
+        if entry['format'] not in formats or not entry['blocks']:
+            continue
+        if entry['duplicate_of'] is not None and not duplicates:
+            continue
+        if site is not None and site.lower() not in entry['site'].lower():
+            continue
+        if drone is not None and entry['drone'] != drone.lower():
+            continue
+        if (start is not None and entry['end'] < start) or (end is not None and entry['start'] >= end):
+            continue
+
+        path = os.path.join(manifest['root'], entry['path'])
+        for first, last, offset, stop in entry['blocks']:
+            if (start is not None and last < start) or (end is not None and first >= end):
+                continue
+            if ranges and ranges[-1][0] == path and ranges[-1][2] >= offset:
+                ranges[-1] = (path, ranges[-1][1], max(ranges[-1][2], stop))
+            else:
+                ranges.append((path, offset, stop))
+    return ranges
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = 'Catalog the data tree into a manifest')
+    parser.add_argument('--root', type=str, help='Data directory to catalog.', default='data')
+    parser.add_argument('--manifest', type=str, help='Manifest file, reused for unchanged files.', default=None)
+    parser.add_argument('--workers', type=int, help='Number of processes, defaults to one per core.', default=None)
+    args = parser.parse_args()
+
+    manifest_path = args.manifest or os.path.join(args.root, DEFAULT_MANIFEST)
+    previous = load_manifest(manifest_path)
+    manifest = build_catalog(args.root, previous, args.workers)
+    save_manifest(manifest, manifest_path)
+
+    for entry in manifest['files']:
+        span = '-'
+        if entry['start'] is not None:
+            span = "{} - {}".format(np.datetime64(entry['start'], 'ns'), np.datetime64(entry['end'], 'ns'))
+        duplicate = " duplicate of {}".format(entry['duplicate_of']) if entry['duplicate_of'] else ''
+        print("{} [{} {}] {} readings {}{}".format(entry['path'], entry['format'], entry['drone'] or '-', entry['readings'], span, duplicate))
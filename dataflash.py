@@ -0,0 +1,210 @@
+#!/usr/bin/env python
+
+import argparse, mmap, os
+import numpy as np
+
+from .logscan import NO_TIME
+from .parsecache import cached
+
+HEADER = b'\xa3\x95'
+FMT_TYPE = 128
+FMT_LENGTH = 89
+
+# DataFlash format characters as (numpy dtype, scale applied on decode)
+FORMATS = {
+    'a': (('<i2', (32,)), None),
+    'b': ('i1', None),
+    'B': ('u1', None),
+    'h': ('<i2', None),
+    'H': ('<u2', None),
+    'i': ('<i4', None),
+    'I': ('<u4', None),
+    'f': ('<f4', None),
+    'd': ('<f8', None),
+    'n': ('S4', None),
+    'N': ('S16', None),
+    'Z': ('S64', None),
+    'c': ('<i2', 0.01),
+    'C': ('<u2', 0.01),
+    'e': ('<i4', 0.01),
+    'E': ('<u4', 0.01),
+    'L': ('<i4', 1e-7),
+    'M': ('u1', None),
+    'q': ('<i8', None),
+    'Q': ('<u8', None)
+}
+
+FMT_DTYPE = np.dtype([('type', 'u1'), ('length', 'u1'), ('name', 'S4'), ('format', 'S16'), ('columns', 'S64')])
+
+GPS_EPOCH = np.datetime64('1980-01-06', 'ns').astype(np.int64)
+WEEK_NS = 7 * 24 * 3600 * 1000000000
+# GPS time runs ahead of UTC by the leap seconds since 1980, 18 for logs after 2017
+GPS_LEAP_SECONDS = 18
+
+# Minimum GPS Status for a 3D fix
+GPS_FIX_3D = 3
+
+class MessageFormat:
+
+    def __init__(self, type, length, name, format, columns):
+        self.type = type
+        self.length = length
+        self.name = name
+        self.format = format
+        self.columns = columns
+        self.dtype = np.dtype([(column, FORMATS[char][0]) for column, char in zip(columns, format)])
+        self.scales = dict((column, FORMATS[char][1]) for column, char in zip(columns, format) if FORMATS[char][1] is not None)
+
+class DataFlashLog:
+    """Reader for ArduPilot DataFlash .bin logs.
+
+    The file is memory mapped and walked once to read every FMT message and
+    record the offset of each message by type; messages(name) then decodes all
+    messages of one type straight into typed arrays.
+    """
+
+    def __init__(self, path):
+        with open(path, 'rb') as inputFile:
+            if os.path.getsize(path) == 0:
+                self.data = b''
+            else:
+                self.data = mmap.mmap(inputFile.fileno(), 0, access=mmap.ACCESS_READ)
+        self.buf = np.frombuffer(self.data, dtype=np.uint8)
+        self.formats = {}
+        self.offsets = {}
+        self.index()
+
+    def close(self):
+        del self.buf
+        if isinstance(self.data, mmap.mmap):
+            self.data.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def add_format(self, offset):
+        fmt = np.frombuffer(self.data, dtype=FMT_DTYPE, count=1, offset=offset + 3)[0]
+        name = fmt['name'].decode('ascii', 'replace')
+        format = fmt['format'].decode('ascii', 'replace')
+        columns = fmt['columns'].decode('ascii', 'replace').split(',')
+        if all(char in FORMATS for char in format) and len(columns) == len(format):
+            message = MessageFormat(int(fmt['type']), int(fmt['length']), name, format, columns)
+            if message.dtype.itemsize + 3 == message.length:
+                self.formats[message.type] = message
+
+    def index(self):
+        data = self.data
+        size = len(data)
+        lengths = {FMT_TYPE: FMT_LENGTH}
+        offsets = {}
+        offset = 0
+        while offset + 3 <= size:
+            type = data[offset + 2]
+            length = lengths.get(type)
+            if data[offset:offset + 2] != HEADER or length is None or offset + length > size:
+                # Corrupt or unknown message, resync on the next header
+                offset = data.find(HEADER, offset + 1)
+                if offset < 0:
+                    break
+                continue
+            if type == FMT_TYPE:
+                self.add_format(offset)
+                if data[offset + 3] in self.formats:
+                    lengths[data[offset + 3]] = self.formats[data[offset + 3]].length
+            offsets.setdefault(type, []).append(offset)
+            offset += length
+
+        for type, positions in offsets.items():
+            if type in self.formats:
+                self.offsets[self.formats[type].name] = np.array(positions, dtype=np.int64)
+
+    def names(self):
+        return sorted(self.offsets.keys())
+
+    def messages(self, name):
+        """Decodes every message called name into a dict of column arrays, with scaled fields as float64."""
+        message = [fmt for fmt in self.formats.values() if fmt.name == name]
+        if not message or name not in self.offsets:
+            return None
+        message = message[0]
+        positions = self.offsets[name][:, None] + 3 + np.arange(message.length - 3)
+        records = self.buf[positions].view(message.dtype).reshape(-1)
+
+        columns = {}
+        for column in message.columns:
+            values = records[column]
+            scale = message.scales.get(column)
+            columns[column] = values * scale if scale is not None else np.array(values)
+        return columns
+
+    def boot_offset(self):
+        """Returns the ns to add to TimeUS * 1000 to get UTC, estimated from GPS messages with a fix."""
+        gps = self.messages('GPS')
+        if gps is None:
+            return None
+        fixed = (gps['Status'] >= GPS_FIX_3D) & (gps['GWk'] > 0)
+        if not fixed.any():
+            return None
+        utc = gps_time(gps['GWk'][fixed], gps['GMS'][fixed])
+        return int(np.median(utc - gps['TimeUS'][fixed].astype(np.int64) * 1000))
+
+def gps_time(week, milliseconds):
+    """Converts GPS week and millisecond of week to UTC epoch ns."""
+    return GPS_EPOCH + week.astype(np.int64) * WEEK_NS + milliseconds.astype(np.int64) * 1000000 - GPS_LEAP_SECONDS * 1000000000
+
+def gps_columns(log):
+    """GPS positions with a 3D fix as time (UTC epoch ns), lat, lon and alt columns."""
+    gps = log.messages('GPS')
+    if gps is None:
+        return {'time': np.zeros(0, dtype=np.int64), 'lat': np.zeros(0), 'lon': np.zeros(0), 'alt': np.zeros(0)}
+    fixed = (gps['Status'] >= GPS_FIX_3D) & (gps['GWk'] > 0)
+    return {
+        'time': gps_time(gps['GWk'][fixed], gps['GMS'][fixed]),
+        'lat': gps['Lat'][fixed],
+        'lon': gps['Lng'][fixed],
+        'alt': gps['Alt'][fixed]
+    }
+
+def stream_columns(log, name):
+    """All columns of one message type, with TimeUS also mapped to a UTC 'time' column when GPS allows it."""
+    columns = log.messages(name)
+    if columns is None:
+        return {}
+    offset = log.boot_offset()
+    if 'TimeUS' in columns:
+        if offset is None:
+            columns['time'] = np.full(len(columns['TimeUS']), NO_TIME, dtype=np.int64)
+        else:
+            columns['time'] = columns['TimeUS'].astype(np.int64) * 1000 + offset
+    return columns
+
+def read_stream(path, name):
+    """Decodes one message stream (GPS, ATT, BARO ...) of a .bin log, through the parse cache."""
+    def decode():
+        with DataFlashLog(path) as log:
+            if name == 'GPS':
+                return gps_columns(log)
+            return dict((column, values) for column, values in stream_columns(log, name).items() if values.dtype.kind != 'S')
+    return cached('dataflash', path, {'message': name}, decode)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = 'Decode a DataFlash .bin flight log')
+    parser.add_argument('--input', type=str, help='Input .bin log.')
+    parser.add_argument('--message', type=str, help='Message type to export, lists the types when missing.', default=None)
+    parser.add_argument('--output', type=str, help='Output CSV file.', default=None)
+    args = parser.parse_args()
+
+    if args.message is None:
+        with DataFlashLog(args.input) as log:
+            for name in log.names():
+                print("{}: {}".format(name, len(log.offsets[name])))
+    else:
+        columns = read_stream(args.input, args.message)
+        names = sorted(columns.keys())
+        with open(args.output, 'w') as outputFile:
+            outputFile.write("{}\n".format(",".join(names)))
+            for row in zip(*[columns[name] for name in names]):
+                outputFile.write("{}\n".format(",".join(str(value) for value in row)))
@@ -1,89 +1,34 @@
 #!/usr/bin/env python
 
-import matplotlib.pyplot as plt
-
-from mpl_toolkits.mplot3d import Axes3D  # noqa: F401 unused import
-import math, pulp
-from enum import Enum
-from geometry_msgs.msg import PoseStamped, Point
-
-class Span(Enum):
-    WALK = 1
-    RANGE = 2
-
-def calculateRange(type, start, end, length):
-    if type == Span.WALK:
-        waypoints = []
-        print "Calculating walk"
-        deltax = end.x - start.x
-        deltay = end.y - start.y
-        deltaz = end.z - start.z
-        distance = math.sqrt((deltax * deltax) + (deltay * deltay) + (deltaz * deltaz))
-        for i in range(1, int(distance / length) + 1):
-            waypoints.append(Point(start.x + (i * length * deltax / distance),
-                                   start.y + (i * length * deltay / distance),
-                                   start.z + (i * length * deltaz / distance)))
-        return waypoints
-    elif type == Span.RANGE:
-        return [end]
+from ddsapath import ddsa_waypoints, iter_waypoints
+from planning import Span, to_points
 
 def build3DDDSAWaypoints(rangeType, stacks, size, index, loops, radius, stepLength):
-    waypoints = []
-    toggleReverse = False
-    for stack in range(0, stacks):
-
-        ddsaWaypoints = buildDDSAWaypoints(rangeType, stack, size, index, loops, radius, stepLength)
-        if toggleReverse:
-            ddsaWaypoints = ddsaWaypoints[::-1]
-        waypoints = waypoints + ddsaWaypoints
-
-        toggleReverse = not toggleReverse
-
-    return waypoints
+    waypoints, counts = ddsa_waypoints([index], loops, size, radius, stepLength if rangeType == Span.WALK else None, stacks)
+    return to_points(iter_waypoints(waypoints, counts))
 
 def buildDDSAWaypoints(rangeType, altitude, size, index, loops, radius, stepLength):
-
-    waypoints = []
-    start = Point(-index, 0, altitude)
-    waypoints.append(start)
-    previous = start
-    for loop in range(loops):
-        for corner in range(4):
-
-            xoffset = loop * size + index + 1
-            yoffset = xoffset
-            if corner == 0:
-                xoffset = -size * loop - index
-            if corner == 2 or corner == 3:
-                yoffset = -yoffset
-            if corner == 3:
-                xoffset = -xoffset - (size - 1)
-                # Ends loop square with the last corner
-                if loop == loops - 1:
-                    xoffset += index  + 1
-
-
-            next = Point(xoffset, yoffset, altitude)
-
-            for waypoint in calculateRange(rangeType, previous, next, stepLength):
-                waypoints.append(Point(waypoint.x * radius, waypoint.y * radius, waypoint.z))
-
-            previous = next
-
-    return waypoints
+    waypoints, counts = ddsa_waypoints([index], loops, size, radius, stepLength if rangeType == Span.WALK else None, altitude=altitude)
+    return to_points(iter_waypoints(waypoints, counts))
 
 def plotPath(ax, index, color, style, name):
-    waypoints = build3DDDSAWaypoints(Span.RANGE, 3, 3, index, 2, 1, 1)
+    # The array form of build3DDDSAWaypoints, sliced into columns without building Points
+    waypoints, counts = ddsa_waypoints([index], 2, 3, 1, None, 3)
+    waypoints = waypoints[0, :counts[0]]
 
-    lat = [10 * (w.y + 6) for w in waypoints]
-    lon = [10 * (w.x + 5) for w in waypoints]
-    alt = [w.z * 10 + 10 for w in waypoints]
+    lat = 10 * (waypoints[:, 1] + 6)
+    lon = 10 * (waypoints[:, 0] + 5)
+    alt = waypoints[:, 2] * 10 + 10
 
     ax.plot(lon, lat, alt, color + style, label=name, zorder=-index)
     ax.scatter(lon[0], lat[0], alt[0], color = color, marker = 'o', s = 50, zorder=-index)
     ax.scatter(lon[len(lon)-1], lat[len(lat)-1], alt[len(alt)-1], color = color, marker='X', s = 50, zorder=-index)
 
 def main():
+    # Only the figure needs matplotlib, planning imports stay light
+    import matplotlib.pyplot as plt
+    from mpl_toolkits.mplot3d import Axes3D  # noqa: F401 unused import
+
     plt.rcParams['font.family'] = 'serif'
     plt.rcParams['font.serif'] = ['Times New Roman'] + plt.rcParams['font.serif']
     plt.rcParams['pdf.fonttype'] = 42
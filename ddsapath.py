@@ -0,0 +1,133 @@
+#!/usr/bin/env python
+
+import argparse, time
+import numpy as np
+
+try:
+    from .planning import Point, Span, path_waypoints, scaled, stacked
+except (ImportError, ValueError):
+    from planning import Point, Span, path_waypoints, scaled, stacked
+
+def ddsa_corners(indices, loops, size=1, closed=True):
+    """Corners of the DDSA square spiral of each drone index, starting point first, in grid units.
+
+    Returns an array of (len(indices), 4 * loops + 1, 2). closed follows
+    ddsa.py, where drone index starts at (-index, 0) and the last loop ends
+    square, otherwise every drone starts at the origin like waypointUtil.
+    """
+    index = np.asarray(indices, dtype=np.float64).reshape(-1, 1, 1)
+    loop = np.arange(loops, dtype=np.float64).reshape(1, -1, 1)
+    corner = np.arange(4).reshape(1, 1, -1)
+    shape = (len(index), loops, 4)
+
+    offset = loop * size + index + 1
+    y = np.broadcast_to(np.where((corner == 2) | (corner == 3), -offset, offset), shape)
+    if closed:
+        x = np.where(corner == 0, -size * loop - index, offset)
+        last = np.where(loop == loops - 1, index + 1, 0)
+        x = np.where(corner == 3, -offset - (size - 1) + last, x)
+        start = np.column_stack((-index.ravel(), np.zeros(len(index))))
+    else:
+        x = np.where(corner == 0, -(1 + index + (loop - 1) * size), np.where(corner == 3, -offset, offset))
+        # The first leg heads straight up from the origin
+        x = np.where((loop == 0) & (corner == 0), 0.0, x)
+        start = np.zeros((len(index), 2))
+    x = np.broadcast_to(x, shape)
+
+    corners = np.stack((x.reshape(len(index), -1), y.reshape(len(index), -1)), axis=-1)
+    return np.concatenate((start[:, None, :], corners), axis=1)
+
+def walk(corners, step_length):
+    """Steps of step_length along each leg between the corners, as calculateRange walks them.
+
+    Each leg gets the points i * step_length along it for i from 1 to the
+    whole number of steps that fit, so a corner is only visited when the leg
+    is a multiple of the step. Returns the positions of each drone after its
+    start, padded with NaN to the longest, and how many each has.
+    """
+    begin = corners[:, :-1]
+    delta = corners[:, 1:] - begin
+    distance = np.sqrt((delta * delta).sum(axis=-1))
+    steps = np.where(distance > 0, np.floor(distance / step_length), 0).astype(np.int64)
+    counts = steps.sum(axis=1)
+
+    drones = len(corners)
+    length = int(counts.max()) if drones else 0
+    positions = np.full((drones, length, 2), np.nan)
+    drone, leg = np.nonzero(steps)
+    repeats = steps[drone, leg]
+    total = int(repeats.sum())
+    # Numbers each step within its leg, 1 upwards, and places it after the earlier steps of its drone
+    first = np.cumsum(repeats) - repeats
+    step = np.arange(total) - np.repeat(first, repeats) + 1
+    drone, leg = np.repeat(drone, repeats), np.repeat(leg, repeats)
+    slot = np.arange(total) - np.repeat(np.searchsorted(drone, np.arange(drones)), counts)
+    along = (step * step_length)[:, None] * delta[drone, leg] / distance[drone, leg][:, None]
+    positions[drone, slot] = begin[drone, leg] + along
+    return positions, counts
+
+def ddsa_waypoints(indices, loops, size=1, radius=1, step_length=None, stacks=1, altitude=0, closed=True):
+    """Waypoints of every drone index through stacks layers of the DDSA search, as one array.
+
+    Each layer is flown at altitude plus its stack number, every other one in
+    reverse so the drone climbs from where it finished. Without a
+    step_length only the corners are visited, otherwise the legs are walked
+    in steps of that many grid units. Positions are scaled by radius.
+
+    Returns the (drones, N, 3) waypoints, padded with NaN past each drone's
+    count, and the counts.
+    """
+    corners = ddsa_corners(indices, loops, size, closed)
+    if step_length is None:
+        layer = corners
+        counts = np.full(len(corners), corners.shape[1], dtype=np.int64)
+    else:
+        steps, counts = walk(corners, step_length)
+        layer = np.concatenate((corners[:, :1], steps), axis=1)
+        counts = counts + 1
+    layer = layer * radius
+
+    drones, length = layer.shape[:2]
+    waypoints = np.full((drones, stacks * length, 3), np.nan)
+    position = np.arange(length)
+    valid = position[None, :] < counts[:, None]
+    drone = np.repeat(np.arange(drones), valid.sum(axis=1))
+    reverse = np.clip(counts[:, None] - 1 - position[None, :], 0, None)
+    for stack in range(stacks):
+        rows = np.take_along_axis(layer, reverse[:, :, None], axis=1) if stack % 2 else layer
+        slot = (stack * counts[:, None] + position[None, :])[valid]
+        waypoints[drone, slot, :2] = rows[valid]
+        waypoints[drone, slot, 2] = altitude + stack
+    return waypoints, counts * stacks
+
+def iter_waypoints(waypoints, counts, drone=0):
+    """Yields the (x, y, z) waypoints of one drone in order, for streaming them out one at a time."""
+    for row in waypoints[drone, :counts[drone]]:
+        yield float(row[0]), float(row[1]), float(row[2])
+
+def iter_ddsa_waypoints(index, loops, size=1, radius=1, step_length=None, altitude=0, closed=True, reverse=False):
+    """Yields the Points of one drone's DDSA layer as ddsa_waypoints would place them, without building them.
+
+    Only the corners are kept, so memory does not grow with the walk. reverse
+    yields them last first.
+    """
+    corners = [Point(x, y, altitude) for x, y in ddsa_corners([index], loops, size, closed)[0].tolist()]
+    legs = [(corners[0], corners[1], True)] + [(start, end, False) for start, end in zip(corners[1:-1], corners[2:])]
+    return scaled(path_waypoints(legs, Span.RANGE if step_length is None else Span.WALK, step_length, reverse), radius)
+
+def iter_3d_ddsa_waypoints(index, loops, size=1, radius=1, step_length=None, stacks=1, altitude=0, closed=True):
+    """Yields the Points of one drone through stacks DDSA layers, every other one reversed."""
+    return stacked(lambda stack, reverse: iter_ddsa_waypoints(index, loops, size, radius, step_length, altitude + stack, closed, reverse), stacks)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = 'Time planning DDSA searches for a swarm')
+    parser.add_argument('--drones', type=int, help='Number of drone indices.', default=100)
+    parser.add_argument('--loops', type=int, help='Loops of the spiral.', default=50)
+    parser.add_argument('--stacks', type=int, help='Layers of the search.', default=3)
+    parser.add_argument('--size', type=int, help='Spacing between loops.', default=1)
+    parser.add_argument('--step', type=float, help='Walk the legs in steps of this length.', default=None)
+    args = parser.parse_args()
+
+    started = time.time()
+    waypoints, counts = ddsa_waypoints(range(args.drones), args.loops, args.size, 1, args.step, args.stacks)
+    print("{} waypoints for {} drones in {:.1f} ms".format(int(counts.sum()), args.drones, (time.time() - started) * 1000))
@@ -0,0 +1,229 @@
+#!/usr/bin/env python
+
+import argparse, glob, os, warnings
+import numpy as np
+from scipy.spatial import cKDTree
+
+from .dataflash import read_stream
+from .logscan import NO_TIME, READING
+from .projection import equirectangular_distance, site_projection
+from .reading import readings_from_columns
+from .rotatedlog import scan_rotated_log
+
+SECOND = 1000000000
+DEFAULT_TOLERANCE = 1.0
+
+# Clock offset search: CO2 samples compared per candidate and the distance cap in meters
+OFFSET_SAMPLES = 2000
+OFFSET_CAP = 10.0
+# Candidate offsets come from the time differences of logged positions and track fixes within
+# MATCH_RADIUS meters, at most MAX_OFFSET_PAIRS of them, and the OFFSET_CANDIDATES most common are scored
+MATCH_RADIUS = 5.0
+MAX_OFFSET_PAIRS = 1000000
+OFFSET_CANDIDATES = 64
+# A jump in the CO2 log clock longer than this, in seconds, starts a segment with its own offset
+SEGMENT_GAP = 600.0
+
+def flight_track(paths):
+    """Joins the GPS fixes of several .bin logs into one time ordered track."""
+    streams = [read_stream(path, 'GPS') for path in paths]
+    track = {}
+    for name in ['time', 'lat', 'lon', 'alt']:
+        track[name] = np.concatenate([stream[name] for stream in streams]) if streams else np.zeros(0)
+    track['time'] = track['time'].astype(np.int64)
+
+    order = np.argsort(track['time'], kind='stable')
+    keep = np.ones(len(order), dtype=bool)
+    keep[1:] = np.diff(track['time'][order]) > 0
+    return dict((name, values[order][keep]) for name, values in track.items())
+
+def reading_columns(columns):
+    """The timestamped readings of a scanned log, sorted by time."""
+    readings = np.flatnonzero((columns['type'] == READING) & (columns['time'] != NO_TIME))
+    order = readings[np.argsort(columns['time'][readings], kind='stable')]
+    return dict((name, values[order]) for name, values in columns.items())
+
+def interpolate(track, times, tolerance):
+    """Interpolates the track at sorted times.
+
+    A time is only matched when it lies between two fixes that are both within
+    tolerance seconds of it, otherwise lat, lon and alt are NaN.
+    """
+    track_time = track['time']
+    count = len(track_time)
+    position = dict((name, np.full(len(times), np.nan)) for name in ['lat', 'lon', 'alt'])
+    if count < 2:
+        return position, np.zeros(len(times), dtype=bool)
+
+    right = np.clip(np.searchsorted(track_time, times), 1, count - 1)
+    limit = int(tolerance * SECOND)
+    matched = (times >= track_time[0]) & (times <= track_time[-1]) & \
+        (times - track_time[right - 1] <= limit) & (track_time[right] - times <= limit)
+
+    left = right[matched] - 1
+    span = (track_time[left + 1] - track_time[left]).astype(np.float64)
+    weight = np.where(span > 0, (times[matched] - track_time[left]) / np.maximum(span, 1), 0.0)
+    for name in position:
+        values = track[name]
+        position[name][matched] = values[left] + (values[left + 1] - values[left]) * weight
+    return position, matched
+
+def offset_cost(readings, track, offset, tolerance):
+    position, matched = interpolate(track, readings['time'] + offset, tolerance)
+    distance = equirectangular_distance(position['lat'][matched], position['lon'][matched], readings['lat'][matched], readings['lon'][matched])
+    distance = np.minimum(distance, OFFSET_CAP)
+    return (np.nansum(distance) + OFFSET_CAP * (len(matched) - matched.sum())) / max(len(matched), 1)
+
+def clock_segments(times, gap=SEGMENT_GAP):
+    """(start, end) index ranges of sorted times, split wherever the clock moves on by more than gap seconds."""
+    if not len(times):
+        return []
+    breaks = (np.flatnonzero(np.diff(times) > int(gap * SECOND)) + 1).tolist()
+    return list(zip([0] + breaks, breaks + [len(times)]))
+
+def offset_differences(sample, track, radius=MATCH_RADIUS):
+    """Track time minus reading time for every track fix within radius meters of a logged position."""
+    projection = site_projection(track['lat'][0], track['lon'][0])
+    tree = cKDTree(np.column_stack(projection.to_local(track['lat'], track['lon'])))
+    points = np.column_stack(projection.to_local(sample['lat'], sample['lon']))
+    total = tree.query_ball_point(points, radius, return_length=True).sum()
+    if total > MAX_OFFSET_PAIRS:
+        # Hovering puts many fixes near each position, keep every nth reading to bound the pairs
+        every = int(np.ceil(total / float(MAX_OFFSET_PAIRS)))
+        warnings.warn("{} position matches within {} m, using 1 in {} readings".format(total, radius, every))
+        keep = np.arange(0, len(points), every)
+        points = points[keep]
+        sample = dict((name, values[keep]) for name, values in sample.items())
+    neighbours = tree.query_ball_point(points, radius)
+    counts = np.array([len(fixes) for fixes in neighbours], dtype=np.int64)
+    if not counts.sum():
+        return np.zeros(0, dtype=np.int64)
+    fixes = np.concatenate([np.asarray(fixes, dtype=np.int64) for fixes in neighbours])
+    return track['time'][fixes] - np.repeat(sample['time'], counts)
+
+def estimate_clock_offset(readings, track, tolerance=DEFAULT_TOLERANCE, step=1.0):
+    """Estimates the ns to add to the CO2 log clock to reach flight log (UTC) time.
+
+    The Dragonfly logs its own GPS position next to each reading. The time
+    differences between those positions and nearby track fixes are counted in
+    step wide bins, and the most common are scored by the capped distance
+    between the logged position and the flight track; unmatched samples count
+    as the cap. The best step is then refined to a tenth of a step. Without
+    logged positions the first reading is lined up with the first fix, and
+    None is returned when no logged position comes near the track.
+    """
+    located = np.isfinite(readings['lat']) & np.isfinite(readings['lon'])
+    if len(track['time']) < 2 or not located.any():
+        if len(track['time']) and len(readings['time']):
+            return int(track['time'][0] - readings['time'][0])
+        return 0
+
+    sample = np.flatnonzero(located)
+    sample = sample[np.linspace(0, len(sample) - 1, min(len(sample), OFFSET_SAMPLES)).astype(np.int64)]
+    sample = dict((name, readings[name][sample]) for name in ['time', 'lat', 'lon'])
+
+    stride = int(step * SECOND)
+    differences = offset_differences(sample, track)
+    if not len(differences):
+        return None
+    bins, counts = np.unique(differences // stride, return_counts=True)
+    common = bins[np.argsort(counts, kind='stable')[::-1][:OFFSET_CANDIDATES]]
+    # A true offset falling near a bin edge splits its matches across two bins
+    candidates = np.unique(np.concatenate([common - 1, common, common + 1])) * stride
+    costs = [offset_cost(sample, track, offset, tolerance) for offset in candidates]
+    best = candidates[int(np.argmin(costs))]
+
+    candidates = best + np.arange(-10, 11) * (stride // 10)
+    costs = [offset_cost(sample, track, offset, tolerance) for offset in candidates]
+    return int(candidates[int(np.argmin(costs))])
+
+def estimate_clock_offsets(readings, track, tolerance=DEFAULT_TOLERANCE, step=1.0):
+    """Estimates a clock offset for each segment of clock_segments, returned as (start, end, offset).
+
+    Segments with no logged position near the track are left unaligned, with offset None.
+    """
+    segments = []
+    for start, end in clock_segments(readings['time']):
+        segment = dict((name, values[start:end]) for name, values in readings.items())
+        offset = estimate_clock_offset(segment, track, tolerance, step)
+        if offset is None:
+            warnings.warn("No logged position within {} m of the flight track for readings {} to {}, leaving them unaligned".format(MATCH_RADIUS, start, end))
+        segments.append((start, end, offset))
+    return segments
+
+def segment_offsets(segments, count):
+    """The offset of each of count readings, NO_TIME for unaligned ones."""
+    offsets = np.full(count, NO_TIME, dtype=np.int64)
+    for start, end, offset in segments:
+        if offset is not None:
+            offsets[start:end] = offset
+    return offsets
+
+def asof_merge(readings, track, offset, tolerance=DEFAULT_TOLERANCE):
+    """Attaches the flight track position to each reading.
+
+    readings are the sorted reading columns, offset is added to their clock,
+    either one for all or one per reading from segment_offsets; readings with
+    a NO_TIME offset keep a NO_TIME time and are left unmatched. The
+    Dragonfly's own position is kept as log_lat, log_lon and log_alt and
+    matched marks readings that fell within tolerance seconds of the track.
+    """
+    aligned = np.broadcast_to(np.asarray(offset) != NO_TIME, readings['time'].shape)
+    times = np.where(aligned, readings['time'] + np.where(aligned, offset, 0), NO_TIME)
+    position, matched = interpolate(track, times, tolerance)
+    matched &= aligned
+    return {
+        'time': times,
+        'co2': readings['co2'],
+        'lat': position['lat'],
+        'lon': position['lon'],
+        'alt': position['alt'],
+        'log_lat': readings['lat'],
+        'log_lon': readings['lon'],
+        'log_alt': readings['alt'],
+        'line': readings['line'],
+        'matched': matched
+    }
+
+def merge_drone(co2_directory, flight_directory, skip_zeroing=False, offset=None, tolerance=DEFAULT_TOLERANCE):
+    """Merges a drone's rotated CO2 log set with the .bin logs of its flight controller.
+
+    Returns the merged columns and the (start, end, offset) of each clock
+    segment, offset in ns. When offset is None it is estimated per segment,
+    otherwise it applies to all the readings.
+    """
+    readings = reading_columns(scan_rotated_log(co2_directory, skip_zeroing))
+    track = flight_track(sorted(glob.glob(os.path.join(flight_directory, '*.bin'))))
+    if offset is None:
+        segments = estimate_clock_offsets(readings, track, tolerance)
+    else:
+        segments = [(0, len(readings['time']), offset)]
+    return asof_merge(readings, track, segment_offsets(segments, len(readings['time'])), tolerance), segments
+
+def writecsv(columns, output):
+    matched = columns['matched']
+    readings = readings_from_columns(dict((name, values[matched]) for name, values in columns.items()))
+    with open(output, 'w') as outputFile:
+        outputFile.write("{},{},{},{},{}\n".format("time", "co2", "lat", "lon", "alt"))
+        for reading in readings:
+            outputFile.write("{},{},{},{},{}\n".format(reading.time, reading.value, reading.lat, reading.lon, reading.alt))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = 'Merge Dragonfly CO2 logs with flight controller GPS')
+    parser.add_argument('--co2', type=str, help='Directory holding the rotated run.log set.')
+    parser.add_argument('--flight', type=str, help='Directory holding the flight controller .bin logs.')
+    parser.add_argument('--output', type=str, help='Output CSV file.')
+    parser.add_argument('--offset', type=float, help='Seconds to add to the CO2 log clock, estimated when missing.', default=None)
+    parser.add_argument('--tolerance', type=float, help='Largest gap in seconds to a GPS fix.', default=DEFAULT_TOLERANCE)
+    parser.add_argument('--skip-zeroing', action='store_true', help='Mark readings taken while zeroing.')
+    args = parser.parse_args()
+
+    offset = None if args.offset is None else int(args.offset * SECOND)
+    columns, segments = merge_drone(args.co2, args.flight, args.skip_zeroing, offset, args.tolerance)
+    for start, end, offset in segments:
+        matched = columns['matched'][start:end].sum()
+        if offset is None:
+            print("Readings {} to {}: unaligned".format(start, end))
+        else:
+            print("Readings {} to {}: clock offset {:.1f} s, {} matched".format(start, end, offset / float(SECOND), matched))
+    writecsv(columns, args.output)
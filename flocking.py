@@ -5,10 +5,11 @@ import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
 from sklearn.linear_model import LinearRegression
-from pykrige.ok import OrdinaryKriging
+from kriging import krige_grid
 from VirtualPlume import dotdict
 from matplotlib.colors import LinearSegmentedColormap
 from matplotlib.patches import Rectangle
+from projection import equirectangular_distance, meters_to_longitude
 
 PARTITIONS = 10
 
@@ -68,8 +69,7 @@ def addRuler(plt, ax, length):
     upperright = [plt.xlim()[1], plt.ylim()[1]]
 
     # Calculate width by latitide
-    earthCircumference = 40008000
-    width = abs(1.0 * length / ((earthCircumference / 360) * math.cos(lowerleft[1] * 0.01745)))
+    width = abs(float(meters_to_longitude(length, lowerleft[1])))
     height = (upperright[1] - lowerleft[1]) * 0.018
 
     location = [plt.xlim()[0] + (plt.xlim()[1] - plt.xlim()[0]) *.95 - length, plt.ylim()[0] + (plt.ylim()[1] - plt.ylim()[0]) *.03]
@@ -79,7 +79,7 @@ def addRuler(plt, ax, length):
     ax.annotate("0", xy=(location[0], location[1] + (1.5 * height)), ha='center')
     ax.annotate("{} m".format(length), xy=(location[0] + width, location[1] + (1.5 * height)), ha='center')
 
-def heatmap(data, fig, ax, nlags):
+def heatmap(data, fig, ax, nlags, cell=None, engine=None):
     # get colormap
     ncolors = 256
     reds_color_array = plt.get_cmap('Reds')(range(ncolors))
@@ -105,8 +105,7 @@ def heatmap(data, fig, ax, nlags):
     grid_lon = np.arange(np.amin(lons) - 0.00002, np.amax(lons) + 0.00002, grid_space) #grid_space is the desired delta/step of the output array
     grid_lat = np.arange(np.amin(lats) - 0.00002, np.amax(lats) + 0.00001, grid_space)
 
-    OK = OrdinaryKriging(lons, lats, data, variogram_model='gaussian', verbose=True, nlags=nlags)
-    z1, ss1 = OK.execute('grid', grid_lon, grid_lat)
+    z1, ss1 = krige_grid(lons, lats, data, grid_lon, grid_lat, nlags, variogram_model='gaussian', cell=cell, engine=engine)
 
     xintrp, yintrp = np.meshgrid(grid_lon, grid_lat)
 
@@ -119,14 +118,12 @@ def heatmap(data, fig, ax, nlags):
     cbar.ax.set_ylabel('$CO_2$ (ppm)')
 
 def distance(one, two):
-    earthCircumference = 40008000
-    dx = (one.lon - two.lon) * (earthCircumference / 360) * math.cos(one.lat * 0.01745)
-    dy = (one.lat - two.lat) * (earthCircumference / 360)
-
-    return math.sqrt((dx * dx) + (dy * dy))
+    return float(equirectangular_distance(one.lat, one.lon, two.lat, two.lon))
 
 def distanceList(one, two):
-    return [distance(tuple[0], tuple[1]) for tuple in zip(one, two)]
+    count = min(len(one), len(two))
+    return list(equirectangular_distance([d.lat for d in one[:count]], [d.lon for d in one[:count]],
+                                         [d.lat for d in two[:count]], [d.lon for d in two[:count]]))
 
 def timeList(data):
     # return [d.time for d in data]
@@ -5,10 +5,11 @@ import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
 from sklearn.linear_model import LinearRegression
-from pykrige.ok import OrdinaryKriging
+from kriging import krige_grid
 from VirtualPlume import dotdict
 from matplotlib.colors import LinearSegmentedColormap
 from matplotlib.patches import Rectangle
+from projection import meters_to_longitude
 
 PARTITIONS = 10
 
@@ -65,7 +66,7 @@ def linearRegressionNormal(readingPositions):
         "y": model.coef_[1]
     })
 
-def heatmap(data, fig, ax, nlags):
+def heatmap(data, fig, ax, nlags, cell=None, engine=None):
     # get colormap
     ncolors = 256
     reds_color_array = plt.get_cmap('Reds')(range(ncolors))
@@ -91,8 +92,7 @@ def heatmap(data, fig, ax, nlags):
     grid_lon = np.arange(np.amin(lons) - 0.0003, np.amax(lons) + 0.0003, grid_space) #grid_space is the desired delta/step of the output array
     grid_lat = np.arange(np.amin(lats) - 0.0003, np.amax(lats) + 0.001, grid_space)
 
-    OK = OrdinaryKriging(lons, lats, data, variogram_model='gaussian', verbose=True, nlags=nlags)
-    z1, ss1 = OK.execute('grid', grid_lon, grid_lat)
+    z1, ss1 = krige_grid(lons, lats, data, grid_lon, grid_lat, nlags, variogram_model='gaussian', cell=cell, engine=engine)
 
     xintrp, yintrp = np.meshgrid(grid_lon, grid_lat)
 
@@ -111,8 +111,7 @@ def addRuler(plt, ax, length):
 
 
     # Calculate width by latitide
-    earthCircumference = 40008000
-    width = abs(1.0 * length / ((earthCircumference / 360) * math.cos(lowerleft[1] * 0.01745)))
+    width = abs(float(meters_to_longitude(length, lowerleft[1])))
     height = (upperright[1] - lowerleft[1]) * 0.018
 
     location = [plt.xlim()[1] - (plt.xlim()[1] - plt.xlim()[0]) *.05 - width, plt.ylim()[0] + (plt.ylim()[1] - plt.ylim()[0]) *.03]
@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+
+import numpy as np
+from scipy.spatial import ConvexHull, Delaunay, cKDTree
+
+try:
+    from .projection import site_projection
+except (ImportError, ValueError):
+    from projection import site_projection
+
+MASKS = ['convex', 'concave', 'buffer']
+# Longest triangle side in meters kept by the concave mask and the track buffer in meters
+CONCAVE_EDGE = 10.0
+TRACK_BUFFER = 3.0
+
+def grid_cells(grid_lon, grid_lat, mask=None):
+    """Centers of the grid cells kept by mask as (lon, lat) rows, their flat indices and the grid shape."""
+    xintrp, yintrp = np.meshgrid(grid_lon, grid_lat)
+    cells = np.column_stack((xintrp.ravel(), yintrp.ravel()))
+    inside = np.arange(len(cells)) if mask is None else np.flatnonzero(mask)
+    return cells[inside], inside, xintrp.shape
+
+def fill_grid(values, inside, shape):
+    """Spreads the values of the cells at inside over a grid of shape, NaN elsewhere."""
+    grid = np.full(shape[0] * shape[1], np.nan)
+    grid[inside] = values
+    return grid.reshape(shape)
+
+def grid_arrays(lons, lats, data, grid_lon, grid_lat, mask=None):
+    """The arrays an interpolated grid is cached by."""
+    return [lons, lats, data, grid_lon, grid_lat] + ([] if mask is None else [np.asarray(mask, dtype=bool)])
+
+def points_in_polygon(x, y, polygon):
+    """Which of the points lie inside polygon, an (n, 2) array of vertices, by even-odd ray casting."""
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    polygon = np.asarray(polygon, dtype=np.float64)
+    inside = np.zeros(x.shape, dtype=bool)
+    for (x1, y1), (x2, y2) in zip(polygon, np.roll(polygon, -1, axis=0)):
+        crosses = (y1 > y) != (y2 > y)
+        if y1 != y2:
+            crosses &= x < x1 + (y - y1) * (x2 - x1) / (y2 - y1)
+        inside ^= crosses
+    return inside
+
+def convex_hull(lons, lats):
+    """Vertices of the convex hull around the samples, in order."""
+    points = np.column_stack((lons, lats))
+    try:
+        return points[ConvexHull(points).vertices]
+    except (RuntimeError, ValueError):
+        # QhullError, fewer than three points or all of them on a line
+        return points
+
+def polygon_mask(polygon, grid_lon, grid_lat):
+    xintrp, yintrp = np.meshgrid(grid_lon, grid_lat)
+    return points_in_polygon(xintrp, yintrp, polygon)
+
+def local_meters(lons, lats, origin):
+    east, north = site_projection(origin[0], origin[1]).to_local(lats, lons)
+    return np.column_stack((east, north))
+
+def concave_mask(lons, lats, grid_lon, grid_lat, max_edge=CONCAVE_EDGE):
+    """Cells inside the Delaunay triangles of the samples whose sides are all shorter than max_edge meters."""
+    origin = (lats[0], lons[0])
+    points = local_meters(lons, lats, origin)
+    try:
+        triangulation = Delaunay(points)
+    except (RuntimeError, ValueError):
+        return np.zeros((len(grid_lat), len(grid_lon)), dtype=bool)
+    corners = points[triangulation.simplices]
+    sides = np.sqrt(((corners - np.roll(corners, 1, axis=1)) ** 2).sum(axis=-1))
+    kept = np.append(sides.max(axis=1) <= max_edge, False)
+
+    xintrp, yintrp = np.meshgrid(grid_lon, grid_lat)
+    # find_simplex gives -1 outside the triangulation, which picks the False on the end
+    return kept[triangulation.find_simplex(local_meters(xintrp.ravel(), yintrp.ravel(), origin))].reshape(xintrp.shape)
+
+def buffer_mask(lons, lats, grid_lon, grid_lat, buffer=TRACK_BUFFER):
+    """Cells within buffer meters of a sample."""
+    origin = (lats[0], lons[0])
+    xintrp, yintrp = np.meshgrid(grid_lon, grid_lat)
+    distance = cKDTree(local_meters(lons, lats, origin)).query(local_meters(xintrp.ravel(), yintrp.ravel(), origin), distance_upper_bound=buffer)[0]
+    return np.isfinite(distance).reshape(xintrp.shape)
+
+def survey_mask(lons, lats, grid_lon, grid_lat, method='convex', size=None):
+    """Boolean grid of the cells the survey covers, True to interpolate and draw.
+
+    method is convex for the convex hull of the samples, concave for their
+    triangulation without sides over size meters, or buffer for the cells
+    within size meters of the track. The convex hull works in any units,
+    the others take lon/lat samples.
+    """
+    lons = np.asarray(lons, dtype=np.float64)
+    lats = np.asarray(lats, dtype=np.float64)
+    if method == 'convex':
+        return polygon_mask(convex_hull(lons, lats), grid_lon, grid_lat)
+    if method == 'concave':
+        return concave_mask(lons, lats, grid_lon, grid_lat, CONCAVE_EDGE if size is None else size)
+    if method == 'buffer':
+        return buffer_mask(lons, lats, grid_lon, grid_lat, TRACK_BUFFER if size is None else size)
+    raise ValueError("Unknown mask {}, expected one of {}".format(method, ", ".join(MASKS)))
@@ -4,12 +4,14 @@
 import argparse, datetime
 import numpy as np
 import pandas as pd
-from pykrige.ok import OrdinaryKriging
+from binning import reduction
+from gridmask import MASKS
+from kriging import ENGINES, KRIGING_ENGINES, binned, krige_grid, timings
 import matplotlib.pyplot as plt
 from matplotlib.colors import LinearSegmentedColormap
 from operator import itemgetter
 
-def heatmap(input, output, start, end, nlags):
+def heatmap(input, output, start, end, nlags, cell=None, resolution=100, workers=None, engine=None, mask=None):
 
     df=pd.read_csv(input, ", ")
 
@@ -30,12 +32,15 @@ def heatmap(input, output, start, end, nlags):
 
     print "{} {}".format((max(lons) - min(lons)), (max(lats) - min(lats)))
 
-    grid_space = (max(lats) - min(lats)) / 100
+    grid_space = (max(lats) - min(lats)) / resolution
     grid_lon = np.arange(np.amin(lons) - 0.000002, np.amax(lons) + 0.000002, grid_space) #grid_space is the desired delta/step of the output array
     grid_lat = np.arange(np.amin(lats) - 0.000002, np.amax(lats) + 0.000002, grid_space)
 
-    OK = OrdinaryKriging(lons, lats, data, variogram_model='linear', verbose=True, nlags=nlags)
-    z1, ss1 = OK.execute('grid', grid_lon, grid_lat)
+    z1, ss1 = krige_grid(lons, lats, data, grid_lon, grid_lat, nlags, variogram_model='linear', cell=cell, engine=engine, workers=workers, mask=mask)
+    if cell is not None:
+        print reduction(binned['readings'], binned['cells'])
+    for name, seconds in timings.items():
+        print "Interpolated with {} in {:.2f} s".format(name, seconds)
 
     xintrp, yintrp = np.meshgrid(grid_lon, grid_lat)
     fig, ax = plt.subplots(figsize=(6, 4))
@@ -83,7 +88,14 @@ if __name__ == '__main__':
     parser.add_argument('--start', type=int, help='dataset starting index', default=None)
     parser.add_argument('--end', type=int, help='dataset ending index', default=None)
     parser.add_argument('--nlags', type=int, help='dataset ending index', default=6)
+    parser.add_argument('--cell', type=float, help='Average readings over cells of this many meters before kriging.', default=None)
+    parser.add_argument('--resolution', type=int, help='Grid steps across the latitude range.', default=100)
+    parser.add_argument('--engine', type=str, help='Interpolation engine, ordinary kriging by default.', default=None, choices=sorted(ENGINES))
+    parser.add_argument('--workers', type=int, help='Krige the grid in tiles across this many processes, 0 for one per core.', default=None)
+    parser.add_argument('--mask', type=str, help='Only interpolate and draw the cells inside this outline of the survey.', default=None, choices=MASKS)
 
     args = parser.parse_args()
+    if args.workers is not None and args.engine not in [None] + KRIGING_ENGINES:
+        parser.error("--workers tiles the kriging engines ({}), not {}".format(", ".join(KRIGING_ENGINES), args.engine))
 
-    heatmap(args.input, args.output, args.start, args.end, args.nlags)
+    heatmap(args.input, args.output, args.start, args.end, args.nlags, args.cell, args.resolution, args.workers, args.engine, args.mask)
@@ -4,9 +4,9 @@
 import argparse, datetime
 import numpy as np
 import pandas as pd
-import math
 import glob
-from pykrige.ok import OrdinaryKriging
+from gridmask import polygon_mask
+from kriging import krige_grid
 from matplotlib.patches import Polygon
 from pykrige.kriging_tools import write_asc_grid
 import pykrige.kriging_tools as kt
@@ -18,6 +18,7 @@ from operator import itemgetter
 from matplotlib.patches import Rectangle
 import matplotlib.patheffects as path_effects
 import matplotlib.ticker as ticker
+from projection import meters_to_longitude
 
 # datetime.datetime.strptime("{} {}".format(lineparts[0], lineparts[1]), '%Y-%m-%d %H:%M:%S.%f')
 
@@ -46,8 +47,7 @@ def addRuler(plt, ax, length, height_scale):
     upperright = [plt.xlim()[1], plt.ylim()[1]]
 
     # Calculate width by latitide
-    earthCircumference = 40008000
-    width = abs(1.0 * length / ((earthCircumference / 360) * math.cos(lowerleft[1] * 0.01745)))
+    width = abs(float(meters_to_longitude(length, lowerleft[1])))
     height = (upperright[1] - lowerleft[1]) * 0.018 * height_scale
 
     location = [plt.xlim()[0] + (plt.xlim()[1] - plt.xlim()[0]) *.05, plt.ylim()[1] - ((plt.ylim()[1] - plt.ylim()[0]) *(.1 + (height_scale * .02)))]
@@ -57,7 +57,7 @@ def addRuler(plt, ax, length, height_scale):
     ax.annotate("0", xy=(location[0], location[1] + (1.5 * height)), ha='center', fontsize = 10 + (5 * height_scale))
     ax.annotate("{} m".format(length), xy=(location[0] + width, location[1] + (1.5 * height)), ha='center', fontsize = 10 + (5 * height_scale))
 
-def heatmap(input, output, include_map, heatmap_alpha, nlags, draw_path, draw_legend, grid_margin = 0, iso_line_width = 1.8, ruler_length = 10, ruler_size = 1, offset = [0,0], clip_boundary = True, countour_res = 20, latrange = [35.82575, 35.8260], lonrange = [-106.65565, -106.65515], disable_kriging = False):
+def heatmap(input, output, include_map, heatmap_alpha, nlags, draw_path, draw_legend, grid_margin = 0, iso_line_width = 1.8, ruler_length = 10, ruler_size = 1, offset = [0,0], clip_boundary = True, countour_res = 20, latrange = [35.82575, 35.8260], lonrange = [-106.65565, -106.65515], disable_kriging = False, cell = None, engine = None):
 
     # get colormap
     ncolors = 256
@@ -89,9 +89,14 @@ def heatmap(input, output, include_map, heatmap_alpha, nlags, draw_path, draw_le
     grid_lon = np.arange(np.amin(lons) - grid_margin, np.amax(lons) + grid_margin, grid_space) #grid_space is the desired delta/step of the output array
     grid_lat = np.arange(np.amin(lats) - grid_margin, np.amax(lats) + grid_margin, grid_space)
 
+    mask = None
+    if clip_boundary:
+        # clip contours by polygon, only kriging the cells inside it
+        clip_vertices = [minLat(lats, lons), minLon(lats, lons), maxLat(lats, lons), maxLon(lats, lons)]
+        mask = polygon_mask(clip_vertices, grid_lon, grid_lat)
+
     if not disable_kriging:
-        OK = OrdinaryKriging(lons, lats, data, variogram_model='gaussian', verbose=True, nlags=nlags)
-        z1, ss1 = OK.execute('grid', grid_lon, grid_lat)
+        z1, ss1 = krige_grid(lons, lats, data, grid_lon, grid_lat, nlags, variogram_model='gaussian', cell=cell, engine=engine, mask=mask)
 
     xintrp, yintrp = np.meshgrid(grid_lon, grid_lat)
     fig, ax = plt.subplots(figsize=(10,4))
@@ -125,8 +130,6 @@ def heatmap(input, output, include_map, heatmap_alpha, nlags, draw_path, draw_le
     # ax.clabel(cs_lines, fontsize=9, inline=True)
 
     if clip_boundary:
-        # clip contours by polygon
-        clip_vertices = [minLat(lats, lons), minLon(lats, lons), maxLat(lats, lons), maxLon(lats, lons)]
         if not disable_kriging:
             clip_map = Polygon(list(clip_vertices),fc='none',ec='k')
             ax.add_patch(clip_map)
@@ -5,7 +5,7 @@ import argparse, datetime
 import numpy as np
 import pandas as pd
 import glob
-from pykrige.ok import OrdinaryKriging
+from kriging import krige_grid
 from matplotlib.patches import Polygon
 from pykrige.kriging_tools import write_asc_grid
 import pykrige.kriging_tools as kt
@@ -37,7 +37,7 @@ def maxLon(lats, lons):
 
     return [lons[maxIndex] + 0.000005, lats[maxIndex] - 0.000005]
 
-def heatmap(input, output, nlags):
+def heatmap(input, output, nlags, cell=None, engine=None):
 
     # get colormap
     ncolors = 256
@@ -66,8 +66,7 @@ def heatmap(input, output, nlags):
     grid_lon = np.arange(np.amin(lons), np.amax(lons), grid_space) #grid_space is the desired delta/step of the output array
     grid_lat = np.arange(np.amin(lats), np.amax(lats), grid_space)
 
-    OK = OrdinaryKriging(lons, lats, data, variogram_model='gaussian', verbose=True, nlags=nlags)
-    z1, ss1 = OK.execute('grid', grid_lon, grid_lat)
+    z1, ss1 = krige_grid(lons, lats, data, grid_lon, grid_lat, nlags, variogram_model='gaussian', cell=cell, engine=engine)
 
     xintrp, yintrp = np.meshgrid(grid_lon, grid_lat)
     fig, ax = plt.subplots(figsize=(12,4))
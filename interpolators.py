@@ -0,0 +1,144 @@
+#!/usr/bin/env python
+
+import numpy as np
+from scipy.linalg import cho_factor, cho_solve
+from scipy.spatial import cKDTree
+
+try:
+    from scipy.interpolate import RBFInterpolator
+except ImportError:
+    RBFInterpolator = None
+
+try:
+    from .gridmask import fill_grid, grid_arrays, grid_cells
+    from .parsecache import cached_grid
+    from .variogram import fit_variogram
+except (ImportError, ValueError):
+    from gridmask import fill_grid, grid_arrays, grid_cells
+    from parsecache import cached_grid
+    from variogram import fit_variogram
+
+IDW_NEIGHBOURS = 12
+IDW_POWER = 2.0
+RBF_NEIGHBOURS = 32
+# Thin plate splines overshoot wildly between neighbourhoods of near repeated positions
+RBF_KERNEL = 'linear'
+GP_INDUCING = 300
+# Samples or cells held against the inducing points at once
+GP_BATCH = 4096
+EPSILON = 1e-10
+# Smoothing for the rbf engine, repeated positions make the plain interpolant singular
+RBF_SMOOTHING = 0.1
+# Share of the mean diagonal added to keep the Cholesky factors of the gp engine stable
+JITTER = 1e-8
+
+def neighbour_spread(values, weights):
+    """Weighted variance of each cell's neighbour values, the ss1 of the non kriging engines."""
+    mean = (weights * values).sum(axis=1)
+    return (weights * (values - mean[:, None]) ** 2).sum(axis=1)
+
+def idw(lons, lats, data, grid_lon, grid_lat, mask=None, neighbours=IDW_NEIGHBOURS, power=IDW_POWER):
+    """Inverse distance weighting of each cell's nearest samples, returning z1 and their weighted spread as ss1.
+
+    Only the cells mask is True for are evaluated, the rest are NaN.
+    """
+    def compute():
+        cells, inside, shape = grid_cells(grid_lon, grid_lat, mask)
+        k = min(neighbours, len(data))
+        distance, index = cKDTree(np.column_stack((lons, lats))).query(cells, k)
+        if k == 1:
+            distance, index = distance[:, None], index[:, None]
+        exact = distance <= EPSILON
+        weights = np.where(exact.any(axis=1)[:, None], exact.astype(np.float64), 1.0 / np.maximum(distance, EPSILON) ** power)
+        weights /= weights.sum(axis=1)[:, None]
+        values = data[index]
+        return {'z1': fill_grid((weights * values).sum(axis=1), inside, shape), 'ss1': fill_grid(neighbour_spread(values, weights), inside, shape)}
+
+    result = cached_grid('idw', grid_arrays(lons, lats, data, grid_lon, grid_lat, mask), {'neighbours': neighbours, 'power': power}, compute)
+    return result['z1'], result['ss1']
+
+def local_rbf(lons, lats, data, grid_lon, grid_lat, mask=None, neighbours=RBF_NEIGHBOURS, kernel=RBF_KERNEL, smoothing=RBF_SMOOTHING):
+    """Radial basis function interpolation from each cell's nearest samples.
+
+    Positions are scaled by the larger side of their bounding box, which
+    keeps the aspect and the systems well conditioned. Repeated positions,
+    which hovering leaves plenty of, need the default smoothing above zero.
+    ss1 is the spread of the nearest samples, weighted by inverse distance.
+    """
+    if RBFInterpolator is None:
+        raise ImportError('The rbf engine requires scipy 1.7 or newer')
+
+    def compute():
+        points = np.column_stack((lons, lats))
+        origin = points.min(axis=0)
+        scale = max(np.ptp(points, axis=0).max(), EPSILON)
+        cells, inside, shape = grid_cells(grid_lon, grid_lat, mask)
+        k = min(neighbours, len(data))
+        interpolator = RBFInterpolator((points - origin) / scale, data, neighbors=k, kernel=kernel, smoothing=smoothing)
+        z1 = interpolator((cells - origin) / scale)
+
+        distance, index = cKDTree(points).query(cells, k)
+        if k == 1:
+            distance, index = distance[:, None], index[:, None]
+        weights = 1.0 / np.maximum(distance, EPSILON)
+        weights /= weights.sum(axis=1)[:, None]
+        return {'z1': fill_grid(z1, inside, shape), 'ss1': fill_grid(neighbour_spread(data[index], weights), inside, shape)}
+
+    result = cached_grid('local_rbf', grid_arrays(lons, lats, data, grid_lon, grid_lat, mask), {'neighbours': neighbours, 'kernel': kernel, 'smoothing': smoothing}, compute)
+    return result['z1'], result['ss1']
+
+def stable_cholesky(matrix):
+    return cho_factor(matrix + JITTER * np.mean(np.diag(matrix)) * np.eye(len(matrix)), lower=True)
+
+def sparse_gp(lons, lats, data, grid_lon, grid_lat, mask=None, nlags=6, inducing=GP_INDUCING):
+    """Gaussian process regression through inducing points, returning the predictive mean and variance.
+
+    The squared exponential covariance and noise come from the gaussian
+    variogram fitted to the samples, its partial sill, range and nugget.
+    inducing samples spread evenly along the flight stand in for the rest
+    (the deterministic training conditional), so the cost is linear in the
+    number of samples. Without a partial sill to model, as with constant
+    data or one or two samples, z1 is the mean of the samples and ss1
+    the nugget.
+    """
+    def compute():
+        variogram = fit_variogram(lons, lats, data, 'gaussian', nlags)
+        psill, range_, nugget = variogram.parameters
+        # pykrige's gaussian variogram reaches 95% of its sill at range
+        length = max(range_ * 4.0 / 7.0, EPSILON)
+        noise = max(nugget, EPSILON * max(psill, 1.0))
+        cells, inside, shape = grid_cells(grid_lon, grid_lat, mask)
+        if psill <= 0:
+            # No spatial variation to fit, from constant data or too few samples for two lags
+            return {'z1': fill_grid(np.full(len(cells), data.mean()), inside, shape), 'ss1': fill_grid(np.full(len(cells), nugget), inside, shape)}
+
+        def covariance(first, second):
+            squared = ((first[:, None, :] - second[None, :, :]) ** 2).sum(axis=-1)
+            return psill * np.exp(-squared / (length * length))
+
+        points = np.column_stack((lons, lats))
+        chosen = points[np.linspace(0, len(data) - 1, min(inducing, len(data))).astype(np.int64)]
+        mean = data.mean()
+        kuu = covariance(chosen, chosen)
+        gram = np.zeros(kuu.shape)
+        projected = np.zeros(len(chosen))
+        for start in range(0, len(data), GP_BATCH):
+            kuf = covariance(chosen, points[start:start + GP_BATCH])
+            gram += np.dot(kuf, kuf.T)
+            projected += np.dot(kuf, data[start:start + GP_BATCH] - mean)
+        sigma = stable_cholesky(noise * kuu + gram)
+        weights = cho_solve(sigma, projected)
+        kuu_factor = stable_cholesky(kuu)
+
+        z1 = np.zeros(len(cells))
+        ss1 = np.zeros(len(cells))
+        for start in range(0, len(cells), GP_BATCH):
+            kus = covariance(chosen, cells[start:start + GP_BATCH])
+            z1[start:start + GP_BATCH] = mean + np.dot(kus.T, weights)
+            explained = (kus * cho_solve(kuu_factor, kus)).sum(axis=0)
+            uncertain = noise * (kus * cho_solve(sigma, kus)).sum(axis=0)
+            ss1[start:start + GP_BATCH] = np.maximum(psill - explained + uncertain, 0.0)
+        return {'z1': fill_grid(z1, inside, shape), 'ss1': fill_grid(ss1, inside, shape)}
+
+    result = cached_grid('sparse_gp', grid_arrays(lons, lats, data, grid_lon, grid_lat, mask), {'nlags': nlags, 'inducing': inducing}, compute)
+    return result['z1'], result['ss1']
@@ -0,0 +1,473 @@
+#!/usr/bin/env python
+
+import os, time, warnings
+import numpy as np
+from pykrige.ok import OrdinaryKriging
+from scipy.spatial import cKDTree
+from scipy.spatial.distance import cdist
+
+try:
+    from concurrent.futures import ProcessPoolExecutor
+    from multiprocessing import shared_memory
+except ImportError:
+    ProcessPoolExecutor = None
+    shared_memory = None
+
+# The standalone scripts import these modules from outside the package, so each falls back to absolute imports
+try:
+    from .binning import bin_samples
+    from .gridmask import fill_grid, grid_arrays, grid_cells, survey_mask
+    from .interpolators import idw, local_rbf, sparse_gp
+    from .parsecache import cached_grid
+    from .variogram import Variogram, fit_variogram, floor_nugget
+except (ImportError, ValueError):
+    from binning import bin_samples
+    from gridmask import fill_grid, grid_arrays, grid_cells, survey_mask
+    from interpolators import idw, local_rbf, sparse_gp
+    from parsecache import cached_grid
+    from variogram import Variogram, fit_variogram, floor_nugget
+
+# Samples per cell of the local engine
+LOCAL_NEIGHBOURS = 32
+# Bytes of working arrays a batch of local kriging systems may take, and bytes per entry of a system
+LOCAL_BYTES = 64 << 20
+SYSTEM_BYTES = 40
+EPSILON = 1e-10
+# Bytes of working arrays a tile of grid rows may take
+TILE_BYTES = 64 << 20
+# Readings the incremental engine fits its variogram to, refitting on every batch until that many arrive
+FIT_SAMPLES = 2000
+
+def as_arrays(*arrays):
+    return [np.asarray(array, dtype=np.float64) for array in arrays]
+
+def grid_axes(lons, lats, resolution=40, margin=0.00002):
+    """grid_lon and grid_lat spanning the samples plus margin, in resolution steps across each range."""
+    lon_space = (np.amax(lons) - np.amin(lons)) / resolution
+    lat_space = (np.amax(lats) - np.amin(lats)) / resolution
+    grid_lon = np.arange(np.amin(lons) - margin, np.amax(lons) + margin, lon_space)
+    grid_lat = np.arange(np.amin(lats) - margin, np.amax(lats) + margin, lat_space)
+    return grid_lon, grid_lat
+
+def model_variogram(lons, lats, data, nlags=6, variogram_model='linear', variogram_parameters=None):
+    """The Variogram to krige with.
+
+    variogram_parameters may be a Variogram, such as one fitted earlier for
+    the site, or parameters in the form OrdinaryKriging takes. Without them
+    the model is fitted to the cached empirical variogram of the samples.
+    """
+    if isinstance(variogram_parameters, Variogram):
+        return variogram_parameters
+    if variogram_parameters is not None:
+        return Variogram.from_parameters(variogram_model, variogram_parameters)
+    return fit_variogram(lons, lats, data, variogram_model, nlags)
+
+def variogram_options(nlags, variogram_model, variogram_parameters):
+    if isinstance(variogram_parameters, Variogram):
+        variogram_parameters = variogram_parameters.to_dict()
+    return {
+        'nlags': nlags,
+        'variogram_model': variogram_model,
+        'variogram_parameters': variogram_parameters
+    }
+
+def ordinary_kriging(lons, lats, data, grid_lon, grid_lat, nlags=6, variogram_model='linear', variogram_parameters=None, mask=None):
+    """Ordinary kriging of data over the grid_lon x grid_lat grid, returning z1 and the ss1 variance.
+
+    Given a boolean mask of the grid, only the cells it is True for are
+    kriged and the rest are NaN. Results are cached on disk by the content
+    of the samples and the grid together with the variogram settings, so a
+    figure can be redrawn without solving the system again.
+    """
+    lons, lats, data, grid_lon, grid_lat = as_arrays(lons, lats, data, grid_lon, grid_lat)
+
+    def compute():
+        variogram = model_variogram(lons, lats, data, nlags, variogram_model, variogram_parameters)
+        OK = OrdinaryKriging(lons, lats, data, variogram_model=variogram.model, variogram_parameters=variogram.pykrige_parameters(), nlags=nlags)
+        if mask is None:
+            z1, ss1 = OK.execute('grid', grid_lon, grid_lat)
+            return {'z1': np.ma.getdata(z1), 'ss1': np.ma.getdata(ss1)}
+        cells, inside, shape = grid_cells(grid_lon, grid_lat, mask)
+        z1, ss1 = OK.execute('points', cells[:, 0], cells[:, 1])
+        return {'z1': fill_grid(np.ma.getdata(z1), inside, shape), 'ss1': fill_grid(np.ma.getdata(ss1), inside, shape)}
+
+    options = variogram_options(nlags, variogram_model, variogram_parameters)
+    result = cached_grid('ordinary_kriging', grid_arrays(lons, lats, data, grid_lon, grid_lat, mask), options, compute)
+    return result['z1'], result['ss1']
+
+def local_batch(k):
+    """Cells whose (k + 1) square kriging systems are solved together within LOCAL_BYTES."""
+    return max(1, LOCAL_BYTES // (SYSTEM_BYTES * (k + 1) * (k + 1)))
+
+def solve_neighbourhoods(points, values, index, distance, variogram):
+    """Kriged values and variances of cells from the samples at index, distance away from each.
+
+    Every cell gets the (k + 1) square ordinary kriging system of its k
+    neighbours, built and solved for the whole batch at once.
+    """
+    count, k = index.shape
+    local = points[index]
+    pairs = np.sqrt(((local[:, :, None, :] - local[:, None, :, :]) ** 2).sum(axis=-1))
+    a = np.zeros((count, k + 1, k + 1))
+    a[:, :k, :k] = -variogram(pairs)
+    a[:, np.arange(k), np.arange(k)] = 0.0
+    a[:, k, :k] = 1.0
+    a[:, :k, k] = 1.0
+
+    b = np.zeros((count, k + 1))
+    b[:, :k] = np.where(distance <= EPSILON, 0.0, -variogram(distance))
+    b[:, k] = 1.0
+
+    try:
+        x = np.linalg.solve(a, b[:, :, None])[:, :, 0]
+    except np.linalg.LinAlgError:
+        # Repeated sample positions, hovering leaves plenty of them
+        x = np.matmul(np.linalg.pinv(a), b[:, :, None])[:, :, 0]
+    return (x[:, :k] * values[index]).sum(axis=1), (x * -b).sum(axis=1)
+
+def solve_cells(points, values, tree, cells, variogram, neighbours):
+    """Kriged values and variances at cells, each from its nearest samples."""
+    distance, index = tree.query(cells, neighbours)
+    if neighbours == 1:
+        distance, index = distance[:, None], index[:, None]
+    return solve_neighbourhoods(points, values, index, distance, variogram)
+
+def local_kriging(lons, lats, data, grid_lon, grid_lat, nlags=6, variogram_model='linear', variogram_parameters=None, mask=None, neighbours=LOCAL_NEIGHBOURS):
+    """Moving window ordinary kriging over the grid_lon x grid_lat grid, returning z1 and ss1.
+
+    Each cell is kriged from its neighbours nearest samples, found through a
+    KD-tree in the same lon/lat units as ordinary_kriging, so the cost grows
+    with the number of cells rather than the cube of the number of samples.
+    The variogram comes from model_variogram. Only the cells a mask is True
+    for are kriged.
+    """
+    lons, lats, data, grid_lon, grid_lat = as_arrays(lons, lats, data, grid_lon, grid_lat)
+
+    def compute():
+        variogram = model_variogram(lons, lats, data, nlags, variogram_model, variogram_parameters)
+        points = np.column_stack((lons, lats))
+        tree = cKDTree(points)
+        cells, inside, shape = grid_cells(grid_lon, grid_lat, mask)
+        k = min(neighbours, len(data))
+
+        z1 = np.zeros(len(cells))
+        ss1 = np.zeros(len(cells))
+        batch = local_batch(k)
+        for start in range(0, len(cells), batch):
+            end = start + batch
+            z1[start:end], ss1[start:end] = solve_cells(points, data, tree, cells[start:end], variogram, k)
+        return {'z1': fill_grid(z1, inside, shape), 'ss1': fill_grid(ss1, inside, shape)}
+
+    options = variogram_options(nlags, variogram_model, variogram_parameters)
+    options['neighbours'] = neighbours
+    result = cached_grid('local_kriging', grid_arrays(lons, lats, data, grid_lon, grid_lat, mask), options, compute)
+    return result['z1'], result['ss1']
+
+# Arrays and model of the tiled kriging run, in the parent or each pool worker
+tile_state = {}
+
+def share(arrays):
+    """Copies arrays into new shared memory blocks, returning the blocks and how to attach to them."""
+    blocks = []
+    specs = {}
+    for name, array in arrays.items():
+        block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+        np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)[...] = array
+        blocks.append(block)
+        specs[name] = (block.name, array.shape, array.dtype.str)
+    return blocks, specs
+
+def start_tiles(arrays, specs, engine, variogram, neighbours):
+    """Sets up tile_state from arrays, or from the shared memory blocks in specs inside a worker."""
+    tile_state.clear()
+    tile_state['blocks'] = []
+    if specs is not None:
+        arrays = {}
+        for name, (block_name, shape, dtype) in specs.items():
+            block = shared_memory.SharedMemory(name=block_name)
+            tile_state['blocks'].append(block)
+            arrays[name] = np.ndarray(shape, dtype=np.dtype(dtype), buffer=block.buf)
+    tile_state.update(arrays)
+    tile_state['engine'] = engine
+    tile_state['variogram'] = variogram
+    tile_state['neighbours'] = neighbours
+    if engine == 'local':
+        tile_state['tree'] = cKDTree(tile_state['points'])
+
+def krige_rows(rows):
+    """Kriges grid rows start to end of the tiled run into its z1 and ss1."""
+    start, end = rows
+    state = tile_state
+    cells, inside, shape = grid_cells(state['grid_lon'], state['grid_lat'][start:end], state['mask'][start:end] if 'mask' in state else None)
+    points, values = state['points'], state['values']
+    variogram = state['variogram']
+
+    if state['engine'] == 'local':
+        z = np.zeros(len(cells))
+        ss = np.zeros(len(cells))
+        batch = local_batch(state['neighbours'])
+        for first in range(0, len(cells), batch):
+            z[first:first + batch], ss[first:first + batch] = \
+                solve_cells(points, values, state['tree'], cells[first:first + batch], variogram, state['neighbours'])
+    else:
+        # The kriging matrix is symmetric, so each row of b times its inverse is that cell's weights
+        n = len(values)
+        distance = cdist(cells, points)
+        b = np.ones((len(cells), n + 1))
+        b[:, :n] = np.where(distance <= EPSILON, 0.0, -variogram(distance))
+        x = np.dot(b, state['inverse'])
+        z = np.dot(x[:, :n], values)
+        ss = (x * -b).sum(axis=1)
+
+    state['z1'][start:end] = fill_grid(z, inside, shape)
+    state['ss1'][start:end] = fill_grid(ss, inside, shape)
+
+def tiled_kriging(lons, lats, data, grid_lon, grid_lat, nlags=6, variogram_model='linear', variogram_parameters=None, engine='ordinary', workers=None, mask=None, neighbours=LOCAL_NEIGHBOURS):
+    """ordinary_kriging or local_kriging evaluated in tiles of grid rows across a process pool.
+
+    The variogram, and for the ordinary engine the inverse kriging matrix, are
+    computed once. Samples, model and the z1 and ss1 outputs live in shared
+    memory that every worker writes its rows into, and each tile is sized to
+    keep its working arrays under TILE_BYTES. Without shared memory, or with
+    a single worker, the tiles run one after the other in this process.
+    Only the cells a mask is True for are kriged.
+    """
+    if engine not in ['ordinary', 'local']:
+        raise ValueError("Tiled kriging supports the ordinary and local engines, not {}".format(engine))
+    lons, lats, data, grid_lon, grid_lat = as_arrays(lons, lats, data, grid_lon, grid_lat)
+    if workers is None:
+        workers = os.cpu_count() or 1
+
+    def compute():
+        n = len(data)
+        k = min(neighbours, n)
+        variogram = model_variogram(lons, lats, data, nlags, variogram_model, variogram_parameters)
+        arrays = {
+            'points': np.column_stack((lons, lats)),
+            'values': data,
+            'grid_lon': grid_lon,
+            'grid_lat': grid_lat,
+            'z1': np.zeros((len(grid_lat), len(grid_lon))),
+            'ss1': np.zeros((len(grid_lat), len(grid_lon)))
+        }
+        if mask is not None:
+            arrays['mask'] = np.asarray(mask, dtype=bool)
+        if engine == 'ordinary':
+            a = np.ones((n + 1, n + 1))
+            a[:n, :n] = -variogram(cdist(arrays['points'], arrays['points']))
+            np.fill_diagonal(a, 0.0)
+            arrays['inverse'] = np.linalg.inv(a)
+            cell_bytes = 24 * (n + 1)
+        else:
+            # Batches of local systems are bounded by LOCAL_BYTES on their own
+            cell_bytes = 24 * (k + 1)
+
+        rows = max(1, TILE_BYTES // (cell_bytes * max(len(grid_lon), 1)))
+        tiles = [(start, min(start + rows, len(grid_lat))) for start in range(0, len(grid_lat), rows)]
+
+        if workers > 1 and len(tiles) > 1 and shared_memory is not None:
+            blocks, specs = share(arrays)
+            try:
+                with ProcessPoolExecutor(workers, initializer=start_tiles, initargs=(None, specs, engine, variogram, k)) as executor:
+                    list(executor.map(krige_rows, tiles))
+                z1 = np.ndarray(arrays['z1'].shape, dtype=np.float64, buffer=blocks[list(specs).index('z1')].buf).copy()
+                ss1 = np.ndarray(arrays['ss1'].shape, dtype=np.float64, buffer=blocks[list(specs).index('ss1')].buf).copy()
+            finally:
+                for block in blocks:
+                    block.close()
+                    block.unlink()
+        else:
+            start_tiles(arrays, None, engine, variogram, k)
+            for tile in tiles:
+                krige_rows(tile)
+            z1, ss1 = arrays['z1'], arrays['ss1']
+        tile_state.clear()
+        return {'z1': z1, 'ss1': ss1}
+
+    options = variogram_options(nlags, variogram_model, variogram_parameters)
+    options['engine'] = engine
+    options['neighbours'] = neighbours
+    result = cached_grid('tiled_kriging', grid_arrays(lons, lats, data, grid_lon, grid_lat, mask), options, compute)
+    return result['z1'], result['ss1']
+
+class IncrementalKriging:
+    """Moving window kriging of a fixed grid, refreshed as readings are appended during a survey.
+
+    Every cell keeps its k nearest samples. Appended samples can only enter
+    the neighbourhoods of cells whose kth neighbour is farther away than
+    they are, so only those cells merge the batch into their neighbours and
+    have their small systems solved again, and the cost of a batch follows
+    its size and footprint rather than the length of the flight.
+
+    Unless a variogram is given, such as a site variogram from
+    variogram.load_site_variograms, it is fitted to at most FIT_SAMPLES
+    readings spread over those so far, with its nugget kept off zero by
+    floor_nugget. It is refitted, and every cell solved again, with each
+    batch until FIT_SAMPLES readings have arrived. Once it is fixed the grid
+    is local_kriging of all the readings with that variogram, up to ties
+    between equally distant neighbours. Only the cells a mask is True for
+    are kept.
+    """
+
+    def __init__(self, grid_lon, grid_lat, nlags=6, variogram_model='linear', variogram_parameters=None, neighbours=LOCAL_NEIGHBOURS, mask=None):
+        self.grid_lon, self.grid_lat = as_arrays(grid_lon, grid_lat)
+        self.cells, self.inside, self.shape = grid_cells(self.grid_lon, self.grid_lat, mask)
+        self.cell_tree = cKDTree(self.cells)
+        self.nlags = nlags
+        self.variogram_model = variogram_model
+        self.variogram = variogram_parameters
+        if variogram_parameters is not None and not isinstance(variogram_parameters, Variogram):
+            self.variogram = Variogram.from_parameters(variogram_model, variogram_parameters)
+        self.fitting = variogram_parameters is None
+        self.neighbours = neighbours
+
+        # Samples, kept with spare room so appending a batch does not copy the flight
+        self.count = 0
+        self.points = np.zeros((0, 2))
+        self.values = np.zeros(0)
+        self.index = np.zeros((len(self.cells), 0), dtype=np.int64)
+        self.distance = np.zeros((len(self.cells), 0))
+        self.z = np.full(len(self.cells), np.nan)
+        self.ss = np.full(len(self.cells), np.nan)
+
+    def __len__(self):
+        return self.count
+
+    @property
+    def z1(self):
+        return fill_grid(self.z, self.inside, self.shape)
+
+    @property
+    def ss1(self):
+        return fill_grid(self.ss, self.inside, self.shape)
+
+    def store(self, points, values):
+        end = self.count + len(values)
+        if end > len(self.values):
+            capacity = max(end, 2 * len(self.values), 1024)
+            self.points = np.concatenate((self.points[:self.count], np.zeros((capacity - self.count, 2))))
+            self.values = np.concatenate((self.values[:self.count], np.zeros(capacity - self.count)))
+        self.points[self.count:end] = points
+        self.values[self.count:end] = values
+        self.count = end
+
+    def fit(self):
+        """Variogram of at most FIT_SAMPLES readings evenly spaced through those so far, with its nugget floored."""
+        sample = np.linspace(0, self.count - 1, min(self.count, FIT_SAMPLES)).astype(np.int64)
+        points, values = self.points[sample], self.values[sample]
+        return floor_nugget(model_variogram(points[:, 0], points[:, 1], values, self.nlags, self.variogram_model), values)
+
+    def changed_cells(self, tree):
+        """Cells, as indices of the kept cells, whose kth neighbour is farther away than the nearest point of the batch in tree."""
+        if self.index.shape[1] < self.neighbours:
+            return np.arange(len(self.cells))
+        radius = self.distance[:, -1]
+        candidates = np.unique(np.concatenate([np.array(found, dtype=np.int64) for found in self.cell_tree.query_ball_point(tree.data, radius.max())]))
+        if len(candidates) == 0:
+            return candidates
+        return candidates[tree.query(self.cells[candidates])[0] < radius[candidates]]
+
+    def append(self, lons, lats, data):
+        """Adds a batch of readings and refreshes the cells they reach, returning the flat grid indices of those cells."""
+        lons, lats, data = as_arrays(lons, lats, data)
+        if len(data) == 0:
+            return np.zeros(0, dtype=np.int64)
+
+        start = self.count
+        self.store(np.column_stack((lons, lats)), data)
+        refit = self.fitting
+        if refit:
+            self.variogram = self.fit()
+            self.fitting = self.count < FIT_SAMPLES
+        tree = cKDTree(self.points[start:self.count])
+        changed = self.changed_cells(tree)
+        k = min(self.neighbours, self.count)
+        if len(changed):
+            self.merge(tree, changed, start, k)
+        if refit:
+            # A new variogram changes every cell, not just those the batch reached
+            changed = np.arange(len(self.cells))
+
+        batch = local_batch(k)
+        for first in range(0, len(changed), batch):
+            cells = changed[first:first + batch]
+            self.z[cells], self.ss[cells] = solve_neighbourhoods(self.points, self.values, self.index[cells], self.distance[cells], self.variogram)
+        return self.inside[changed]
+
+    def merge(self, tree, changed, start, k):
+        """Merges the batch from start, in tree, into the k nearest neighbours of the changed cells."""
+        # The nearest k of all samples are the nearest k of the old neighbours and of the batch
+        distance, index = tree.query(self.cells[changed], min(k, self.count - start))
+        if distance.ndim == 1:
+            distance, index = distance[:, None], index[:, None]
+        index = np.concatenate((self.index[changed], index + start), axis=1)
+        distance = np.concatenate((self.distance[changed], distance), axis=1)
+        order = np.argsort(distance, axis=1, kind='stable')[:, :k]
+        index = np.take_along_axis(index, order, axis=1)
+        distance = np.take_along_axis(distance, order, axis=1)
+
+        if k > self.index.shape[1]:
+            # Fewer samples than neighbours before this batch, so every cell changed
+            self.index, self.distance = index, distance
+        else:
+            self.index[changed] = index
+            self.distance[changed] = distance
+
+ENGINES = {
+    'ordinary': ordinary_kriging,
+    'local': local_kriging,
+    'idw': idw,
+    'rbf': local_rbf,
+    'gp': sparse_gp
+}
+# Engines taking the variogram settings, the others are quick looks that only need the samples
+KRIGING_ENGINES = ['ordinary', 'local']
+
+# Seconds the last call of each engine took, cache hits included
+timings = {}
+# Readings and cells of the last call that binned its samples
+binned = {}
+
+def krige_grid(lons, lats, data, grid_lon, grid_lat, nlags=6, variogram_model='linear', variogram_parameters=None, engine=None, cell=None, statistic='mean', workers=None, mask=None):
+    """Interpolates data over the grid_lon x grid_lat grid with the named engine, returning z1 and ss1.
+
+    engine is one of ENGINES: ordinary or local kriging, inverse distance
+    weighting (idw), local radial basis functions (rbf) or a sparse gaussian
+    process (gp), ordinary by default. local is much faster on long
+    flights but only approximates ordinary kriging, so it has to be asked
+    for. Given a cell size in meters, lon/lat samples are first binned per
+    cell with statistic, see binning.bin_columns. Given a number of workers a kriging
+    grid is evaluated in tiles by tiled_kriging, 0 meaning one per core;
+    the other engines cannot be tiled and ignore workers with a warning.
+    mask limits the evaluation to the survey, either a boolean grid or a
+    gridmask.survey_mask method name; cells outside are NaN, which also
+    leaves them out of contour plots. The time taken is kept in timings by
+    engine, and the readings and cells of any binning in binned.
+    """
+    if mask is not None and not hasattr(mask, 'shape'):
+        mask = survey_mask(lons, lats, grid_lon, grid_lat, mask)
+    if cell is not None:
+        readings = len(data)
+        lons, lats, data = bin_samples(lons, lats, data, cell, statistic)
+        binned['readings'], binned['cells'] = readings, len(data)
+    if engine is None:
+        engine = 'ordinary'
+    if engine not in ENGINES:
+        raise ValueError("Unknown interpolation engine {}, expected one of {}".format(engine, ", ".join(sorted(ENGINES))))
+    lons, lats, data, grid_lon, grid_lat = as_arrays(lons, lats, data, grid_lon, grid_lat)
+
+    if workers is not None and engine not in KRIGING_ENGINES:
+        warnings.warn("The {} engine cannot be tiled, ignoring workers".format(engine))
+        workers = None
+
+    started = time.time()
+    if workers is not None:
+        z1, ss1 = tiled_kriging(lons, lats, data, grid_lon, grid_lat, nlags, variogram_model, variogram_parameters, engine, workers or None, mask)
+    elif engine in KRIGING_ENGINES:
+        z1, ss1 = ENGINES[engine](lons, lats, data, grid_lon, grid_lat, nlags, variogram_model, variogram_parameters, mask)
+    elif engine == 'gp':
+        z1, ss1 = sparse_gp(lons, lats, data, grid_lon, grid_lat, mask, nlags)
+    else:
+        z1, ss1 = ENGINES[engine](lons, lats, data, grid_lon, grid_lat, mask)
+    timings[engine] = time.time() - started
+    return z1, ss1
@@ -1,10 +1,10 @@
 #!/usr/bin/env python
 
-import matplotlib.pyplot as plt
-from mpl_toolkits.mplot3d import Axes3D  # noqa: F401 unused import
-import math, pulp
-from enum import Enum
-from geometry_msgs.msg import PoseStamped, Point
+import math
+import numpy as np
+from planning import Point, Span, createWaypoint, path_waypoints, stacked
+from projection import offset_position
+from scanline import row_intervals, y_range
 
 class dotdict(dict):
     """dot.notation access to dictionary attributes"""
@@ -12,144 +12,46 @@ class dotdict(dict):
     __setattr__ = dict.__setitem__
     __delattr__ = dict.__delitem__
 
-class Span(Enum):
-    WALK = 1
-    RANGE = 2
-
-def createWaypoint(x, y, altitude):
-    waypoint = PoseStamped()
-    waypoint.pose.position.x = x
-    waypoint.pose.position.y = y
-    waypoint.pose.position.z = altitude
-
-    return waypoint
-
-def calculateRange(type, start, end, length):
-    if type == Span.WALK:
-        waypoints = []
-        print "Calculating walk"
-        deltax = end.x - start.x
-        deltay = end.y - start.y
-        deltaz = end.z - start.z
-        distance = math.sqrt((deltax * deltax) + (deltay * deltay) + (deltaz * deltaz))
-        for i in range(1, int(distance / length) + 1):
-            waypoints.append(Point(start.x + (i * length * deltax / distance),
-                                   start.y + (i * length * deltay / distance),
-                                   start.z + (i * length * deltaz / distance)))
-        return waypoints
-    elif type == Span.RANGE:
-        return [end]
-
 def buildRelativeWaypoint(waypoint, altitude):
     return [waypoint.longitude, waypoint.latitude, altitude]
 
 def createLatLon(localwaypoint, localposition, position):
-    earthCircumference = 40008000
-    latitude = position.latitude - (localposition.y - localwaypoint.y) * 360 / earthCircumference
-    longitude= position.longitude - (localposition.x - localwaypoint.x) * 360 / (earthCircumference * math.cos(latitude * 0.01745))
-
-    return LatLon(latitude = latitude, longitude = longitude, relativeAltitude = localwaypoint.z)
-
-def linearXRange(points, setY, type):
-
-    problem = pulp.LpProblem('range', type)
-
-    x = pulp.LpVariable('x', cat='Continuous')
-    y = pulp.LpVariable('y', cat='Continuous')
-
-    # Objective function
-    problem += x
-
-    def buildLineEquation(index1, index2):
-        a = -(points[index2][1] - points[index1][1])
-        b = points[index2][0] - points[index1][0]
-        c = (a * points[index1][0]) + (b * points[index1][1])
-        # print '(', a, 'x+',b,'y >=',c,'),'
-        return (a * x) + (b * y) >= c
-
-    for i in range(1, len(points)):
-        problem +=buildLineEquation(i-1, i)
-
-    problem += buildLineEquation(len(points)-1, 0)
-
-    problem += y == setY
-
-    # print problem
-    pulp.GLPK_CMD(msg=0).solve(problem)
-
-    return x.value()
-
-def linearYRange(points, type):
-
-    problem = pulp.LpProblem('range', type)
+    latitude, longitude = offset_position(position.latitude, position.longitude, localwaypoint.x - localposition.x, localwaypoint.y - localposition.y)
 
-    x = pulp.LpVariable('x', cat='Continuous')
-    y = pulp.LpVariable('y', cat='Continuous')
+    return LatLon(latitude = float(latitude), longitude = float(longitude), relativeAltitude = localwaypoint.z)
 
-    # Objective function
-    problem += y
+def lawnmowerLegs(boundary, stepLength):
+    """Sweeps of the survey as (start x, end x, y), out along one row and back along the next."""
+    boundary_meters = [buildRelativeWaypoint(waypoint, 0) for waypoint in boundary]
+    miny, maxy = y_range(boundary_meters)
 
-    def buildLineEquation(index1, index2):
-        a = -(points[index2][1] - points[index1][1])
-        b = points[index2][0] - points[index1][0]
-        c = (a * points[index1][0]) + (b * points[index1][1])
-        # print '(', a, 'x+',b,'y >=',c,'),'
-        return (a * x) + (b * y) >= c
+    # Sweep out along y and back one step further on, the return rows kept inside the boundary
+    rows = np.arange(math.ceil(miny), math.floor(maxy), 2 * stepLength)
+    returns = np.minimum(rows + stepLength, maxy)
+    intervals = row_intervals(boundary_meters, np.concatenate((rows, returns)))
 
-    for i in range(1, len(points)):
-        problem +=buildLineEquation(i-1, i)
+    legs = []
+    for index, y in enumerate(rows):
+        legs.extend((start, end, float(y)) for start, end in intervals[index])
+        legs.extend((end, start, float(returns[index])) for start, end in intervals[len(rows) + index][::-1])
+    return legs
 
-    problem += buildLineEquation(len(points)-1, 0)
+def iterLawnmowerWaypoints(rangeType, altitude, boundary, stepLength, reverse=False, legs=None):
+    """Yields the Points of one lawnmower layer as they are flown, or last first with reverse."""
+    if legs is None:
+        legs = lawnmowerLegs(boundary, stepLength)
+    return path_waypoints([(Point(start, y, altitude), Point(end, y, altitude), True) for start, end, y in legs], rangeType, stepLength, reverse)
 
-    # print problem
-    pulp.GLPK_CMD(msg=0).solve(problem)
-
-    return y.value()
+def iter3DLawnmowerWaypoints(rangeType, stacks, boundary, stepLength):
+    """Yields the Points of stacks lawnmower layers, each one flown back over the last."""
+    legs = lawnmowerLegs(boundary, stepLength)
+    return stacked(lambda altitude, reverse: iterLawnmowerWaypoints(rangeType, altitude, boundary, stepLength, reverse, legs), stacks)
 
 def build3DLawnmowerWaypoints(rangeType, stacks, boundary, stepLength):
-    waypoints = []
-    toggleReverse = False
-    for stack in range(0, stacks):
-
-        lawnmowerWaypoints = buildLawnmowerWaypoints(rangeType, stack, boundary, stepLength)
-        if toggleReverse:
-            lawnmowerWaypoints = lawnmowerWaypoints[::-1]
-        waypoints = waypoints + lawnmowerWaypoints
-
-        toggleReverse = not toggleReverse
-
-    return waypoints
+    return [createWaypoint(point.x, point.y, point.z) for point in iter3DLawnmowerWaypoints(rangeType, stacks, boundary, stepLength)]
 
 def buildLawnmowerWaypoints(rangeType, altitude, boundary, stepLength):
-    boundary_meters = []
-
-    waypoints = []
-
-    for waypoint in boundary:
-        boundary_meters.append(buildRelativeWaypoint(waypoint, altitude))
-
-    # Get minimum in Y dimension
-    miny = linearYRange(boundary_meters, pulp.LpMinimize)
-    # Get maximum in Y dimension
-    maxy = linearYRange(boundary_meters, pulp.LpMaximize)
-
-
-
-    stepdirection = 1 if miny < maxy else -1
-
-    for y in range(int(math.ceil(miny)), int(math.floor(maxy)), int(2 * stepLength)):
-        minx = linearXRange(boundary_meters, y, pulp.LpMinimize)
-        maxx = linearXRange(boundary_meters, y, pulp.LpMaximize)
-        waypoints.append(createWaypoint(minx, y, altitude))
-        for point in calculateRange(rangeType, Point(minx, y, altitude), Point(maxx, y, altitude), stepLength):
-            waypoints.append(createWaypoint(point.x, point.y, point.z))
-        minx = linearXRange(boundary_meters, y + stepLength, pulp.LpMinimize)
-        maxx = linearXRange(boundary_meters, y + stepLength, pulp.LpMaximize)
-        waypoints.append(createWaypoint(maxx, y + stepLength, altitude))
-        for point in calculateRange(rangeType, Point(maxx, y + (stepdirection * stepLength), altitude), Point(minx, y + (stepdirection * stepLength), altitude), stepLength):
-            waypoints.append(createWaypoint(point.x, point.y, point.z))
-
-    return waypoints
+    return [createWaypoint(point.x, point.y, point.z) for point in iterLawnmowerWaypoints(rangeType, altitude, boundary, stepLength)]
 
 def latlons(input):
     output = []
@@ -174,6 +76,10 @@ def plotBoundary(ax, boundary, color, style, name):
     ax.plot([(b.longitude - 5) * -10 for b in boundary], [(b.latitude) * -10 for b in boundary], [0.7 * 10] * len(boundary), color + style, label=name , zorder=-1)
 
 def main():
+    # Only the figure needs matplotlib, planning imports stay light
+    import matplotlib.pyplot as plt
+    from mpl_toolkits.mplot3d import Axes3D  # noqa: F401 unused import
+
     plt.rcParams['font.family'] = 'serif'
     plt.rcParams['font.serif'] = ['Times New Roman'] + plt.rcParams['font.serif']
     plt.rcParams['pdf.fonttype'] = 42
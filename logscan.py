@@ -0,0 +1,406 @@
+#!/usr/bin/env python
+
+import argparse, datetime, mmap, os, re
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+
+# Entry type codes of the columnar parse, indexed by LogEntry.type name
+ENTRY_TYPES = ['reading', 'log', 'unknown', 'zeroing', 'error']
+READING, LOG, UNKNOWN, ZEROING, ERROR = range(len(ENTRY_TYPES))
+
+# int64 value of NaT, used as the time of entries without a valid timestamp
+NO_TIME = np.iinfo(np.int64).min
+
+COLUMNS = ['time', 'co2', 'lat', 'lon', 'alt', 'type', 'zeroing', 'line', 'offset']
+
+TIMESTAMP = re.compile(r'^\d{4}-(0[1-9]|1[0-2])-(0[1-9]|[12]\d|3[01]) ([01]\d|2[0-3]):[0-5]\d:[0-5]\d\.\d{6}$')
+
+ZEROING_LINE = b'LOG: data: "Zeroing"'
+FINISHED_ZEROING_LINE = b'LOG: data: "Finished zeroing"'
+
+# Bytes str.split() treats as whitespace, \x1c-\x1f included
+WHITESPACE = np.zeros(256, dtype=bool)
+WHITESPACE[[9, 10, 11, 12, 13, 28, 29, 30, 31, 32]] = True
+
+DIGIT = np.zeros(256, dtype=bool)
+DIGIT[ord('0'):ord('9') + 1] = True
+
+# Widest numeric token decoded in bulk, longer ones go through float()
+NUMBER_WIDTH = 32
+
+# Files smaller than this are not worth splitting across processes
+MIN_CHUNK_SIZE = 1 << 20
+
+def empty_columns(size):
+    return {
+        'time': np.full(size, NO_TIME, dtype=np.int64),
+        'co2': np.full(size, np.nan),
+        'lat': np.full(size, np.nan),
+        'lon': np.full(size, np.nan),
+        'alt': np.full(size, np.nan),
+        'type': np.zeros(size, dtype=np.uint8),
+        'zeroing': np.zeros(size, dtype=np.uint8),
+        'line': np.zeros(size, dtype=np.int64),
+        'offset': np.zeros(size, dtype=np.int64)
+    }
+
+def parse_timestamp(date, time):
+    stamp = "{} {}".format(date, time)
+    if TIMESTAMP.match(stamp):
+        return stamp
+    try:
+        return datetime.datetime.strptime(stamp, '%Y-%m-%d %H:%M:%S.%f').isoformat(' ')
+    except ValueError:
+        return None
+
+def parse_line(lineparts):
+    """Classifies one split log line the same way parse_log does, ignoring zeroing.
+
+    Returns the entry type, the timestamp string (or None) and the raw
+    co2/lat/lon/alt tokens of reading lines, which are converted later in bulk.
+    """
+    stamp = parse_timestamp(lineparts[0], lineparts[1])
+    if stamp is None:
+        return ERROR, None, None
+    if len(lineparts) == 19 and lineparts[4] == '"M':
+        return READING, stamp, (lineparts[7], lineparts[16], lineparts[17], lineparts[18])
+    if len(lineparts) == 15 and lineparts[2] == 'co2:':
+        return READING, stamp, (lineparts[3], lineparts[12], lineparts[13], lineparts[14])
+    if len(lineparts) > 3 and lineparts[2] == 'LOG:':
+        return LOG, stamp, None
+    return UNKNOWN, stamp, None
+
+def to_time(stamps):
+    """Converts a list of timestamp strings at once, returning NO_TIME for the invalid ones."""
+    try:
+        return np.array(stamps, dtype='datetime64[ns]').astype(np.int64)
+    except ValueError:
+        times = np.full(len(stamps), NO_TIME, dtype=np.int64)
+        for i, stamp in enumerate(stamps):
+            try:
+                times[i] = np.datetime64(datetime.datetime.strptime(stamp, '%Y-%m-%d %H:%M:%S.%f'), 'ns').astype(np.int64)
+            except ValueError:
+                pass
+        return times
+
+def to_float(tokens):
+    """Converts a list of numeric strings at once, returning NaN for the invalid ones."""
+    try:
+        return np.array(tokens, dtype=np.float64).reshape(-1)
+    except ValueError:
+        values = np.full(len(tokens), np.nan)
+        for i, token in enumerate(tokens):
+            try:
+                values[i] = float(token)
+            except ValueError:
+                pass
+        return values
+
+class Tokens:
+    """Whitespace tokenisation of a block of lines held in a uint8 buffer."""
+
+    def __init__(self, buf, line_starts):
+        word = np.zeros(len(buf) + 2, dtype=bool)
+        word[1:-1] = ~WHITESPACE[buf]
+        edges = np.flatnonzero(word[1:] != word[:-1])
+
+        self.buf = buf
+        self.starts = edges[0::2]
+        self.ends = edges[1::2]
+
+        # Tokens never span a newline, so each line owns the tokens up to the next line start
+        self.first = np.searchsorted(self.starts, line_starts)
+        self.count = np.diff(np.append(self.first, len(self.starts)))
+
+    def index(self, lines, k):
+        return self.first[lines] + k
+
+    def length(self, lines, k):
+        index = self.index(lines, k)
+        return self.ends[index] - self.starts[index]
+
+    def equals(self, lines, k, value):
+        """True for the lines whose k-th token is exactly value; lines must have more than k tokens."""
+        index = self.index(lines, k)
+        match = (self.ends[index] - self.starts[index]) == len(value)
+        for i, byte in enumerate(bytearray(value)):
+            position = np.minimum(self.starts[index] + i, len(self.buf) - 1)
+            match &= self.buf[position] == byte
+        return match
+
+    def gather(self, lines, k, width):
+        """Copies the k-th token of each line into a zero padded (lines x width) byte matrix."""
+        index = self.index(lines, k)
+        positions = self.starts[index][:, None] + np.arange(width)
+        text = self.buf[np.minimum(positions, len(self.buf) - 1)]
+        text[positions >= self.ends[index][:, None]] = 0
+        return text
+
+    def numbers(self, lines, k):
+        """Decodes the k-th token of each line as float64, NaN where float() would fail."""
+        if len(lines) == 0:
+            return np.zeros(0)
+        lengths = self.length(lines, k)
+        width = int(min(lengths.max(), NUMBER_WIDTH))
+        text = self.gather(lines, k, width).view('S{}'.format(width)).reshape(-1)
+        try:
+            values = text.astype(np.float64)
+        except ValueError:
+            values = to_float([token.decode('ascii', 'replace') for token in text])
+        long_tokens = np.flatnonzero(lengths > width)
+        for i in long_tokens:
+            index = self.index(lines[i], k)
+            values[i] = to_float([bytes(self.buf[self.starts[index]:self.ends[index]]).decode('utf-8', 'replace')])[0]
+        return values
+
+    def timestamps(self, lines):
+        """Decodes the strict 'YYYY-mm-dd HH:MM:SS.ffffff' timestamp of each line.
+
+        Returns epoch ns and a mask of the lines that did not have the strict
+        layout, which need to go through strptime instead.
+        """
+        times = np.full(len(lines), NO_TIME, dtype=np.int64)
+        strict = (self.length(lines, 0) == 10) & (self.length(lines, 1) == 15)
+        if not strict.any():
+            return times, ~strict
+
+        candidates = lines[strict]
+        date = self.gather(candidates, 0, 10).astype(np.int32)
+        time = self.gather(candidates, 1, 15).astype(np.int32)
+        digits = np.concatenate((date[:, [0, 1, 2, 3, 5, 6, 8, 9]], time[:, [0, 1, 3, 4, 6, 7, 9, 10, 11, 12, 13, 14]]), axis=1)
+        layout = DIGIT[digits].all(axis=1) \
+                 & (date[:, 4] == ord('-')) & (date[:, 7] == ord('-')) \
+                 & (time[:, 2] == ord(':')) & (time[:, 5] == ord(':')) & (time[:, 8] == ord('.'))
+        digits = digits - ord('0')
+
+        def number(columns):
+            value = np.zeros(len(digits), dtype=np.int64)
+            for column in columns:
+                value = value * 10 + digits[:, column]
+            return value
+
+        year = number([0, 1, 2, 3])
+        month = number([4, 5])
+        day = number([6, 7])
+        hour = number([8, 9])
+        minute = number([10, 11])
+        second = number([12, 13])
+        micros = number([14, 15, 16, 17, 18, 19])
+
+        valid = layout & (year >= 1) & (month >= 1) & (month <= 12) & (day >= 1) & (hour < 24) & (minute < 60) & (second < 60)
+        months = np.where(valid, (year - 1970) * 12 + month - 1, 0).astype('datetime64[M]')
+        month_start = months.astype('datetime64[D]').astype(np.int64)
+        month_length = (months + 1).astype('datetime64[D]').astype(np.int64) - month_start
+        valid &= day <= month_length
+
+        seconds = (month_start + day - 1) * 86400 + hour * 3600 + minute * 60 + second
+        strict_times = np.where(valid, seconds * 1000000000 + micros * 1000, NO_TIME)
+        times[strict] = strict_times
+        strict[strict] = valid
+        return times, ~strict
+
+def scan_block(buf, skip_first=True):
+    """Scans a block of complete log lines held in a uint8 buffer.
+
+    Returns the columns of every line with more than one token, classified as
+    parse_log does but without the zeroing override, together with the
+    per-line zeroing toggles (1 zeroing, -1 finished, 0 none) and the number
+    of lines in the block. Row line numbers and byte offsets are relative to
+    the block.
+    """
+    newlines = np.flatnonzero(buf == 10)
+    line_starts = np.concatenate(([0], newlines + 1))
+    if line_starts[-1] == len(buf):
+        line_starts = line_starts[:-1]
+    line_ends = np.concatenate((newlines, [len(buf)]))[:len(line_starts)]
+    line_count = len(line_starts)
+
+    toggles = np.zeros(line_count, dtype=np.int8)
+    lengths = line_ends - line_starts
+    ended = line_ends < len(buf)
+    for toggle, text in [(1, ZEROING_LINE), (-1, FINISHED_ZEROING_LINE)]:
+        # Text mode reads \r\n as \n, so a trailing \r still matches
+        candidates = np.flatnonzero(ended & ((lengths == len(text)) | (lengths == len(text) + 1)) & (buf[np.minimum(line_starts, len(buf) - 1)] == ord('L')))
+        for line in candidates:
+            content = bytes(buf[line_starts[line]:line_ends[line]])
+            if content == text or content == text + b'\r':
+                toggles[line] = toggle
+    if skip_first and line_count:
+        toggles[0] = 0
+
+    tokens = Tokens(buf, line_starts)
+    lines = np.flatnonzero(tokens.count > 1)
+    if skip_first:
+        lines = lines[lines > 0]
+
+    columns = empty_columns(len(lines))
+    columns['line'][:] = lines
+    columns['offset'][:] = line_starts[lines]
+    types = columns['type']
+    types[:] = UNKNOWN
+
+    times, irregular = tokens.timestamps(lines)
+    # strptime can only accept tokens that start with a digit
+    irregular &= DIGIT[buf[tokens.starts[tokens.index(lines, 0)]]]
+    types[times == NO_TIME] = ERROR
+
+    # Lines with non-ascii bytes are decoded and handled by parse_line
+    high = np.flatnonzero(buf >= 0x80)
+    if len(high):
+        high_lines = np.unique(np.searchsorted(line_starts, high, 'right') - 1)
+        irregular |= np.isin(lines, high_lines)
+
+    count = tokens.count[lines]
+    m_frame = np.zeros(len(lines), dtype=bool)
+    co2_frame = np.zeros(len(lines), dtype=bool)
+    timed = (types != ERROR) & ~irregular
+
+    candidates = timed & (count == 19)
+    m_frame[candidates] = tokens.equals(lines[candidates], 4, b'"M')
+    candidates = timed & (count == 15)
+    co2_frame[candidates] = tokens.equals(lines[candidates], 2, b'co2:')
+    candidates = timed & (count > 3) & ~m_frame & ~co2_frame
+    log = np.zeros(len(lines), dtype=bool)
+    log[candidates] = tokens.equals(lines[candidates], 2, b'LOG:')
+    types[log] = LOG
+
+    values = np.full((len(lines), 4), np.nan)
+    for frame, fields in [(m_frame, [7, 16, 17, 18]), (co2_frame, [3, 12, 13, 14])]:
+        for i, field in enumerate(fields):
+            values[frame, i] = tokens.numbers(lines[frame], field)
+
+    for row in np.flatnonzero(irregular):
+        line = lines[row]
+        lineparts = bytes(buf[line_starts[line]:line_ends[line]]).decode('utf-8', 'replace').split()
+        type, stamp, fields = parse_line(lineparts)
+        times[row] = NO_TIME if stamp is None else to_time([stamp])[0]
+        types[row] = ERROR if times[row] == NO_TIME else type
+        if fields is not None:
+            values[row] = to_float(list(fields))
+            m_frame[row] = len(lineparts) == 19
+            co2_frame[row] = len(lineparts) == 15
+
+    # "M" frames at or below 409 ppm are kept as unknown entries
+    frame = m_frame | co2_frame
+    unknown = m_frame & (values[:, 0] <= 409)
+    error = frame & ~unknown & np.isnan(values).any(axis=1)
+    reading = frame & ~unknown & ~error
+    types[unknown] = UNKNOWN
+    types[error] = ERROR
+    types[reading] = READING
+
+    columns['time'][:] = times
+    for i, name in enumerate(['co2', 'lat', 'lon', 'alt']):
+        columns[name][reading] = values[reading, i]
+
+    return columns, toggles, line_count
+
+def apply_zeroing(columns, toggles, skip_zeroing, zeroing=False):
+    """Resolves the zeroing state of scanned rows, starting from the given state.
+
+    Returns the zeroing state at the end of the block.
+    """
+    state = np.full(len(toggles), zeroing, dtype=bool)
+    if toggles.any():
+        last_change = np.maximum.accumulate(np.where(toggles != 0, np.arange(len(toggles)), -1))
+        changed = last_change >= 0
+        state[changed] = toggles[last_change[changed]] > 0
+
+    zeroed = state[columns['line']]
+    columns['zeroing'][:] = zeroed
+    types = columns['type']
+    error = types == ERROR
+    if skip_zeroing:
+        # parse_log checks the zeroing state before decoding any fields
+        timestamp_error = error & (columns['time'] == NO_TIME)
+        zeroed = zeroed & ~timestamp_error
+        types[zeroed] = ZEROING
+        for name in ['co2', 'lat', 'lon', 'alt']:
+            columns[name][zeroed] = np.nan
+        error &= ~zeroed
+    columns['time'][error] = NO_TIME
+
+    return bool(state[-1]) if len(state) else zeroing
+
+def scan_range(input, start, end):
+    """Scans the lines in the byte range [start, end) of a log, see scan_block."""
+    with open(input, 'rb') as inputFile:
+        if end <= start:
+            return empty_columns(0), np.zeros(0, dtype=np.int8), 0
+        mapped = mmap.mmap(inputFile.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            buf = np.frombuffer(mapped, dtype=np.uint8)
+            result = scan_block(buf[start:end], start == 0)
+            result[0]['offset'] += start
+            del buf
+        finally:
+            mapped.close()
+    return result
+
+def split_ranges(input, count):
+    """Splits a log into at most count byte ranges that each start on a new line."""
+    size = os.path.getsize(input)
+    if size == 0:
+        return []
+    offsets = [0]
+    with open(input, 'rb') as inputFile:
+        mapped = mmap.mmap(inputFile.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            for i in range(1, count):
+                newline = mapped.find(b'\n', max(offsets[-1], i * size // count))
+                if newline < 0 or newline + 1 >= size:
+                    break
+                offsets.append(newline + 1)
+        finally:
+            mapped.close()
+    offsets.append(size)
+    return list(zip(offsets[:-1], offsets[1:]))
+
+def merge_ranges(results, skip_zeroing):
+    """Joins the scans of consecutive byte ranges, carrying the zeroing state across them."""
+    zeroing = False
+    line_offset = 0
+    for columns, toggles, line_count in results:
+        zeroing = apply_zeroing(columns, toggles, skip_zeroing, zeroing)
+        columns['line'] += line_offset
+        line_offset += line_count
+
+    merged = {}
+    for name in COLUMNS:
+        merged[name] = np.concatenate([columns[name] for columns, toggles, line_count in results])
+    # parse_log numbers lines from the second line of the file
+    merged['line'] -= 1
+    return merged
+
+def scan_log(input, skip_zeroing, workers=1):
+    """Parses a Dragonfly log into the same columns as parse_log(..., columnar=True).
+
+    The file is memory mapped and tokenised with NumPy, only lines that do not
+    follow the usual layout are decoded into Python strings. With more than
+    one worker the file is split on line boundaries and the pieces are scanned
+    in a process pool; the result is identical to the serial scan.
+    """
+    if workers is None:
+        workers = os.cpu_count() or 1
+    workers = max(1, min(workers, os.path.getsize(input) // MIN_CHUNK_SIZE))
+    ranges = split_ranges(input, workers)
+
+    if not ranges:
+        return empty_columns(0)
+    if len(ranges) > 1:
+        with ProcessPoolExecutor(len(ranges)) as executor:
+            results = list(executor.map(scan_range, [input] * len(ranges), *zip(*ranges)))
+    else:
+        results = [scan_range(input, start, end) for start, end in ranges]
+
+    return merge_ranges(results, skip_zeroing)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = 'Scan a Dragonfly log into columns')
+    parser.add_argument('--input', type=str, help='Input Dragonfly log.')
+    parser.add_argument('--output', type=str, help='Output npz file.')
+    parser.add_argument('--skip-zeroing', action='store_true', help='Mark readings taken while zeroing.')
+    parser.add_argument('--workers', type=int, help='Number of processes, defaults to one per core.', default=None)
+    args = parser.parse_args()
+
+    np.savez(args.output, **scan_log(args.input, args.skip_zeroing, args.workers))
@@ -2,6 +2,8 @@
 
 import argparse, datetime
 
+from .logscan import scan_log
+from .parsecache import cached
 from .reading import Reading
 
 class LogEntry:
@@ -12,43 +14,44 @@ class LogEntry:
         self.date = date
         self.data = data
 
-def parse_log(input, skip_zeroing):
-    readings = []
-    line_num = 0
-    with open(input, 'r') as inputFile:
-        line = inputFile.readline()
-        zeroing = False
-        while line:
-            line = inputFile.readline()
-            lineparts = line.split()
-
-            if line == 'LOG: data: "Finished zeroing"\n':
-                zeroing = False
-            elif line == 'LOG: data: "Zeroing"\n':
-                zeroing = True
-            try:
-                if len(lineparts) > 1:
-                    reading_time = datetime.datetime.strptime("{} {}".format(lineparts[0], lineparts[1]), '%Y-%m-%d %H:%M:%S.%f')
-                    if not skip_zeroing or not zeroing:
-                        if len(lineparts) == 19 and lineparts[4] == '"M' and float(lineparts[7]) > 409:
-                            readings.append(LogEntry('reading', line_num, reading_time, Reading(reading_time, lineparts[7], lineparts[16], lineparts[17], lineparts[18])))
-                        elif len(lineparts) == 15 and lineparts[2] == 'co2:':
-                            readings.append(LogEntry('reading', line_num, reading_time, Reading(reading_time, lineparts[3], lineparts[12], lineparts[13], lineparts[14])))
-                        elif len(lineparts) > 3 and lineparts[2] == 'LOG:':
-                            readings.append(LogEntry('log', line_num, reading_time, line))
-                        else:
-                            readings.append(LogEntry('unknown', line_num, reading_time, line))
+def parse_lines(lines, skip_zeroing):
+    """Yields the LogEntry of each line in an iterable of log lines."""
+    zeroing = False
+    for line_num, line in enumerate(lines):
+        lineparts = line.split()
 
+        if line == 'LOG: data: "Finished zeroing"\n':
+            zeroing = False
+        elif line == 'LOG: data: "Zeroing"\n':
+            zeroing = True
+        try:
+            if len(lineparts) > 1:
+                reading_time = datetime.datetime.strptime("{} {}".format(lineparts[0], lineparts[1]), '%Y-%m-%d %H:%M:%S.%f')
+                if not skip_zeroing or not zeroing:
+                    if len(lineparts) == 19 and lineparts[4] == '"M' and float(lineparts[7]) > 409:
+                        yield LogEntry('reading', line_num, reading_time, Reading(reading_time, lineparts[7], lineparts[16], lineparts[17], lineparts[18]))
+                    elif len(lineparts) == 15 and lineparts[2] == 'co2:':
+                        yield LogEntry('reading', line_num, reading_time, Reading(reading_time, lineparts[3], lineparts[12], lineparts[13], lineparts[14]))
+                    elif len(lineparts) > 3 and lineparts[2] == 'LOG:':
+                        yield LogEntry('log', line_num, reading_time, line)
                     else:
-                        readings.append(LogEntry('zeroing', line_num, reading_time, line))
+                        yield LogEntry('unknown', line_num, reading_time, line)
 
-            except ValueError as e:
-                readings.append(LogEntry('error', line_num, None, line))
+                else:
+                    yield LogEntry('zeroing', line_num, reading_time, line)
 
-            line_num = line_num + 1
+        except ValueError as e:
+            yield LogEntry('error', line_num, None, line)
 
+def parse_log(input, skip_zeroing, columnar=False, workers=1):
+    if columnar:
+        return cached('scan_log', input, {'skip_zeroing': skip_zeroing}, lambda: scan_log(input, skip_zeroing, workers))
 
-    return readings
+    with open(input, 'r') as inputFile:
+        # The first line of the file is skipped
+        if not inputFile.readline():
+            return []
+        return list(parse_lines(inputFile, skip_zeroing))
 
 def writecsv(input, output):
     readings = parse_log(input, False)
@@ -1,6 +1,13 @@
 #!/usr/bin/env python
 
 import argparse
+import numpy as np
+
+# Also run as a standalone script, outside the package
+try:
+    from .parsecache import cached
+except (ImportError, ValueError):
+    from parsecache import cached
 
 class Reading:
     def __init__(self, value, lat, lon, alt):
@@ -85,7 +92,7 @@ def buildPoints(readings, outputFile):
 
         i = i+1
 
-def buildReadings(input, skipZeroing):
+def buildReadingColumns(input, skipZeroing):
     readings = []
     with open(input, 'r') as inputFile:
         line = inputFile.readline()
@@ -101,10 +108,19 @@ def buildReadings(input, skipZeroing):
 
             if not skipZeroing or not zeroing:
                 if len(lineparts) == 19 and lineparts[4] == '"M':
-                    readings.append(Reading(lineparts[7], lineparts[16], lineparts[17], float(lineparts[18]) + 20))
-            
+                    readings.append((float(lineparts[7]), float(lineparts[16]), float(lineparts[17]), float(lineparts[18]) + 20))
 
-    return readings
+    readings = np.array(readings, dtype=np.float64).reshape(-1, 4)
+    return {
+        'co2': readings[:, 0],
+        'lat': readings[:, 1],
+        'lon': readings[:, 2],
+        'alt': readings[:, 3]
+    }
+
+def buildReadings(input, skipZeroing):
+    columns = cached('buildReadings', input, {'skip_zeroing': skipZeroing}, lambda: buildReadingColumns(input, skipZeroing))
+    return [Reading(value, lat, lon, alt) for value, lat, lon, alt in zip(columns['co2'], columns['lat'], columns['lon'], columns['alt'])]
 
 def writeKml(input, output):
     readings = buildReadings(input, False)
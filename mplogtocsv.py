@@ -1,8 +1,11 @@
 #!/usr/bin/env python
 
 import argparse, datetime, math
+import numpy as np
 
-from .reading import Reading
+from .parsecache import cached
+from .projection import difference_in_meters
+from .reading import readings_from_columns
 
 class dotdict(dict):
     """dot.notation access to dictionary attributes"""
@@ -16,11 +19,8 @@ VIRTUAL_SOURCE = dotdict({
 })
 
 def differenceInMeters(one, two):
-    earthCircumference = 40008000
-    return [
-        ((one.longitude - two.longitude) * (earthCircumference / 360) * math.cos(one.latitude * 0.01745)),
-        ((one.latitude - two.latitude) * (earthCircumference / 360))
-    ]
+    east, north = difference_in_meters(one.latitude, one.longitude, two.latitude, two.longitude)
+    return [float(east), float(north)]
 
 def calculateCO2(position):
 
@@ -44,9 +44,11 @@ def calculateCO2(position):
 
 
 
-def parse_mplog(input, start_time):
-    readings = []
-    time_diff = 0
+def parse_mplog_columns(input, start_time):
+    lats = []
+    lons = []
+    alts = []
+    values = []
 
     with open(input, 'r') as inputFile:
         line = inputFile.readline()
@@ -60,13 +62,24 @@ def parse_mplog(input, start_time):
                     "longitude": float(lineparts[8]),
                 })
 
-                readings.append(Reading(start_time + datetime.timedelta(0,time_diff), calculateCO2(position), lineparts[7], lineparts[8], lineparts[9]))
-
-                time_diff += 1
-
+                values.append(calculateCO2(position))
+                lats.append(position.latitude)
+                lons.append(position.longitude)
+                alts.append(float(lineparts[9]))
+
+    # GPS lines carry no wall clock time, they are spaced one second apart from start_time
+    start = np.datetime64(start_time, 'ns').astype(np.int64)
+    return {
+        'time': start + np.arange(len(values), dtype=np.int64) * 1000000000,
+        'co2': np.array(values, dtype=np.float64),
+        'lat': np.array(lats, dtype=np.float64),
+        'lon': np.array(lons, dtype=np.float64),
+        'alt': np.array(alts, dtype=np.float64)
+    }
 
-
-    return readings
+def parse_mplog(input, start_time):
+    columns = cached('parse_mplog', input, {'start_time': start_time.isoformat()}, lambda: parse_mplog_columns(input, start_time))
+    return readings_from_columns(columns)
 
 def writecsv(input, output, start_time):
     readings = parse_mplog(input, start_time)
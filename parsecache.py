@@ -0,0 +1,161 @@
+#!/usr/bin/env python
+
+import argparse, hashlib, json, os, tempfile, warnings
+import numpy as np
+
+# Bump when a parser changes its output so older cache entries are ignored
+CACHE_VERSION = 2
+
+DEFAULT_DIRECTORY = os.path.join(os.path.expanduser('~'), '.cache', 'dragonfly-util')
+DEFAULT_SIZE_MB = 512
+
+# Python 2 has no os.replace, its os.rename replaces an existing file outside Windows
+replace = getattr(os, 'replace', os.rename)
+
+def content_hash(input):
+    """SHA-1 hex digest of a file's bytes."""
+    digest = hashlib.sha1()
+    with open(input, 'rb') as inputFile:
+        block = inputFile.read(1 << 20)
+        while block:
+            digest.update(block)
+            block = inputFile.read(1 << 20)
+    return digest.hexdigest()
+
+class ParseCache:
+    """Disk cache of parsed columns, stored as one .npz file per input and parser options.
+
+    Entries are keyed by the input's size, mtime and content hash together with
+    the parser name and options, and the least recently used entries are
+    removed once the cache grows past max_bytes.
+    """
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+
+    def key(self, parser, input, options):
+        stat = os.stat(input)
+        description = json.dumps([CACHE_VERSION, parser, sorted(options.items()), stat.st_size, stat.st_mtime, content_hash(input)])
+        return hashlib.sha1(description.encode('utf-8')).hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, key + '.npz')
+
+    def get(self, key):
+        path = self.path(key)
+        try:
+            with np.load(path) as data:
+                columns = dict((name, data[name]) for name in data.files)
+            # The file mtime records the last use for LRU eviction
+            os.utime(path, None)
+            return columns
+        except (IOError, OSError, ValueError):
+            return None
+
+    def put(self, key, columns):
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+        handle, temp = tempfile.mkstemp(suffix='.npz', dir=self.directory)
+        try:
+            with os.fdopen(handle, 'wb') as outputFile:
+                np.savez(outputFile, **columns)
+            replace(temp, self.path(key))
+        except BaseException:
+            os.remove(temp)
+            raise
+        self.evict()
+
+    def entries(self):
+        entries = []
+        if os.path.isdir(self.directory):
+            for file in os.listdir(self.directory):
+                if file.endswith('.npz'):
+                    try:
+                        stat = os.stat(os.path.join(self.directory, file))
+                        entries.append((stat.st_mtime, stat.st_size, os.path.join(self.directory, file)))
+                    except OSError:
+                        pass
+        return sorted(entries)
+
+    def evict(self):
+        entries = self.entries()
+        total = sum(size for used, size, path in entries)
+        for used, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
+
+    def clear(self):
+        for used, size, path in self.entries():
+            os.remove(path)
+
+    def load(self, parser, input, options, parse):
+        """Returns the cached columns of parser(input, **options), calling parse() on a miss."""
+        return self.load_key(self.key(parser, input, options), parse)
+
+    def load_key(self, key, parse):
+        columns = self.get(key)
+        if columns is None:
+            columns = parse()
+            try:
+                self.put(key, columns)
+            except (IOError, OSError) as error:
+                # An unwritable cache only costs the next parse, not this one
+                warnings.warn("Could not cache in {}: {}".format(self.directory, error))
+        return columns
+
+def array_key(name, arrays, options):
+    """Content key of a computation over in-memory arrays, such as an interpolated grid."""
+    digest = hashlib.sha1(json.dumps([CACHE_VERSION, name, sorted(options.items())]).encode('utf-8'))
+    for array in arrays:
+        array = np.ascontiguousarray(array)
+        digest.update("{}{}".format(array.dtype.str, array.shape).encode('utf-8'))
+        digest.update(array.tobytes())
+    return digest.hexdigest()
+
+def from_environment(subdirectory=None):
+    """Builds the cache from DRAGONFLY_CACHE_DIR and DRAGONFLY_CACHE_SIZE_MB; an empty directory disables it."""
+    directory = os.environ.get('DRAGONFLY_CACHE_DIR', DEFAULT_DIRECTORY)
+    if not directory:
+        return None
+    if subdirectory is not None:
+        directory = os.path.join(directory, subdirectory)
+    return ParseCache(directory, int(os.environ.get('DRAGONFLY_CACHE_SIZE_MB', DEFAULT_SIZE_MB)) * (1 << 20))
+
+parse_cache = from_environment()
+# Interpolated grids live in their own directory with their own size budget
+grid_cache = from_environment('grids')
+
+def configure(directory, max_mb=DEFAULT_SIZE_MB):
+    """Points the parsers at a cache directory, None turns caching off."""
+    global parse_cache, grid_cache
+    parse_cache = None if directory is None else ParseCache(directory, max_mb * (1 << 20))
+    grid_cache = None if directory is None else ParseCache(os.path.join(directory, 'grids'), max_mb * (1 << 20))
+
+def cached(parser, input, options, parse):
+    if parse_cache is None:
+        return parse()
+    return parse_cache.load(parser, input, options, parse)
+
+def cached_grid(name, arrays, options, compute):
+    """Returns the cached arrays of compute(), keyed by the content of the input arrays and the options."""
+    if grid_cache is None:
+        return compute()
+    return grid_cache.load_key(array_key(name, arrays, options), compute)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = 'Manage the parsed log cache')
+    parser.add_argument('--clear', action='store_true', help='Remove every cached entry.')
+    args = parser.parse_args()
+
+    for cache in [parse_cache, grid_cache]:
+        if cache is not None:
+            if args.clear:
+                cache.clear()
+            entries = cache.entries()
+            print("{}: {} entries, {:.1f} MB".format(cache.directory, len(entries), sum(size for used, size, path in entries) / float(1 << 20)))
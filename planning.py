@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+
+import math
+from collections import namedtuple
+from enum import Enum
+
+# Plain positions for planning, the ROS messages are only built when publishing
+Point = namedtuple('Point', ['x', 'y', 'z'])
+
+class Pose(namedtuple('Pose', ['position'])):
+    """A waypoint's position, read as pose.position like the PoseStamped messages the builders used to return."""
+    __slots__ = ()
+
+    @property
+    def pose(self):
+        return self
+
+class Span(Enum):
+    WALK = 1
+    RANGE = 2
+
+def walkLeg(rangeType, start, end, length, reverse=False):
+    """Yields the points calculateRange gives from start to end one at a time, the last first with reverse."""
+    if rangeType == Span.RANGE:
+        yield end
+        return
+    deltax = end.x - start.x
+    deltay = end.y - start.y
+    deltaz = end.z - start.z
+    distance = math.sqrt((deltax * deltax) + (deltay * deltay) + (deltaz * deltaz))
+    steps = range(1, int(distance / length) + 1)
+    for i in (reversed(steps) if reverse else steps):
+        yield Point(start.x + (i * length * deltax / distance),
+                    start.y + (i * length * deltay / distance),
+                    start.z + (i * length * deltaz / distance))
+
+def calculateRange(type, start, end, length):
+    """Points after start up to end, every length along the way when walking, otherwise just end."""
+    return list(walkLeg(type, start, end, length))
+
+def path_waypoints(legs, rangeType, length, reverse=False):
+    """Yields the waypoints of (start, end, visitStart) legs flown one after the other.
+
+    A leg gives its start when visitStart and then the calculateRange points
+    up to its end. reverse yields the same waypoints last first, walking the
+    legs backwards rather than building and reversing the list, so only the
+    legs are ever held.
+    """
+    if not reverse:
+        for start, end, visitStart in legs:
+            if visitStart:
+                yield start
+            for point in walkLeg(rangeType, start, end, length):
+                yield point
+    else:
+        for start, end, visitStart in reversed(legs):
+            for point in walkLeg(rangeType, start, end, length, True):
+                yield point
+            if visitStart:
+                yield start
+
+def stacked(layer, stacks):
+    """Yields the waypoints of layer(stack, reverse) for each stack in turn, every other one reversed to start where the last ended."""
+    for stack in range(stacks):
+        for waypoint in layer(stack, stack % 2 == 1):
+            yield waypoint
+
+def offset(waypoints, x=0, y=0, z=0):
+    """Yields the waypoints moved by (x, y, z)."""
+    for point in waypoints:
+        yield Point(point.x + x, point.y + y, point.z + z)
+
+def scaled(waypoints, factor):
+    """Yields the waypoints with x and y multiplied by factor, keeping the altitude."""
+    for point in waypoints:
+        yield Point(point.x * factor, point.y * factor, point.z)
+
+def inside_polygon(polygon, x, y):
+    """Whether (x, y) lies inside polygon, a list of (x, y) vertices, by even-odd ray casting."""
+    inside = False
+    for (x1, y1), (x2, y2) in zip(polygon, polygon[1:] + polygon[:1]):
+        if (y1 > y) != (y2 > y) and x < x1 + (y - y1) * (x2 - x1) / float(y2 - y1):
+            inside = not inside
+    return inside
+
+def clipped(waypoints, polygon):
+    """Yields the waypoints inside polygon, dropping the rest."""
+    polygon = [(vertex[0], vertex[1]) for vertex in polygon]
+    for point in waypoints:
+        if inside_polygon(polygon, point.x, point.y):
+            yield point
+
+def write_waypoints(waypoints, outputFile):
+    """Writes waypoints to outputFile as x, y, z CSV as they come, returning how many there were."""
+    outputFile.write("x, y, z\n")
+    count = 0
+    for point in waypoints:
+        outputFile.write("{}, {}, {}\n".format(point.x, point.y, point.z))
+        count = count + 1
+    return count
+
+def createWaypoint(x, y, altitude):
+    return Pose(Point(x, y, altitude))
+
+def to_points(rows):
+    """Points of (x, y, z) rows."""
+    return [Point(float(x), float(y), float(z)) for x, y, z in rows]
+
+def ros_points(points):
+    """Yields geometry_msgs Points of points, importing ROS on first use."""
+    from geometry_msgs.msg import Point as RosPoint
+    for point in points:
+        yield RosPoint(point.x, point.y, point.z)
+
+def ros_poses(waypoints):
+    """Yields geometry_msgs PoseStamped messages at waypoints, either Poses or Points, ready to publish as they come."""
+    from geometry_msgs.msg import PoseStamped
+    for point in ros_points(getattr(waypoint, 'position', waypoint) for waypoint in waypoints):
+        pose = PoseStamped()
+        pose.pose.position = point
+        yield pose
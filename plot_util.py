@@ -1,43 +1,46 @@
 #!/usr/bin/env python
 
 import datetime
-import math
 import matplotlib.pyplot as plt
 import numpy as np
 import pandas as pd
 from matplotlib.lines import Line2D
-from matplotlib.path import Path
-from matplotlib.patches import PathPatch
 from matplotlib.ticker import FormatStrFormatter
 from matplotlib.patches import Rectangle
 from matplotlib.colors import LinearSegmentedColormap
 from mpl_toolkits.mplot3d import Axes3D  # noqa: F401 unused import
 from pandas.plotting import register_matplotlib_converters
-from pykrige.ok import OrdinaryKriging
-from scipy.spatial import ConvexHull
 import matplotlib.ticker as ticker
 
+from .kriging import grid_axes, krige_grid
 from .mplogtocsv import parse_mplog
+from .parsecache import cached
+from .projection import METERS_PER_DEGREE, meters_to_longitude
+from .reading import ReadingSet, as_reading_set
 
 register_matplotlib_converters()
 
 
-def load_csv(csv_file):
+def read_csv_columns(csv_file):
     df = pd.read_csv(csv_file, ', ', engine='python')
 
-    lons = np.array(df['lon'])
-    lats = np.array(df['lat'])
-    data = np.array(df['co2'])
+    return {
+        'lon': np.array(df['lon']),
+        'lat': np.array(df['lat']),
+        'co2': np.array(df['co2'])
+    }
+
+def load_csv(csv_file):
+    columns = cached('load_csv', csv_file, {}, lambda: read_csv_columns(csv_file))
 
-    return [lons, lats, data]
+    return [columns['lon'], columns['lat'], columns['co2']]
 
 def add_ruler(plt, ax, length, height_scale):
     lowerleft = [plt.xlim()[0], plt.ylim()[0]]
     upperright = [plt.xlim()[1], plt.ylim()[1]]
 
     # Calculate width by latitide
-    earthCircumference = 40008000
-    width = abs(1.0 * length / ((earthCircumference / 360) * math.cos(lowerleft[1] * 0.01745)))
+    width = abs(float(meters_to_longitude(length, lowerleft[1])))
     height = (upperright[1] - lowerleft[1]) * 0.018 * height_scale
 
     location = [plt.xlim()[0] + (plt.xlim()[1] - plt.xlim()[0]) *.05, plt.ylim()[1] - ((plt.ylim()[1] - plt.ylim()[0]) *(.1 + (height_scale * .02)))]
@@ -65,15 +68,11 @@ def display_path(csv_file, ortho_map):
     ax.plot()
 
 def zoom_to_altitude_data(ax, data):
-    max_alt = 0
-    min_alt = 100000
-    max_lon = -360
-    min_lon = 360
-    for d in data:
-        max_alt = max(max_alt, d.alt)
-        min_alt = min(min_alt, d.alt)
-        max_lon = max(max_lon, d.lon)
-        min_lon = min(min_lon, d.lon)
+    data = as_reading_set(data)
+    max_alt = max(0, np.max(data.alt, initial=0))
+    min_alt = min(100000, np.min(data.alt, initial=100000))
+    max_lon = np.max(data.lon, initial=-360)
+    min_lon = np.min(data.lon, initial=360)
 
     dalt = max_alt - min_alt
     dlon = max_lon - min_lon
@@ -88,15 +87,11 @@ def zoom_to_altitude_data(ax, data):
     ax.set_ylim(min_alt - (lat_margin_scale * dalt), max_alt + (lat_margin_scale * dalt))
 
 def zoom_to_data(ax, data):
-    max_lat = -360
-    min_lat = 360
-    max_lon = -360
-    min_lon = 360
-    for d in data:
-        max_lat = max(max_lat, d.lat)
-        min_lat = min(min_lat, d.lat)
-        max_lon = max(max_lon, d.lon)
-        min_lon = min(min_lon, d.lon)
+    data = as_reading_set(data)
+    max_lat = np.max(data.lat, initial=-360)
+    min_lat = np.min(data.lat, initial=360)
+    max_lon = np.max(data.lon, initial=-360)
+    min_lon = np.min(data.lon, initial=360)
 
     dlat = max_lat - min_lat
     dlon = max_lon - min_lon
@@ -112,16 +107,17 @@ def zoom_to_data(ax, data):
 
 
 def find_max_distance(reference_point, data):
-    max_point = reference_point
-    max_distance = 0
+    data = as_reading_set(data)
+    if len(data) == 0:
+        return reference_point
 
-    for d in data:
-        distance = d.distance(reference_point)
-        if distance > max_distance:
-            max_distance = distance
-            max_point = d
-
-    return max_point
+    # The farthest point is always a vertex of the convex hull
+    candidates = data.spatial_index().hull_vertices()
+    distances = data[candidates].distance(reference_point)
+    index = int(np.argmax(distances))
+    if distances[index] > 0:
+        return data[int(candidates[index])]
+    return reference_point
 
 
 def plot_maps(fig, ax, ortho_maps):
@@ -130,10 +126,12 @@ def plot_maps(fig, ax, ortho_maps):
 
 
 def plot_data_path(ax, data):
-    ax.plot([d.lon for d in data], [d.lat for d in data], 'k--', lw=1)
+    data = as_reading_set(data)
+    ax.plot(data.lon, data.lat, 'k--', lw=1)
 
 
 def display_data_path(data, ortho_maps):
+    data = as_reading_set(data)
     fig, ax = plt.subplots(figsize=(16, 6))
 
     plot_maps(fig, ax, ortho_maps)
@@ -146,6 +144,7 @@ def display_data_path(data, ortho_maps):
 
 
 def save_data_path(data, ortho_maps, filename):
+    data = as_reading_set(data)
     fig, ax = plt.subplots(figsize=(16, 6))
 
     plot_maps(fig, ax, ortho_maps)
@@ -158,7 +157,8 @@ def save_data_path(data, ortho_maps, filename):
 
 
 def plot_data_altitude(ax, data):
-    ax.plot([d.time for d in data], [d.alt for d in data])
+    data = as_reading_set(data)
+    ax.plot(data.datetimes(), data.alt)
 
     ax.set_xlabel('Time')
 
@@ -173,9 +173,8 @@ def display_data_altitude(data):
 
     ax.plot()
 
-krige_data = {}
-
-def plot_krige(name, fig, ax, lons, lats, data, nlags=6, minco2=None, maxco2=None, legend=True, paths_lons=None, paths_lats=None):
+# name is unused since grids are cached by content, it stays first so existing calls keep working
+def plot_krige(name, fig, ax, lons, lats, data, nlags=6, minco2=None, maxco2=None, legend=True, paths_lons=None, paths_lats=None, engine=None, cell=None, resolution=40, workers=None, incremental=None, mask=None):
 
     if paths_lons is None:
         paths_lons = lons
@@ -198,47 +197,24 @@ def plot_krige(name, fig, ax, lons, lats, data, nlags=6, minco2=None, maxco2=Non
         blues_map_object = LinearSegmentedColormap.from_list(name='blues_alpha',colors=blues_color_array)
         plt.register_cmap(cmap=blues_map_object)
 
-    grid_margin = 0.00002
-
-    lat_grid_space = (max(paths_lats) - min(paths_lats)) / 40
-    lon_grid_space = (max(paths_lons) - min(paths_lons)) / 40
-    grid_lon = np.arange(np.amin(paths_lons) - grid_margin, np.amax(paths_lons) + grid_margin, lon_grid_space)  # grid_space is the desired delta/step of the output array
-    grid_lat = np.arange(np.amin(paths_lats) - grid_margin, np.amax(paths_lats) + grid_margin, lat_grid_space)
-
-    if name in krige_data.keys():
-        z1 = krige_data[name]
+    if incremental is not None:
+        # A survey in progress, drawn from the cells its appended readings refreshed
+        grid_lon, grid_lat = incremental.grid_lon, incremental.grid_lat
+        z1 = incremental.z1
     else:
-        OK = OrdinaryKriging(lons, lats, data, nlags=nlags)
-        z1, ss1 = OK.execute('grid', grid_lon, grid_lat)
-        krige_data[name] = z1
+        grid_lon, grid_lat = grid_axes(paths_lons, paths_lats, resolution)
+        z1, ss1 = krige_grid(lons, lats, data, grid_lon, grid_lat, nlags, engine=engine, cell=cell, workers=workers, mask=mask)
 
     xintrp, yintrp = np.meshgrid(grid_lon, grid_lat)
 
-    maximum = max(map(max, *z1)) if maxco2 is None else maxco2
-    minimum = min(map(min, *z1)) if minco2 is None else minco2
+    # Cells outside the mask are NaN, which contourf leaves blank
+    maximum = np.nanmax(z1) if maxco2 is None else maxco2
+    minimum = np.nanmin(z1) if minco2 is None else minco2
 
     cs = ax.contourf(xintrp, yintrp, z1, np.linspace(minimum, maximum, 100), extend='max', cmap='blues_alpha')
 
     cs_lines = ax.contour(xintrp, yintrp, z1, np.linspace(minimum, maximum, 15), cmap='Reds', linewidths = 0.8)
 
-#     points = []
-#     for i in range(len(lons)):
-#         points.append([lons[i], lats[i]])
-#     #points = np.array(zip(lons, lats))
-#     points = np.array(points)
-#     hull = ConvexHull(points)
-#
-#     hullPoints = [points[v] for v in hull.vertices]
-#
-#     clippath = Path(hullPoints)
-#     patch = PathPatch(clippath, facecolor='none', ec='none')
-#     ax.add_patch(patch)
-#     for c in cs.collections:
-#         c.set_clip_path(patch)
-#
-#     for c in cs_lines.collections:
-#         c.set_clip_path(patch)
-
     def fmt(x, pos):
         if minco2 is None or maxco2 is None:
             return r'${:.1f}$'.format(x)
@@ -256,18 +232,19 @@ def display_krige(name, csv_file, ortho_map, nlags=6):
     # Load CSV data
     [lons, lats, data] = load_csv(csv_file)
 
-    plot_krige(name, ax, lons, lats, data, nlags)
+    plot_krige(name, fig, ax, lons, lats, data, nlags)
 
     geo_axis_format(ax)
     ax.plot()
 
 
-def display_readings_krige(name, readings, ortho_maps, nlags=6, minco2=None, maxco2=None, addons=None):
+def display_readings_krige(name, readings, ortho_maps, nlags=6, minco2=None, maxco2=None, addons=None, cell=None):
+    readings = as_reading_set(readings)
     fig, ax = plt.subplots(figsize=(16, 6))
 
     plot_maps(fig, ax, ortho_maps)
 
-    plot_krige(name, fig, ax, [r.lon for r in readings], [r.lat for r in readings], [r.value for r in readings], nlags, minco2, maxco2)
+    plot_krige(name, fig, ax, readings.lon, readings.lat, readings.value, nlags, minco2, maxco2, cell=cell)
 
     zoom_to_data(ax, readings)
     geo_axis_format(ax)
@@ -278,12 +255,13 @@ def display_readings_krige(name, readings, ortho_maps, nlags=6, minco2=None, max
     ax.plot()
 
 
-def save_readings_krige(name, readings, ortho_maps, filename, nlags=6):
+def save_readings_krige(name, readings, ortho_maps, filename, nlags=6, cell=None):
+    readings = as_reading_set(readings)
     fig, ax = plt.subplots(figsize=(16, 6))
 
     plot_maps(fig, ax, ortho_maps)
 
-    plot_krige(name, fig, ax, [r.lon for r in readings], [r.lat for r in readings], [r.value for r in readings], nlags)
+    plot_krige(name, fig, ax, readings.lon, readings.lat, readings.value, nlags, cell=cell)
 
     zoom_to_altitude_data(ax, readings)
     geo_axis_format(ax)
@@ -291,9 +269,10 @@ def save_readings_krige(name, readings, ortho_maps, filename, nlags=6):
 
 
 def display_altitude_readings_krige(name, readings, nlags=6):
+    readings = as_reading_set(readings)
     fig, ax = plt.subplots(figsize=(16, 6))
 
-    plot_krige(name, fig, ax, [r.lon * 40008000 / 360  for r in readings], [r.alt for r in readings], [r.value for r in readings], nlags)
+    plot_krige(name, fig, ax, readings.lon * METERS_PER_DEGREE, readings.alt, readings.value, nlags)
 
     ax.set_xlabel('Distance')
     ax.xaxis.set_major_formatter(FormatStrFormatter('%.2f'))
@@ -303,9 +282,10 @@ def display_altitude_readings_krige(name, readings, nlags=6):
 
 
 def save_altitude_readings_krige(name, readings, filename, nlags=6):
+    readings = as_reading_set(readings)
     fig, ax = plt.subplots(figsize=(16, 6))
 
-    plot_krige(name, fig, ax, [r.lon * 40008000 / 360 for r in readings], [r.alt for r in readings], [r.value for r in readings], nlags)
+    plot_krige(name, fig, ax, readings.lon * METERS_PER_DEGREE, readings.alt, readings.value, nlags)
 
     zoom_to_data(ax, readings)
     ax.set_xlabel('Longitude')
@@ -315,11 +295,10 @@ def save_altitude_readings_krige(name, readings, filename, nlags=6):
 
 
 def filter_zero(data):
-    filtered = []
-    for d in data:
-        if d.lat != 0 and d.lon != 0:
-            filtered.append(d)
-    return filtered
+    """The readings with a position, a ReadingSet for a ReadingSet and otherwise a list of the same Readings."""
+    if isinstance(data, ReadingSet):
+        return data.nonzero()
+    return [d for d in data if d.lat != 0 and d.lon != 0]
 
 def display_maps(maps):
     fig, ax = plt.subplots(figsize=(15, 30))
@@ -329,7 +308,8 @@ def display_maps(maps):
     ax.plot()
 
 def plot_readings(fig, ax, readings):
-    ax.plot([r.time for r in readings], [r.value for r in readings])
+    readings = as_reading_set(readings)
+    ax.plot(readings.datetimes(), readings.value)
 
     ax.set_xlabel('Time')
     ax.set_ylabel('CO2 PPM')
@@ -344,29 +324,30 @@ def display_readings(readings):
 
 
 def plot_scatter(fig, ax, readings, draw_path):
-    min_reading = min([r.value for r in readings])
-    max_reading = max([r.value for r in readings])
+    readings = as_reading_set(readings)
+    min_reading = readings.value.min()
+    max_reading = readings.value.max()
 #    values = [2000 * ((r.value - min_reading) / (max_reading - min_reading)) ** 2 for r in readings]
-    values = [1.0 * r.value for r in readings]
+    values = readings.value
 #[(r.value - min_reading) / (max_reading - min_reading) for r in readings]
     ax.autoscale(False)
-    sc = ax.scatter([r.lon for r in readings],
-                    [r.lat for r in readings],
+    sc = ax.scatter(readings.lon,
+                    readings.lat,
                     c=values,
                     marker='o')
 
     if draw_path:
-        ax.plot([r.lon for r in readings],
-                [r.lat for r in readings],
+        ax.plot(readings.lon,
+                readings.lat,
                 'k--',
                 label='parametric curve 1')
 
     ax.set_xlabel('Longitude')
-    ax.set_xlim(min([r.lon for r in readings]), max([r.lon for r in readings]))
+    ax.set_xlim(readings.lon.min(), readings.lon.max())
 
 
     ax.set_ylabel('Latitude')
-    ax.set_ylim(min([r.lat for r in readings]), max([r.lat for r in readings]))
+    ax.set_ylim(readings.lat.min(), readings.lat.max())
 
     # fig.colorbar(sc)
 
@@ -381,27 +362,28 @@ def plot_scatter(fig, ax, readings, draw_path):
 #     fig.legend()
 
 def plot_altitude_scatter(fig, ax, readings):
-    min_reading = min([r.value for r in readings])
-    max_reading = max([r.value for r in readings])
+    readings = as_reading_set(readings)
+    min_reading = readings.value.min()
+    max_reading = readings.value.max()
 #    values = [2000 * ((r.value - min_reading) / (max_reading - min_reading)) ** 2 for r in readings]
-    values = [1.0 * r.value for r in readings]
+    values = readings.value
     ax.autoscale(False)
-    sc = ax.scatter([r.lon for r in readings],
-                    [r.alt for r in readings],
+    sc = ax.scatter(readings.lon,
+                    readings.alt,
                     c=values,
                     marker='o')
-    ax.plot([r.lon for r in readings],
-            [r.lat for r in readings],
+    ax.plot(readings.lon,
+            readings.lat,
             'k--',
             label='parametric curve 1')
     ax.legend()
 
     ax.set_xlabel('Longitude')
-    ax.set_xlim(min([r.lon for r in readings]), max([r.lon for r in readings]))
+    ax.set_xlim(readings.lon.min(), readings.lon.max())
 
 
     ax.set_ylabel('Altitude (m)')
-    ax.set_ylim(min([r.alt for r in readings]), max([r.alt for r in readings]))
+    ax.set_ylim(readings.alt.min(), readings.alt.max())
 
 
     fig.colorbar(sc)
@@ -416,10 +398,11 @@ def plot_altitude_scatter(fig, ax, readings):
 #    fig.legend(legendCircles, legendNames, numpoints=1)
 
 def plot_altitude_reading_scatter(fig, ax, readings):
-    minimum_alt = int(min([r.alt for r in readings]))
+    readings = as_reading_set(readings)
+    minimum_alt = int(readings.alt.min())
 
-    ax.scatter([r.alt - minimum_alt for r in readings],
-               [r.value for r in readings],
+    ax.scatter(readings.alt - minimum_alt,
+               readings.value,
                s=1,
                marker='o')
 
@@ -434,6 +417,7 @@ def display_altitude_reading_scatter(readings):
 
 
 def display_scatter(readings, maps, draw_path=True):
+    readings = as_reading_set(readings)
     fig, ax = plt.subplots(figsize=(16, 6))
     plot_maps(fig, ax, maps)
     plot_scatter(fig, ax, readings, draw_path)
@@ -444,6 +428,7 @@ def display_scatter(readings, maps, draw_path=True):
     ax.plot()
 
 def save_scatter(readings, maps, filename, draw_path=True):
+    readings = as_reading_set(readings)
     fig, ax = plt.subplots(figsize=(16, 6))
     plot_maps(fig, ax, maps)
     plot_scatter(fig, ax, readings, draw_path)
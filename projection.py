@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+
+import numpy as np
+
+try:
+    import pyproj
+except ImportError:
+    pyproj = None
+
+EARTH_CIRCUMFERENCE = 40008000
+METERS_PER_DEGREE = EARTH_CIRCUMFERENCE / 360.0
+# Degrees to radians as the flat earth conversions have always used it
+RADIANS_PER_DEGREE = 0.01745
+EARTH_RADIUS = 6371008.8
+
+def meters_per_degree_longitude(lat):
+    return METERS_PER_DEGREE * np.cos(np.asarray(lat, dtype=np.float64) * RADIANS_PER_DEGREE)
+
+def meters_to_longitude(meters, lat):
+    """Degrees of longitude spanning meters at latitude lat."""
+    return meters / meters_per_degree_longitude(lat)
+
+def difference_in_meters(lat, lon, lat0, lon0):
+    """East and north meters from (lat0, lon0) to (lat, lon), scaled by the cosine of lat.
+
+    Takes scalars or arrays and broadcasts them.
+    """
+    lat = np.asarray(lat, dtype=np.float64)
+    east = (np.asarray(lon, dtype=np.float64) - lon0) * meters_per_degree_longitude(lat)
+    north = (lat - lat0) * METERS_PER_DEGREE
+    return east, north
+
+def offset_position(lat, lon, east, north):
+    """Moves (lat, lon) by east and north meters, scaling longitude at the new latitude."""
+    latitude = np.asarray(lat, dtype=np.float64) + np.asarray(north, dtype=np.float64) / METERS_PER_DEGREE
+    longitude = np.asarray(lon, dtype=np.float64) + meters_to_longitude(np.asarray(east, dtype=np.float64), latitude)
+    return latitude, longitude
+
+def equirectangular_distance(lat1, lon1, lat2, lon2):
+    east, north = difference_in_meters(lat1, lon1, lat2, lon2)
+    return np.sqrt((east * east) + (north * north))
+
+def haversine_distance(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = [np.radians(np.asarray(value, dtype=np.float64)) for value in [lat1, lon1, lat2, lon2]]
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+def distance_matrix(lat1, lon1, lat2, lon2, method=equirectangular_distance):
+    """Distances in meters between every point of the first set and every point of the second."""
+    lat1 = np.asarray(lat1, dtype=np.float64)[:, None]
+    lon1 = np.asarray(lon1, dtype=np.float64)[:, None]
+    return method(lat1, lon1, np.asarray(lat2, dtype=np.float64)[None, :], np.asarray(lon2, dtype=np.float64)[None, :])
+
+class LocalProjection:
+    """East/north meters around a fixed site origin, using the cosine of the origin latitude."""
+
+    def __init__(self, lat0, lon0):
+        self.lat0 = lat0
+        self.lon0 = lon0
+        self.lon_scale = float(meters_per_degree_longitude(lat0))
+
+    def to_local(self, lat, lon):
+        east = (np.asarray(lon, dtype=np.float64) - self.lon0) * self.lon_scale
+        north = (np.asarray(lat, dtype=np.float64) - self.lat0) * METERS_PER_DEGREE
+        return east, north
+
+    def to_latlon(self, east, north):
+        lat = self.lat0 + np.asarray(north, dtype=np.float64) / METERS_PER_DEGREE
+        lon = self.lon0 + np.asarray(east, dtype=np.float64) / self.lon_scale
+        return lat, lon
+
+projections = {}
+
+def site_projection(lat0, lon0):
+    """Shared LocalProjection per site origin."""
+    key = (float(lat0), float(lon0))
+    if key not in projections:
+        projections[key] = LocalProjection(lat0, lon0)
+    return projections[key]
+
+def utm_zone(lat, lon):
+    """EPSG code of the WGS84 UTM zone holding the mean position."""
+    zone = int((np.mean(lon) + 180) // 6) % 60 + 1
+    return (32600 if np.mean(lat) >= 0 else 32700) + zone
+
+def to_utm(lat, lon, epsg=None):
+    """UTM easting and northing, in the zone of the points unless epsg is given. Needs pyproj."""
+    if pyproj is None:
+        raise ImportError('UTM projection requires pyproj')
+    if epsg is None:
+        epsg = utm_zone(lat, lon)
+    transformer = pyproj.Transformer.from_crs(4326, epsg, always_xy=True)
+    easting, northing = transformer.transform(np.asarray(lon, dtype=np.float64), np.asarray(lat, dtype=np.float64))
+    return easting, northing, epsg
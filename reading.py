@@ -1,8 +1,18 @@
 #!/usr/bin/env python
 
-import math
+import datetime, math
+import numpy as np
+
+from .binning import bin_columns
+from .logscan import NO_TIME
+from .projection import equirectangular_distance
+from .spatialindex import SpatialIndex
+
+EPOCH = datetime.datetime(1970, 1, 1)
 
 class Reading:
+    __slots__ = ('time', 'value', 'lat', 'lon', 'alt')
+
     def __init__(self, time, value, lat, lon, alt):
         self.time = time
         self.value = float(value)
@@ -19,7 +29,95 @@ class Reading:
         return math.sqrt((deltax * deltax) + (deltay * deltay))
 
     def distance_in_meters(self, other):
-        earthCircumference = 40008000
-        deltay = (self.lon - other.lon) * (earthCircumference / 360) * math.cos(self.lat * 0.01745)
-        deltax = (self.lat - other.lat)  * (earthCircumference / 360)
-        return math.sqrt((deltax * deltax) + (deltay * deltay))
\ No newline at end of file
+        return float(equirectangular_distance(self.lat, self.lon, other.lat, other.lon))
+
+def to_datetime(time):
+    return None if time == NO_TIME else EPOCH + datetime.timedelta(microseconds=int(time) // 1000)
+
+class ReadingSet:
+    """Readings stored as columns: time as int64 epoch ns, value, lat, lon and alt as float64.
+
+    Slicing returns views of the same columns, masks and index arrays return
+    copies, and single items come back as Reading objects so code written
+    for lists of readings keeps working.
+    """
+
+    def __init__(self, time, value, lat, lon, alt):
+        self.time = np.asarray(time, dtype=np.int64)
+        self.value = np.asarray(value, dtype=np.float64)
+        self.lat = np.asarray(lat, dtype=np.float64)
+        self.lon = np.asarray(lon, dtype=np.float64)
+        self.alt = np.asarray(alt, dtype=np.float64)
+        self.index = None
+
+    @classmethod
+    def from_columns(cls, columns):
+        """Builds a set from time (epoch ns), co2, lat, lon and alt columns."""
+        return cls(columns['time'], columns['co2'], columns['lat'], columns['lon'], columns['alt'])
+
+    @classmethod
+    def from_readings(cls, readings):
+        times = [reading.time for reading in readings]
+        try:
+            times = np.array(times, dtype='datetime64[ns]').astype(np.int64)
+        except (TypeError, ValueError):
+            times = np.full(len(times), NO_TIME, dtype=np.int64)
+        return cls(times,
+                   [reading.value for reading in readings],
+                   [reading.lat for reading in readings],
+                   [reading.lon for reading in readings],
+                   [reading.alt for reading in readings])
+
+    def __len__(self):
+        return len(self.value)
+
+    def __getitem__(self, index):
+        if isinstance(index, (int, np.integer)):
+            return Reading(to_datetime(self.time[index]), self.value[index], self.lat[index], self.lon[index], self.alt[index])
+        return ReadingSet(self.time[index], self.value[index], self.lat[index], self.lon[index], self.alt[index])
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+    def columns(self):
+        return {'time': self.time, 'co2': self.value, 'lat': self.lat, 'lon': self.lon, 'alt': self.alt}
+
+    def readings(self):
+        return list(self)
+
+    def datetimes(self):
+        return self.time.astype('datetime64[ns]')
+
+    def add(self, latadd, lonadd):
+        return ReadingSet(self.time, self.value, self.lat + latadd, self.lon + lonadd, self.alt)
+
+    def distance(self, other):
+        deltax = self.lat - other.lat
+        deltay = self.lon - other.lon
+        return np.sqrt((deltax * deltax) + (deltay * deltay))
+
+    def distance_in_meters(self, other):
+        return equirectangular_distance(self.lat, self.lon, other.lat, other.lon)
+
+    def spatial_index(self):
+        """KD-tree of the positions, built on first use and kept with the set."""
+        if self.index is None:
+            self.index = SpatialIndex(self.lat, self.lon)
+        return self.index
+
+    def binned(self, cell, statistic='mean'):
+        """One reading per cell of cell meters, see binning.bin_columns."""
+        binned = bin_columns(self.lat, self.lon, self.value, self.time, self.alt, cell, statistic)
+        return ReadingSet(binned['time'], binned['value'], binned['lat'], binned['lon'], binned['alt'])
+
+    def nonzero(self):
+        """The readings with a position, replaces plot_util.filter_zero."""
+        return self[(self.lat != 0) & (self.lon != 0)]
+
+def as_reading_set(readings):
+    return readings if isinstance(readings, ReadingSet) else ReadingSet.from_readings(readings)
+
+def readings_from_columns(columns):
+    """Builds Reading objects from time (epoch ns), co2, lat, lon and alt columns."""
+    return ReadingSet.from_columns(columns).readings()
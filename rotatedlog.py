@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+
+import argparse, os, re, warnings
+import numpy as np
+
+from .logscan import apply_zeroing, parse_timestamp, scan_block, to_time
+from .logtocsv import parse_lines
+
+def rotation_index(path, name):
+    suffix = os.path.basename(path)[len(name):]
+    return int(suffix[1:]) if suffix else 0
+
+def first_timestamp(path):
+    """Returns the epoch ns of the first timestamped line of a log, or None."""
+    with open(path, 'r') as inputFile:
+        for line in inputFile:
+            lineparts = line.split()
+            if len(lineparts) > 1:
+                stamp = parse_timestamp(lineparts[0], lineparts[1])
+                if stamp is not None:
+                    return to_time([stamp])[0]
+    return None
+
+def rotated_files(directory, name='run.log'):
+    """Lists a rotated log set (name, name.1 ... name.N) oldest first.
+
+    Files are ordered by rotation index, the highest being the oldest, as the
+    clocks the timestamps come from jump between boots. Files without any
+    timestamp carry no records and are kept with a warning.
+    """
+    pattern = re.compile(r'^{}(\.\d+)?$'.format(re.escape(name)))
+    paths = [os.path.join(directory, file) for file in os.listdir(directory) if pattern.match(file)]
+    paths.sort(key=lambda path: -rotation_index(path, name))
+
+    for path in paths:
+        if first_timestamp(path) is None:
+            warnings.warn("{} has no timestamped lines".format(path))
+    return paths
+
+def neighbours(previous, path, name='run.log'):
+    """Whether path was rotated right after previous, so a line cut off at the end of previous continues in path."""
+    return rotation_index(previous, name) == rotation_index(path, name) + 1
+
+def read_rotated_lines(paths, name='run.log'):
+    """Yields the lines of consecutive log files as one stream.
+
+    A file that was cut off without a final newline continues on the first
+    line of the next file in the rotation, so the two pieces are joined back
+    into one line. Pieces of files that are not neighbours stay apart.
+    """
+    partial = ''
+    previous = None
+    for path in paths:
+        if partial and not neighbours(previous, path, name):
+            yield partial + '\n'
+            partial = ''
+        with open(path, 'r') as inputFile:
+            for line in inputFile:
+                if partial:
+                    line = partial + line
+                    partial = ''
+                if line.endswith('\n'):
+                    yield line
+                else:
+                    partial = line
+        previous = path
+    if partial:
+        yield partial
+
+def parse_rotated_log(directory, skip_zeroing, name='run.log'):
+    """Yields the LogEntry records of a rotated log set in time order.
+
+    Line numbers count from the first line of the oldest file and the zeroing
+    state carries over from one file to the next.
+    """
+    return parse_lines(read_rotated_lines(rotated_files(directory, name), name), skip_zeroing)
+
+def rotated_chunks(paths, name='run.log'):
+    """The bytes of each file, with a newline ending any cut off line that does not continue in the next file."""
+    chunks = []
+    for index, path in enumerate(paths):
+        with open(path, 'rb') as inputFile:
+            chunk = inputFile.read()
+        if chunk and not chunk.endswith(b'\n') and index + 1 < len(paths) and not neighbours(path, paths[index + 1], name):
+            chunk += b'\n'
+        chunks.append(chunk)
+    return chunks
+
+def read_rotated_bytes(paths, name='run.log'):
+    # Neighbouring files were cut on byte boundaries so their bytes join back into whole lines
+    return b''.join(rotated_chunks(paths, name))
+
+def scan_rotated_log(directory, skip_zeroing, name='run.log'):
+    """Columnar version of parse_rotated_log, see logscan.scan_log for the columns.
+
+    Byte offsets count from the start of the oldest file.
+    """
+    data = read_rotated_bytes(rotated_files(directory, name), name)
+    columns, toggles, line_count = scan_block(np.frombuffer(data, dtype=np.uint8), False)
+    apply_zeroing(columns, toggles, skip_zeroing)
+    return columns
+
+def write_rotated_log(directory, output, name='run.log'):
+    with open(output, 'w') as outputFile:
+        for line in read_rotated_lines(rotated_files(directory, name), name):
+            outputFile.write(line)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = 'Join a rotated Dragonfly log set into one log')
+    parser.add_argument('--directory', type=str, help='Directory holding run.log, run.log.1 ...')
+    parser.add_argument('--output', type=str, help='Output Dragonfly log.')
+    parser.add_argument('--name', type=str, help='Base name of the rotated set.', default='run.log')
+    args = parser.parse_args()
+
+    write_rotated_log(args.directory, args.output, args.name)
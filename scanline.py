@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+
+import numpy as np
+
+def polygon_edges(points):
+    """Start and end coordinates of the polygon's edges, closing it back to the first vertex."""
+    points = np.asarray(points, dtype=np.float64)[:, :2]
+    following = np.roll(points, -1, axis=0)
+    return points[:, 0], points[:, 1], following[:, 0], following[:, 1]
+
+def y_range(points):
+    """Lowest and highest y of the polygon."""
+    points = np.asarray(points, dtype=np.float64)
+    return float(points[:, 1].min()), float(points[:, 1].max())
+
+def merged(spans, tolerance):
+    """Joins (start, end) spans that overlap or meet to within tolerance, left to right."""
+    joined = []
+    for start, end in sorted(spans):
+        if joined and start <= joined[-1][1] + tolerance:
+            joined[-1][1] = max(joined[-1][1], end)
+        else:
+            joined.append([start, end])
+    return [(float(start), float(end)) for start, end in joined]
+
+def row_intervals(points, ys):
+    """The x intervals each horizontal line y in ys spends inside the polygon.
+
+    Every row is intersected with every edge at once and gets the intervals
+    between its crossings by the even-odd rule, so rows across a concave
+    boundary get several, left to right. The parts of the boundary lying
+    on the row, its horizontal edges and the vertices it passes through,
+    are joined in, so a row along the top of a notch follows the edges on
+    either side without spanning the gap. For a convex polygon this is the
+    single interval between the smallest and largest x on the row. Rows
+    missing the polygon get no intervals.
+    """
+    x1, y1, x2, y2 = polygon_edges(points)
+    rows = np.asarray(ys, dtype=np.float64).reshape(-1, 1)
+    lower = np.minimum(y1, y2)
+    upper = np.maximum(y1, y2)
+    flat = y1 == y2
+    x = x1 + (rows - y1) * (x2 - x1) / np.where(flat, 1.0, y2 - y1)
+
+    # Half open so a row through a vertex crosses only one of its edges
+    crossing = (lower <= rows) & (rows < upper)
+    crossings = np.sort(np.where(crossing, x, np.nan), axis=1)
+    counts = crossing.sum(axis=1)
+    on_row = flat & (y1 == rows)
+    left = np.minimum(x1, x2)
+    right = np.maximum(x1, x2)
+    tolerance = 1e-12 * max(1.0, float(np.abs(np.concatenate((x1, y1))).max()))
+
+    intervals = []
+    for row in range(len(rows)):
+        spans = crossings[row, :counts[row] - counts[row] % 2].reshape(-1, 2).tolist()
+        spans += [[start, end] for start, end in zip(left[on_row[row]], right[on_row[row]])]
+        spans += [[vertex, vertex] for vertex in x1[y1 == rows[row, 0]]]
+        intervals.append(merged(spans, tolerance))
+    return intervals
+
+def x_range(points, y):
+    """Lowest and highest x of the polygon along the line y, None when the line misses it."""
+    intervals = row_intervals(points, [y])[0]
+    if not intervals:
+        return None
+    return intervals[0][0], intervals[-1][1]
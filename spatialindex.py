@@ -0,0 +1,61 @@
+#!/usr/bin/env python
+
+import numpy as np
+from scipy.spatial import ConvexHull, cKDTree
+
+try:
+    from .projection import site_projection
+except (ImportError, ValueError):
+    from projection import site_projection
+
+class SpatialIndex:
+    """KD-tree over lat/lon positions projected to meters around a site origin.
+
+    Queries take scalars or arrays of positions and are answered in one batch.
+    The origin defaults to the first position.
+    """
+
+    def __init__(self, lat, lon, origin=None):
+        self.lat = np.asarray(lat, dtype=np.float64)
+        self.lon = np.asarray(lon, dtype=np.float64)
+        if origin is None:
+            origin = (self.lat[0], self.lon[0]) if len(self.lat) else (0.0, 0.0)
+        self.projection = site_projection(origin[0], origin[1])
+        self.points = self.project(self.lat, self.lon)
+        self.tree = cKDTree(self.points)
+        self.hull = None
+
+    def __len__(self):
+        return len(self.lat)
+
+    def project(self, lat, lon):
+        east, north = self.projection.to_local(np.atleast_1d(lat), np.atleast_1d(lon))
+        return np.column_stack((east, north))
+
+    def nearest(self, lat, lon, k=1):
+        """Distances in meters and indices of the k nearest positions to each query."""
+        return self.tree.query(self.project(lat, lon), k)
+
+    def within(self, lat, lon, radius):
+        """Sorted index arrays of the positions within radius meters of each query."""
+        return [np.array(sorted(found), dtype=np.int64) for found in self.tree.query_ball_point(self.project(lat, lon), radius)]
+
+    def within_bbox(self, min_lat, min_lon, max_lat, max_lon):
+        """Sorted indices of the positions inside a lat/lon box."""
+        corners = self.project([min_lat, max_lat], [min_lon, max_lon])
+        center = corners.mean(axis=0)
+        radius = np.hypot(*(corners[1] - corners[0])) / 2
+        candidates = np.array(sorted(self.tree.query_ball_point(center, radius * (1 + 1e-9) + 1e-6)), dtype=np.int64)
+        inside = (self.lat[candidates] >= min_lat) & (self.lat[candidates] <= max_lat) & \
+            (self.lon[candidates] >= min_lon) & (self.lon[candidates] <= max_lon)
+        return candidates[inside]
+
+    def hull_vertices(self):
+        """Sorted indices of the convex hull vertices, the only candidates for a farthest point."""
+        if self.hull is None:
+            try:
+                self.hull = np.sort(ConvexHull(self.points).vertices)
+            except (RuntimeError, ValueError):
+                # QhullError, fewer than three points or all of them on a line
+                self.hull = np.arange(len(self.points))
+        return self.hull
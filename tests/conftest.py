@@ -0,0 +1,20 @@
+import importlib.util, os, sys
+
+# Parsed logs and grids are computed afresh, never read from a cache
+os.environ['DRAGONFLY_CACHE_DIR'] = ''
+os.environ.setdefault('MPLBACKEND', 'Agg')
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def load_package(name='dragonfly'):
+    """Imports the repository as the package name, whatever its directory is called."""
+    if name not in sys.modules:
+        spec = importlib.util.spec_from_file_location(name, os.path.join(ROOT, '__init__.py'), submodule_search_locations=[ROOT])
+        module = importlib.util.module_from_spec(spec)
+        sys.modules[name] = module
+        spec.loader.exec_module(module)
+    return sys.modules[name]
+
+load_package()
+# The planning modules are also run as standalone scripts and import each other absolutely
+sys.path.insert(0, ROOT)
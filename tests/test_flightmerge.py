@@ -0,0 +1,66 @@
+import numpy as np
+import pytest
+
+from dragonfly import flightmerge
+from dragonfly.flightmerge import SECOND, asof_merge, clock_segments, estimate_clock_offsets, segment_offsets
+from dragonfly.logscan import NO_TIME
+from dragonfly.projection import offset_position
+
+LAT, LON = 38.5, -110.7
+# The flight starts in December 2020, the CO2 log clock in February 2016 and it jumps years ahead mid flight
+START = 1609180320 * SECOND
+OFFSETS = [153974309400000000, -3000000000]
+
+def spiral_track(duration=1800):
+    """One fix a second along an outward spiral, so no position repeats."""
+    seconds = np.arange(duration, dtype=np.float64)
+    angle = seconds / 40.0
+    lat, lon = offset_position(LAT, LON, 20.0 * angle * np.cos(angle), 20.0 * angle * np.sin(angle))
+    return {'time': START + np.arange(duration, dtype=np.int64) * SECOND, 'lat': lat, 'lon': lon, 'alt': np.full(duration, 40.0)}
+
+def logged_readings(track, offsets, count=2400):
+    """Readings every 0.7 s, logged with their position a meter off, whose clock runs offsets behind in each half."""
+    times = track['time'][0] + (np.arange(count) * 0.7 * SECOND).astype(np.int64)
+    lat = np.interp(times, track['time'], track['lat'])
+    lon = np.interp(times, track['time'], track['lon'])
+    lat, lon = offset_position(lat, lon, np.cos(np.arange(count)), np.sin(np.arange(count)))
+    half = count // 2
+    clock = times - np.where(np.arange(count) < half, offsets[0], offsets[1])
+    return {'time': clock, 'co2': np.linspace(400, 420, count), 'lat': lat, 'lon': lon, 'alt': np.full(count, 40.0), 'line': np.arange(count)}
+
+def test_clock_segments_split_at_jumps():
+    times = np.array([0, 1, 2, 5000, 5001, 9000], dtype=np.int64) * SECOND
+    assert clock_segments(times) == [(0, 3), (3, 5), (5, 6)]
+    assert clock_segments(np.zeros(0, dtype=np.int64)) == []
+
+def test_offsets_are_estimated_per_clock_segment():
+    track = spiral_track()
+    readings = logged_readings(track, OFFSETS)
+    segments = estimate_clock_offsets(readings, track)
+    assert [(start, end) for start, end, offset in segments] == [(0, 1200), (1200, 2400)]
+    for (start, end, offset), expected in zip(segments, OFFSETS):
+        assert abs(offset - expected) <= SECOND // 10
+
+    merged = asof_merge(readings, track, segment_offsets(segments, len(readings['time'])))
+    assert merged['matched'].mean() > 0.95
+
+def test_segments_away_from_the_track_are_left_unaligned():
+    track = spiral_track()
+    readings = logged_readings(track, OFFSETS)
+    readings['lat'][1200:] += 1.0
+    with pytest.warns(UserWarning, match='unaligned'):
+        segments = estimate_clock_offsets(readings, track)
+    assert segments[1] == (1200, 2400, None)
+
+    merged = asof_merge(readings, track, segment_offsets(segments, len(readings['time'])))
+    assert not merged['matched'][1200:].any()
+    assert (merged['time'][1200:] == NO_TIME).all()
+    assert merged['matched'][:1200].mean() > 0.95
+
+def test_position_matches_are_capped(monkeypatch):
+    monkeypatch.setattr(flightmerge, 'MAX_OFFSET_PAIRS', 500)
+    track = spiral_track()
+    readings = logged_readings(track, [OFFSETS[0], OFFSETS[0]])
+    with pytest.warns(UserWarning, match='using 1 in'):
+        segments = estimate_clock_offsets(readings, track)
+    assert abs(segments[0][2] - OFFSETS[0]) <= SECOND // 10
@@ -0,0 +1,39 @@
+import numpy as np
+import pytest
+
+from dragonfly.gridmask import survey_mask
+from dragonfly.kriging import krige_grid
+
+QUICK_ENGINES = ['idw', 'rbf', 'gp']
+
+def plume(count, seed=0):
+    random = np.random.RandomState(seed)
+    x, y = random.rand(2, count)
+    return x, y, 420 + 40 * np.exp(-((x - 0.5) ** 2 + (y - 0.4) ** 2) / 0.05)
+
+@pytest.mark.parametrize('engine', QUICK_ENGINES)
+def test_engines_follow_a_smooth_plume(engine):
+    x, y, values = plume(800)
+    grid = np.linspace(0, 1, 21)
+    mask = survey_mask(x, y, grid, grid, 'convex')
+    z1, ss1 = krige_grid(x, y, values, grid, grid, engine=engine, mask=mask)
+    cell_x, cell_y = np.meshgrid(grid, grid)
+    truth = 420 + 40 * np.exp(-((cell_x - 0.5) ** 2 + (cell_y - 0.4) ** 2) / 0.05)
+    assert np.array_equal(np.isnan(z1), ~mask)
+    assert np.abs(z1 - truth)[mask].max() < 0.1 * np.ptp(values)
+    assert (ss1[mask] >= 0).all()
+
+@pytest.mark.parametrize('engine', QUICK_ENGINES)
+@pytest.mark.parametrize('count', [1, 2])
+def test_engines_take_one_or_two_samples(engine, count):
+    x, y = np.linspace(0.2, 0.8, count), np.linspace(0.3, 0.6, count)
+    values = 420 + np.arange(count, dtype=np.float64)
+    z1, ss1 = krige_grid(x, y, values, np.linspace(0, 1, 5), np.linspace(0, 1, 5), engine=engine)
+    assert np.isfinite(z1).all() and np.isfinite(ss1).all()
+    assert (z1 >= values.min() - 1e-9).all() and (z1 <= values.max() + 1e-9).all()
+
+@pytest.mark.parametrize('engine', QUICK_ENGINES)
+def test_engines_keep_constant_data_constant(engine):
+    x, y, values = plume(100)
+    z1, _ = krige_grid(x, y, np.full(100, 425.0), np.linspace(0, 1, 7), np.linspace(0, 1, 7), engine=engine)
+    assert np.allclose(z1, 425.0)
@@ -0,0 +1,69 @@
+import numpy as np
+import pytest
+
+from dragonfly import kriging
+from dragonfly.gridmask import survey_mask
+from dragonfly.kriging import FIT_SAMPLES, IncrementalKriging, local_kriging, ordinary_kriging, tiled_kriging
+
+LINEAR = {'slope': 30.0, 'nugget': 1.0}
+
+def plume(count, seed=0):
+    """Readings of a smooth plume over the unit square with a little sensor noise."""
+    random = np.random.RandomState(seed)
+    x, y = random.rand(2, count)
+    values = 420 + 40 * np.exp(-((x - 0.5) ** 2 + (y - 0.4) ** 2) / 0.05) + random.randn(count)
+    return x, y, values
+
+def test_local_matches_ordinary_with_every_sample():
+    x, y, values = plume(200)
+    grid = np.linspace(0, 1, 15)
+    z_local, ss_local = local_kriging(x, y, values, grid, grid, 6, 'linear', LINEAR, neighbours=200)
+    z_global, ss_global = ordinary_kriging(x, y, values, grid, grid, 6, 'linear', LINEAR)
+    assert np.allclose(z_local, z_global, atol=1e-8)
+    assert np.allclose(ss_local, ss_global, atol=1e-8)
+
+def test_local_stays_near_ordinary_at_default_neighbours():
+    x, y, values = plume(1500)
+    grid = np.linspace(0, 1, 25)
+    z_local, _ = local_kriging(x, y, values, grid, grid, 6, 'linear', LINEAR)
+    z_global, _ = ordinary_kriging(x, y, values, grid, grid, 6, 'linear', LINEAR)
+    inside = survey_mask(x, y, grid, grid, 'convex')
+    assert np.abs(z_local - z_global)[inside].max() < 0.02 * np.ptp(values)
+
+@pytest.mark.parametrize('workers', [1, 2])
+@pytest.mark.parametrize('engine, krige', [('ordinary', ordinary_kriging), ('local', local_kriging)])
+def test_tiles_match_the_untiled_engine(monkeypatch, workers, engine, krige):
+    x, y, values = plume(300)
+    grid = np.linspace(0, 1, 20)
+    mask = survey_mask(x, y, grid, grid, 'convex')
+    # Three grid rows per local tile, one per ordinary tile
+    monkeypatch.setattr(kriging, 'TILE_BYTES', 24 * 33 * 20 * 3)
+    z_tiled, ss_tiled = tiled_kriging(x, y, values, grid, grid, 6, 'linear', LINEAR, engine, workers, mask)
+    z1, ss1 = krige(x, y, values, grid, grid, 6, 'linear', LINEAR, mask)
+    assert np.array_equal(np.isnan(z_tiled), ~mask)
+    assert np.allclose(z_tiled, z1, atol=1e-6, equal_nan=True)
+    assert np.allclose(ss_tiled, ss1, atol=1e-6, equal_nan=True)
+
+def stream(incremental, x, y, values, size):
+    for start in range(0, len(values), size):
+        incremental.append(x[start:start + size], y[start:start + size], values[start:start + size])
+    return incremental
+
+def test_incremental_matches_local_in_small_batches():
+    x, y, values = plume(1500)
+    grid = np.linspace(0, 1, 25)
+    incremental = stream(IncrementalKriging(grid, grid, 6, 'linear', LINEAR), x, y, values, 137)
+    z_local, ss_local = local_kriging(x, y, values, grid, grid, 6, 'linear', LINEAR)
+    assert np.allclose(incremental.z1, z_local, atol=1e-8)
+    assert np.allclose(incremental.ss1, ss_local, atol=1e-8)
+
+def test_incremental_fit_matches_local_with_its_variogram():
+    x, y, values = plume(FIT_SAMPLES + 500)
+    grid = np.linspace(0, 1, 25)
+    incremental = stream(IncrementalKriging(grid, grid), x, y, values, 137)
+    assert not incremental.fitting
+    assert incremental.variogram.parameters[-1] > 0
+    z_local, _ = local_kriging(x, y, values, grid, grid, variogram_parameters=incremental.variogram)
+    assert np.allclose(incremental.z1, z_local, atol=1e-8)
+    assert np.nanmin(incremental.z1) > values.min() - np.ptp(values)
+    assert np.nanmax(incremental.z1) < values.max() + np.ptp(values)
@@ -0,0 +1,46 @@
+import os
+
+import numpy as np
+import pytest
+
+from conftest import ROOT
+from dragonfly import logscan
+from dragonfly.logscan import ENTRY_TYPES, merge_ranges, scan_log, scan_range, split_ranges
+from dragonfly.logtocsv import parse_log
+from dragonfly.reading import to_datetime
+
+# Zeroing, malformed and unknown lines as well as readings
+SAMPLE = os.path.join(ROOT, 'data', 'ddsa1.log')
+
+def assert_same_entries(entries, columns):
+    assert len(entries) == len(columns['type'])
+    for row, entry in enumerate(entries):
+        assert ENTRY_TYPES[columns['type'][row]] == entry.type
+        assert columns['line'][row] == entry.line
+        assert to_datetime(columns['time'][row]) == entry.date
+        if entry.type == 'reading':
+            reading = entry.data
+            assert [columns[name][row] for name in ['co2', 'lat', 'lon', 'alt']] == [reading.value, reading.lat, reading.lon, reading.alt]
+        else:
+            assert np.isnan(columns['co2'][row])
+
+@pytest.mark.parametrize('skip_zeroing', [False, True])
+def test_columnar_parse_matches_line_parse(skip_zeroing):
+    assert_same_entries(parse_log(SAMPLE, skip_zeroing), parse_log(SAMPLE, skip_zeroing, columnar=True))
+
+def assert_same_columns(columns, expected):
+    assert sorted(columns) == sorted(expected)
+    for name in expected:
+        np.testing.assert_array_equal(columns[name], expected[name])
+
+@pytest.mark.parametrize('skip_zeroing', [False, True])
+@pytest.mark.parametrize('count', [2, 3, 7, 50])
+def test_ranges_merge_into_the_serial_scan(skip_zeroing, count):
+    ranges = split_ranges(SAMPLE, count)
+    assert len(ranges) == count
+    results = [scan_range(SAMPLE, start, end) for start, end in ranges]
+    assert_same_columns(merge_ranges(results, skip_zeroing), scan_log(SAMPLE, skip_zeroing))
+
+def test_parallel_scan_matches_serial_scan(monkeypatch):
+    monkeypatch.setattr(logscan, 'MIN_CHUNK_SIZE', 1 << 12)
+    assert_same_columns(scan_log(SAMPLE, True, workers=3), scan_log(SAMPLE, True, workers=1))
@@ -0,0 +1,20 @@
+import os
+
+import numpy as np
+import pytest
+
+from dragonfly.parsecache import ParseCache
+
+def test_cache_hit_skips_the_parse(tmp_path):
+    cache = ParseCache(str(tmp_path), 1 << 20)
+    assert cache.load_key('key', lambda: {'a': np.arange(3)})['a'].tolist() == [0, 1, 2]
+    assert cache.load_key('key', lambda: pytest.fail('parsed again'))['a'].tolist() == [0, 1, 2]
+
+def test_unwritable_cache_still_returns_the_parse(tmp_path):
+    # A file where the cache directory should be makes makedirs fail
+    blocked = tmp_path / 'blocked'
+    blocked.write_text('')
+    cache = ParseCache(os.path.join(str(blocked), 'cache'), 1 << 20)
+    with pytest.warns(UserWarning, match='Could not cache'):
+        columns = cache.load_key('key', lambda: {'a': np.arange(3)})
+    assert columns['a'].tolist() == [0, 1, 2]
@@ -0,0 +1,194 @@
+import math
+
+import numpy as np
+import pytest
+from scipy.optimize import linprog
+
+import ddsa
+import ddsapath
+import lawnmower
+import waypointUtil
+from planning import Point, Span, inside_polygon
+from scanline import row_intervals
+
+# The planners as they were before the numpy rewrite, with the GLPK programs solved by linprog
+
+def calculateRange(type, start, end, length):
+    if type == Span.WALK:
+        waypoints = []
+        deltax = end.x - start.x
+        deltay = end.y - start.y
+        deltaz = end.z - start.z
+        distance = math.sqrt((deltax * deltax) + (deltay * deltay) + (deltaz * deltaz))
+        for i in range(1, int(distance / length) + 1):
+            waypoints.append(Point(start.x + (i * length * deltax / distance),
+                                   start.y + (i * length * deltay / distance),
+                                   start.z + (i * length * deltaz / distance)))
+        return waypoints
+    elif type == Span.RANGE:
+        return [end]
+
+def stacked(layer, stacks):
+    waypoints = []
+    for stack in range(stacks):
+        waypoints = waypoints + (layer(stack)[::-1] if stack % 2 else layer(stack))
+    return waypoints
+
+def closedDDSAWaypoints(rangeType, altitude, size, index, loops, radius, stepLength):
+    """ddsa.buildDDSAWaypoints."""
+    waypoints = []
+    start = Point(-index, 0, altitude)
+    waypoints.append(start)
+    previous = start
+    for loop in range(loops):
+        for corner in range(4):
+            xoffset = loop * size + index + 1
+            yoffset = xoffset
+            if corner == 0:
+                xoffset = -size * loop - index
+            if corner == 2 or corner == 3:
+                yoffset = -yoffset
+            if corner == 3:
+                xoffset = -xoffset - (size - 1)
+                if loop == loops - 1:
+                    xoffset += index + 1
+            next = Point(xoffset, yoffset, altitude)
+            for waypoint in calculateRange(rangeType, previous, next, stepLength):
+                waypoints.append(Point(waypoint.x * radius, waypoint.y * radius, waypoint.z))
+            previous = next
+    return waypoints
+
+def openDDSAWaypoints(rangeType, altitude, size, index, loops, radius, stepLength):
+    """waypointUtil.buildDDSAWaypoints."""
+    waypoints = []
+    start = Point(0, 0, altitude)
+    waypoints.append(start)
+    previous = start
+    for loop in range(0, loops):
+        for corner in range(0, 4):
+            if (loop == 0 and corner == 0):
+                next = Point(0, index + 1, altitude)
+            else:
+                xoffset = 1 + index + (loop * size)
+                yoffset = xoffset
+                if (corner == 0):
+                    xoffset = -(1 + index + ((loop - 1) * size))
+                elif (corner == 3):
+                    xoffset = -xoffset
+                if (corner == 2 or corner == 3):
+                    yoffset = -yoffset
+                next = Point(xoffset, yoffset, altitude)
+            for waypoint in calculateRange(rangeType, previous, next, stepLength):
+                waypoints.append(Point(waypoint.x * radius, waypoint.y * radius, waypoint.z))
+            previous = next
+    return waypoints
+
+def linearRange(points, objective, setY=None):
+    """The extreme of objective . (x, y) inside the counterclockwise polygon points, on the line y = setY if given."""
+    rows = []
+    limits = []
+    for index in range(len(points)):
+        first, second = points[index - 1], points[index]
+        a = -(second[1] - first[1])
+        b = second[0] - first[0]
+        rows.append([-a, -b])
+        limits.append(-((a * first[0]) + (b * first[1])))
+    fixed = {} if setY is None else {'A_eq': [[0, 1]], 'b_eq': [setY]}
+    result = linprog(objective, A_ub=rows, b_ub=limits, bounds=[(None, None)] * 2, **fixed)
+    assert result.status == 0
+    return result.x
+
+def oldLawnmowerWaypoints(rangeType, altitude, boundary, stepLength):
+    """lawnmower.buildLawnmowerWaypoints as plain Points.
+
+    Rows are stepped in floats and return rows kept below the top, as the
+    planner does now; for whole meter steps inside the boundary that is what
+    the integer range gave.
+    """
+    boundary_meters = [lawnmower.buildRelativeWaypoint(waypoint, altitude) for waypoint in boundary]
+    waypoints = []
+    miny = linearRange(boundary_meters, [0, 1])[1]
+    maxy = linearRange(boundary_meters, [0, -1])[1]
+    for y in np.arange(math.ceil(miny), math.floor(maxy), 2 * stepLength):
+        back = min(y + stepLength, maxy)
+        minx = linearRange(boundary_meters, [1, 0], y)[0]
+        maxx = linearRange(boundary_meters, [-1, 0], y)[0]
+        waypoints.append(Point(minx, y, altitude))
+        waypoints.extend(calculateRange(rangeType, Point(minx, y, altitude), Point(maxx, y, altitude), stepLength))
+        minx = linearRange(boundary_meters, [1, 0], back)[0]
+        maxx = linearRange(boundary_meters, [-1, 0], back)[0]
+        waypoints.append(Point(maxx, back, altitude))
+        waypoints.extend(calculateRange(rangeType, Point(maxx, back, altitude), Point(minx, back, altitude), stepLength))
+    return waypoints
+
+def assert_same_waypoints(waypoints, expected):
+    assert len(waypoints) == len(expected)
+    assert np.allclose(np.array(waypoints, dtype=np.float64), np.array(expected, dtype=np.float64), rtol=0, atol=1e-9)
+
+RANGES = [(Span.RANGE, 1), (Span.WALK, 1), (Span.WALK, 0.7)]
+
+@pytest.mark.parametrize('rangeType, stepLength', RANGES)
+@pytest.mark.parametrize('index', [0, 1, 2])
+@pytest.mark.parametrize('size', [1, 3])
+def test_ddsa_waypoints_match_the_old_loops(rangeType, stepLength, index, size):
+    expected = stacked(lambda stack: closedDDSAWaypoints(rangeType, stack, size, index, 3, 1, stepLength), 3)
+    waypoints = ddsa.build3DDDSAWaypoints(rangeType, 3, size, index, 3, 1, stepLength)
+    assert all(isinstance(waypoint, Point) for waypoint in waypoints)
+    assert_same_waypoints(waypoints, expected)
+    assert_same_waypoints(list(ddsapath.iter_3d_ddsa_waypoints(index, 3, size, 1, stepLength if rangeType == Span.WALK else None, 3)), expected)
+
+@pytest.mark.parametrize('rangeType, stepLength', RANGES)
+@pytest.mark.parametrize('index', [0, 1, 2])
+@pytest.mark.parametrize('size', [1, 3])
+def test_waypoint_util_ddsa_matches_the_old_loops(rangeType, stepLength, index, size):
+    expected = stacked(lambda stack: openDDSAWaypoints(rangeType, stack, size, index, 3, 1, stepLength), 3)
+    assert_same_waypoints(waypointUtil.build3DDDSAWaypoints(rangeType, 3, size, index, 3, 1, stepLength), expected)
+    assert_same_waypoints(list(waypointUtil.iter3DDDSAWaypoints(rangeType, 3, size, index, 3, 1, stepLength)), expected)
+    assert_same_waypoints(waypointUtil.buildDDSAWaypoints(rangeType, 2, size, index, 3, 1, stepLength), openDDSAWaypoints(rangeType, 2, size, index, 3, 1, stepLength))
+
+BOUNDARIES = [
+    [[5, 0], [-5, -5], [-5, -10], [0, -12], [5, -10]],
+    [[0, 0], [8, 1.5], [9.5, 7], [4, 11.3], [-1.2, 6]]
+]
+
+@pytest.mark.parametrize('rangeType, stepLength', [(Span.RANGE, 1), (Span.WALK, 1), (Span.RANGE, 0.5), (Span.WALK, 0.25)])
+@pytest.mark.parametrize('corners', BOUNDARIES)
+def test_lawnmower_waypoints_match_the_linear_programs(rangeType, stepLength, corners):
+    boundary = lawnmower.latlons(corners)
+    expected = stacked(lambda stack: oldLawnmowerWaypoints(rangeType, stack, boundary, stepLength), 3)
+    poses = lawnmower.build3DLawnmowerWaypoints(rangeType, 3, boundary, stepLength)
+    assert_same_waypoints([pose.pose.position for pose in poses], expected)
+    assert_same_waypoints(list(lawnmower.iter3DLawnmowerWaypoints(rangeType, 3, boundary, stepLength)), expected)
+
+# A U open at the top between x 3 and 7, and a V notch down to (5, 4)
+U_SHAPE = [[0, 0], [10, 0], [10, 10], [7, 10], [7, 3], [3, 3], [3, 10], [0, 10]]
+V_NOTCH = [[0, 0], [10, 0], [10, 10], [5, 4], [0, 10]]
+
+def test_rows_split_around_a_concave_notch():
+    assert row_intervals(U_SHAPE, [1, 5, 10, 11]) == [[(0, 10)], [(0, 3), (7, 10)], [(0, 3), (7, 10)], []]
+    assert row_intervals(V_NOTCH, [4, 7, 10]) == [[(0, 10)], [(0, 2.5), (7.5, 10)], [(0, 0), (10, 10)]]
+
+def on_boundary(polygon, x, y):
+    for (x1, y1), (x2, y2) in zip(polygon, polygon[1:] + polygon[:1]):
+        length = math.hypot(x2 - x1, y2 - y1)
+        if abs((x2 - x1) * (y - y1) - (y2 - y1) * (x - x1)) <= 1e-9 * length and \
+                min(x1, x2) - 1e-9 <= x <= max(x1, x2) + 1e-9 and min(y1, y2) - 1e-9 <= y <= max(y1, y2) + 1e-9:
+            return True
+    return False
+
+def covered(polygon, x, y):
+    return inside_polygon(polygon, x, y) or on_boundary(polygon, x, y)
+
+# Both steps end with a return row clamped to the top, along the edges either side of the opening
+@pytest.mark.parametrize('rangeType, stepLength', [(Span.RANGE, 1.5), (Span.WALK, 0.4)])
+@pytest.mark.parametrize('corners', [U_SHAPE, V_NOTCH])
+def test_lawnmower_stays_inside_concave_boundaries(rangeType, stepLength, corners):
+    polygon = [tuple(corner) for corner in corners]
+    legs = lawnmower.lawnmowerLegs(lawnmower.latlons(corners), stepLength)
+    assert len([y for start, end, y in legs if y == 10]) == 2
+    for start, end, y in legs:
+        for fraction in np.linspace(0, 1, 21):
+            assert covered(polygon, start + fraction * (end - start), y)
+    waypoints = list(lawnmower.iterLawnmowerWaypoints(rangeType, 0, lawnmower.latlons(corners), stepLength))
+    assert waypoints
+    assert all(covered(polygon, point.x, point.y) for point in waypoints)
@@ -0,0 +1,206 @@
+#!/usr/bin/env python
+
+import argparse, mmap, os
+import numpy as np
+
+from .logscan import ERROR, LOG, NO_TIME, READING, apply_zeroing, scan_block
+from .parsecache import cached
+from .rotatedlog import rotated_chunks, rotated_files
+
+EVENT_COLUMNS = ['name', 'time', 'line', 'offset', 'row']
+
+def event_name(line):
+    """Returns the message of a LOG: line, with or without a timestamp, or None for other lines."""
+    text = line.decode('utf-8', 'replace').strip()
+    lineparts = text.split()
+    if lineparts[:1] == ['LOG:']:
+        message = text[4:].strip()
+    elif len(lineparts) > 2 and lineparts[2] == 'LOG:':
+        message = text[text.index('LOG:') + 4:].strip()
+    else:
+        return None
+    if message.startswith('data:'):
+        message = message[5:].strip()
+    return message.strip('"')
+
+def find_events(data, columns):
+    """Builds the event columns of the LOG: lines among the scanned rows of data."""
+    rows = np.flatnonzero((columns['type'] == LOG) | (columns['type'] == ERROR))
+    names = []
+    found = []
+    for row in rows:
+        start = columns['offset'][row]
+        end = data.find(b'\n', start)
+        name = event_name(data[start:end if end >= 0 else len(data)])
+        if name is not None:
+            names.append(name)
+            found.append(row)
+    found = np.array(found, dtype=np.int64)
+
+    # LOG: lines mostly carry no timestamp, they take the time of the closest earlier timed row
+    times = columns['time']
+    timed = np.where(times != NO_TIME, np.arange(len(times)), -1)
+    previous = np.maximum.accumulate(timed) if len(timed) else timed
+    following = np.minimum.accumulate(np.where(timed >= 0, timed, len(times))[::-1])[::-1] if len(timed) else timed
+    event_times = np.full(len(found), NO_TIME, dtype=np.int64)
+    if len(found):
+        before = previous[found]
+        after = following[found]
+        event_times[before >= 0] = times[before[before >= 0]]
+        use_after = (before < 0) & (after < len(times))
+        event_times[use_after] = times[after[use_after]]
+
+    return {
+        'name': np.array(names, dtype=str),
+        'time': event_times,
+        'line': columns['line'][found],
+        'offset': columns['offset'][found],
+        'row': found
+    }
+
+def read_commands(path):
+    """Reads command.log as name, line and offset columns, it has no timestamps to place them in the log."""
+    names = []
+    offsets = []
+    if os.path.exists(path):
+        with open(path, 'rb') as inputFile:
+            offset = 0
+            for line in inputFile:
+                if line.strip():
+                    names.append(line.decode('utf-8', 'replace').strip())
+                    offsets.append(offset)
+                offset += len(line)
+    return {
+        'name': np.array(names, dtype=str),
+        'line': np.arange(len(names), dtype=np.int64),
+        'offset': np.array(offsets, dtype=np.int64)
+    }
+
+class Timeline:
+    """Event index over the scanned columns of a Dragonfly log.
+
+    events holds the LOG: lines (Takeoff, Zeroing, DDSA at ...) in log order
+    with their time, line, byte offset and the row of the columns they sit
+    at, so a mission can be cut out of the columns by event name or by time
+    with binary searches instead of a new pass over the log.
+    """
+
+    def __init__(self, columns, events, commands, paths, file_starts):
+        self.columns = columns
+        self.events = events
+        self.commands = commands
+        self.paths = paths
+        self.file_starts = np.array(file_starts, dtype=np.int64)
+
+        timed = np.flatnonzero(columns['time'] != NO_TIME)
+        self.by_time = timed[np.argsort(columns['time'][timed], kind='stable')]
+        self.sorted_times = columns['time'][self.by_time]
+
+    def find(self, name):
+        """Indices of the events whose message starts with name."""
+        if not len(self.events['name']):
+            return np.zeros(0, dtype=np.int64)
+        return np.flatnonzero(np.char.startswith(self.events['name'], name))
+
+    def event_window(self, start, end=None, occurrence=0):
+        """Rows from the given occurrence of the start event up to the next end event.
+
+        Without an end event, or when none follows, the window runs to the end
+        of the log. Returns None when there is no such start event.
+        """
+        starts = self.find(start)
+        if occurrence >= len(starts):
+            return None
+        first = starts[occurrence]
+        last_row = len(self.columns['time'])
+        if end is not None:
+            ends = self.find(end)
+            following = np.searchsorted(ends, first, 'right')
+            if following < len(ends):
+                last_row = self.events['row'][ends[following]]
+        return np.arange(self.events['row'][first], last_row)
+
+    def time_window(self, start, end):
+        """Rows timed in [start, end), as epoch ns or anything np.datetime64 accepts."""
+        start = to_ns(start)
+        end = to_ns(end)
+        low = np.searchsorted(self.sorted_times, start, 'left')
+        high = np.searchsorted(self.sorted_times, end, 'left')
+        return np.sort(self.by_time[low:high])
+
+    def readings(self, rows):
+        """The reading columns among the given rows."""
+        rows = rows[self.columns['type'][rows] == READING]
+        return dict((name, values[rows]) for name, values in self.columns.items())
+
+    def location(self, offset):
+        """Maps a byte offset of the joined log to its file and offset in that file."""
+        index = np.searchsorted(self.file_starts, offset, 'right') - 1
+        return self.paths[index], int(offset - self.file_starts[index])
+
+def to_ns(time):
+    if isinstance(time, (int, np.integer)):
+        return int(time)
+    return int(np.datetime64(time, 'ns').astype(np.int64))
+
+def scan_timeline(input, skip_zeroing):
+    """Scans a log and its events into one flat dict of columns, events are kept as event_*."""
+    with open(input, 'rb') as inputFile:
+        if os.path.getsize(input) == 0:
+            data = b''
+        else:
+            data = mmap.mmap(inputFile.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        columns, toggles, line_count = scan_block(np.frombuffer(data, dtype=np.uint8))
+        apply_zeroing(columns, toggles, skip_zeroing)
+        columns['line'] -= 1
+        events = find_events(data, columns)
+    finally:
+        if isinstance(data, mmap.mmap):
+            data.close()
+    for name in EVENT_COLUMNS:
+        columns['event_' + name] = events[name]
+    return columns
+
+def split_events(columns):
+    events = dict((name, columns.pop('event_' + name)) for name in EVENT_COLUMNS)
+    return columns, events
+
+def build_timeline(input, skip_zeroing=False):
+    """Timeline of a single log, cached next to the parsed logs.
+
+    Line numbers follow parse_log, which skips the first line of the file.
+    """
+    columns = dict(cached('timeline', input, {'skip_zeroing': skip_zeroing}, lambda: scan_timeline(input, skip_zeroing)))
+    columns, events = split_events(columns)
+    commands = read_commands(os.path.join(os.path.dirname(input), 'command.log'))
+    return Timeline(columns, events, commands, [input], [0])
+
+def build_rotated_timeline(directory, skip_zeroing=False, name='run.log'):
+    """Timeline of a rotated log set, offsets count from the start of the oldest file."""
+    paths = rotated_files(directory, name)
+    chunks = rotated_chunks(paths, name)
+    data = b''.join(chunks)
+    columns, toggles, line_count = scan_block(np.frombuffer(data, dtype=np.uint8), False)
+    apply_zeroing(columns, toggles, skip_zeroing)
+    events = find_events(data, columns)
+    commands = read_commands(os.path.join(directory, 'command.log'))
+    file_starts = np.cumsum([0] + [len(chunk) for chunk in chunks[:-1]])
+    return Timeline(columns, events, commands, paths, file_starts)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = 'List the events of a Dragonfly log')
+    parser.add_argument('--input', type=str, help='Input Dragonfly log.', default=None)
+    parser.add_argument('--directory', type=str, help='Directory of a rotated run.log set, instead of --input.', default=None)
+    parser.add_argument('--skip-zeroing', action='store_true', help='Mark readings taken while zeroing.')
+    args = parser.parse_args()
+
+    if args.directory is not None:
+        timeline = build_rotated_timeline(args.directory, args.skip_zeroing)
+    else:
+        timeline = build_timeline(args.input, args.skip_zeroing)
+
+    for name, time, line, offset in zip(timeline.events['name'], timeline.events['time'], timeline.events['line'], timeline.events['offset']):
+        path, file_offset = timeline.location(offset)
+        stamp = np.datetime64(int(time), 'ns') if time != NO_TIME else '-'
+        print("{} line {} ({} byte {}) {}".format(stamp, line, os.path.basename(path), file_offset, name))
@@ -0,0 +1,214 @@
+#!/usr/bin/env python
+
+import argparse, json
+import numpy as np
+import pandas as pd
+from pykrige import variogram_models
+from scipy.optimize import least_squares
+from scipy.spatial import ConvexHull, cKDTree
+from scipy.spatial.distance import pdist
+
+try:
+    from .parsecache import cached_grid
+except (ImportError, ValueError):
+    from parsecache import cached_grid
+
+# Model functions and the names of their parameters, in pykrige's order
+MODELS = {
+    'linear': (variogram_models.linear_variogram_model, ['slope', 'nugget']),
+    'power': (variogram_models.power_variogram_model, ['scale', 'exponent', 'nugget']),
+    'gaussian': (variogram_models.gaussian_variogram_model, ['psill', 'range', 'nugget']),
+    'spherical': (variogram_models.spherical_variogram_model, ['psill', 'range', 'nugget']),
+    'exponential': (variogram_models.exponential_variogram_model, ['psill', 'range', 'nugget']),
+    'hole-effect': (variogram_models.hole_effect_variogram_model, ['psill', 'range', 'nugget'])
+}
+# Lag bins the empirical variogram is kept in, merged into nlags bins when fitting
+FINE_LAGS = 240
+# Largest number of sample pairs binned, larger sets are estimated from a subset of the samples
+MAX_PAIRS = 2000000
+# Smallest nugget floor_nugget leaves, as a fraction of the variance of the samples
+NUGGET_FLOOR = 0.01
+
+class Variogram:
+    """A variogram model with its parameters in pykrige's order, callable on distances."""
+
+    def __init__(self, model, parameters):
+        if model not in MODELS:
+            raise ValueError("Unknown variogram model {}, expected one of {}".format(model, ", ".join(sorted(MODELS))))
+        self.model = model
+        self.parameters = [float(parameter) for parameter in parameters]
+
+    def __call__(self, distance):
+        return MODELS[self.model][0](self.parameters, np.asarray(distance, dtype=np.float64))
+
+    def __repr__(self):
+        return "Variogram({}, {})".format(self.model, self.pykrige_parameters())
+
+    def pykrige_parameters(self):
+        """The parameters as a dict OrdinaryKriging accepts for variogram_parameters."""
+        return dict(zip(MODELS[self.model][1], self.parameters))
+
+    def to_dict(self):
+        return {'model': self.model, 'parameters': self.parameters}
+
+    @classmethod
+    def from_dict(cls, values):
+        return cls(values['model'], values['parameters'])
+
+    @classmethod
+    def from_parameters(cls, model, parameters):
+        """Converts variogram_parameters as OrdinaryKriging takes them, where sill is the full sill."""
+        if model not in MODELS:
+            raise ValueError("Unknown variogram model {}, expected one of {}".format(model, ", ".join(sorted(MODELS))))
+        names = MODELS[model][1]
+        if isinstance(parameters, dict):
+            parameters = dict(parameters)
+            if 'psill' in names and 'psill' not in parameters:
+                parameters['psill'] = parameters['sill'] - parameters['nugget']
+            return cls(model, [parameters[name] for name in names])
+        parameters = list(parameters)
+        if 'psill' in names:
+            parameters[0] = parameters[0] - parameters[2]
+        return cls(model, parameters)
+
+def diameter(points):
+    """Longest distance between two of points, found among the convex hull vertices."""
+    if len(points) < 2:
+        return 0.0
+    try:
+        points = points[ConvexHull(points).vertices]
+    except (RuntimeError, ValueError):
+        # QhullError, fewer than three points or all of them on a line
+        points = points[[np.argmin(points[:, 0]), np.argmax(points[:, 0]), np.argmin(points[:, 1]), np.argmax(points[:, 1])]]
+    return float(pdist(points).max())
+
+def pair_indices(points, max_lag):
+    """Both ends of the sample pairs within max_lag, or of a random subset of the samples when there are too many."""
+    count = len(points)
+    if count * (count - 1) // 2 <= MAX_PAIRS:
+        return np.triu_indices(count, 1)
+    tree = cKDTree(points)
+    within = (tree.count_neighbors(tree, max_lag) - count) // 2
+    subset = np.arange(count)
+    if within > MAX_PAIRS:
+        # Keeping a fraction f of the samples keeps about f squared of the pairs
+        keep = int(count * np.sqrt(MAX_PAIRS / float(within)))
+        subset = np.sort(np.random.RandomState(0).choice(count, keep, replace=False))
+        tree = cKDTree(points[subset])
+    pairs = tree.query_pairs(max_lag, output_type='ndarray')
+    return subset[pairs[:, 0]], subset[pairs[:, 1]]
+
+def empirical_variogram(x, y, values, max_lag=None):
+    """Semivariance of sample pairs binned into FINE_LAGS lags up to max_lag.
+
+    max_lag defaults to the longest pair distance, which takes every pair
+    like pykrige does. Pairs are found through a KD-tree and subsampled
+    past MAX_PAIRS. The bins keep the count, distance sum and semivariance
+    sum of their pairs, so any coarser binning can be derived from them,
+    and are cached by the content of the samples.
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    values = np.asarray(values, dtype=np.float64)
+    if max_lag is None:
+        max_lag = diameter(np.column_stack((x, y)))
+
+    def compute():
+        first, second = pair_indices(np.column_stack((x, y)), max_lag)
+        distance = np.hypot(x[first] - x[second], y[first] - y[second])
+        semivariance = 0.5 * (values[first] - values[second]) ** 2
+        inside = distance <= max_lag
+        lag = np.minimum((distance[inside] / max(max_lag, 1e-300) * FINE_LAGS).astype(np.int64), FINE_LAGS - 1)
+        return {
+            'count': np.bincount(lag, minlength=FINE_LAGS),
+            'distance': np.bincount(lag, distance[inside], FINE_LAGS),
+            'semivariance': np.bincount(lag, semivariance[inside], FINE_LAGS),
+            'max_lag': np.array(max_lag)
+        }
+
+    return cached_grid('empirical_variogram', [x, y, values], {'max_lag': max_lag, 'fine_lags': FINE_LAGS, 'max_pairs': MAX_PAIRS}, compute)
+
+def binned_variogram(empirical, nlags=6):
+    """Mean lag and semivariance of the non empty bins after merging the fine bins into nlags."""
+    group = np.arange(FINE_LAGS) * nlags // FINE_LAGS
+    count = np.bincount(group, empirical['count'], nlags)
+    filled = count > 0
+    lags = np.bincount(group, empirical['distance'], nlags)[filled] / count[filled]
+    semivariance = np.bincount(group, empirical['semivariance'], nlags)[filled] / count[filled]
+    return lags, semivariance
+
+def fit(empirical, model='linear', nlags=6):
+    """Fits model to the binned empirical variogram with pykrige's starting point, bounds and soft L1 loss."""
+    if model not in MODELS:
+        raise ValueError("Unknown variogram model {}, expected one of {}".format(model, ", ".join(sorted(MODELS))))
+    lags, semivariance = binned_variogram(empirical, nlags)
+    function = MODELS[model][0]
+    if len(lags) < 2:
+        # Too few pairs to fit, a flat variogram at the observed semivariance
+        nugget = float(semivariance[0]) if len(semivariance) else 0.0
+        return Variogram(model, [0.0, nugget] if model == 'linear' else [0.0, 1.0, nugget])
+
+    spread = np.amax(semivariance) - np.amin(semivariance)
+    if model == 'linear':
+        x0 = [spread / (np.amax(lags) - np.amin(lags)), np.amin(semivariance)]
+        bounds = ([0.0, 0.0], [np.inf, np.amax(semivariance)])
+    elif model == 'power':
+        x0 = [spread / (np.amax(lags) - np.amin(lags)), 1.1, np.amin(semivariance)]
+        bounds = ([0.0, 0.001, 0.0], [np.inf, 1.999, np.amax(semivariance)])
+    else:
+        x0 = [spread, 0.25 * np.amax(lags), np.amin(semivariance)]
+        bounds = ([0.0, 0.0, 0.0], [10.0 * np.amax(semivariance), np.amax(lags), np.amax(semivariance)])
+    # Constant data collapses the bounds, which least_squares needs apart
+    upper = np.maximum(bounds[1], np.array(bounds[0]) + 1e-9)
+
+    def residuals(parameters):
+        return function(parameters, lags) - semivariance
+
+    result = least_squares(residuals, np.clip(x0, bounds[0], upper - 1e-10), bounds=(bounds[0], upper), loss='soft_l1')
+    return Variogram(model, result.x)
+
+def fit_variogram(x, y, values, model='linear', nlags=6, max_lag=None):
+    """Fitted Variogram of samples, from their cached empirical variogram."""
+    return fit(empirical_variogram(x, y, values, max_lag), model, nlags)
+
+def floor_nugget(variogram, values, floor=NUGGET_FLOOR):
+    """variogram with its nugget raised to at least floor times the variance of values.
+
+    A fit to few readings can put the nugget at zero, which leaves the small
+    kriging systems of nearby readings close to singular.
+    """
+    parameters = list(variogram.parameters)
+    parameters[-1] = max(parameters[-1], floor * float(np.var(values)))
+    return Variogram(variogram.model, parameters)
+
+def load_site_variograms(path):
+    """Variograms fitted earlier, by site name."""
+    try:
+        with open(path, 'r') as inputFile:
+            sites = json.load(inputFile)
+    except (IOError, OSError, ValueError):
+        return {}
+    return dict((site, Variogram.from_dict(values)) for site, values in sites.items())
+
+def save_site_variogram(path, site, variogram):
+    """Stores a fitted variogram under site so other flights there can krige with it."""
+    sites = load_site_variograms(path)
+    sites[site] = variogram
+    with open(path, 'w') as outputFile:
+        json.dump(dict((name, value.to_dict()) for name, value in sites.items()), outputFile, indent=2, sort_keys=True)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = 'Fit a variogram to a Dragonfly CSV')
+    parser.add_argument('--input', type=str, help='Input Dragonfly csv.')
+    parser.add_argument('--model', type=str, help='Variogram model.', default='linear', choices=sorted(MODELS))
+    parser.add_argument('--nlags', type=int, help='Number of lag bins to fit.', default=6)
+    parser.add_argument('--max-lag', type=float, help='Longest pair distance in degrees, all pairs by default.', default=None)
+    parser.add_argument('--site', type=str, help='Save the fit under this site name.', default=None)
+    parser.add_argument('--sites', type=str, help='JSON file of fitted variograms by site.', default='variograms.json')
+    args = parser.parse_args()
+
+    df = pd.read_csv(args.input, sep=r',\s*', engine='python')
+    variogram = fit_variogram(np.array(df['lon']), np.array(df['lat']), np.array(df['co2']), args.model, args.nlags, args.max_lag)
+    print(variogram)
+    if args.site is not None:
+        save_site_variogram(args.sites, args.site, variogram)